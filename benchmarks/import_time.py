@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of cold import time.
+
+Every import is done by new interpreter.
+
+Usage:
+
+    python benchmarks/import_time.py [module] [runs]
+"""
+
+import os
+import sys
+import subprocess
+
+
+ROOT_DIR = os.path.abspath(
+    os.path.join(
+        os.path.dirname(__file__),
+        '..',
+    ),
+)
+
+CODE = '''
+import time
+start = time.time()
+import {module}
+print(time.time() - start)
+'''
+
+
+def measure(module='noseapp_daemon', runs=10, python=sys.executable):
+    """
+    :return: sorted list of import times in seconds
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in (ROOT_DIR, env.get('PYTHONPATH')) if p
+    )
+
+    results = []
+
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [python, '-c', CODE.format(module=module)],
+            env=env,
+        )
+        results.append(float(output.strip()))
+
+    return sorted(results)
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else 'noseapp_daemon'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    results = measure(module=module, runs=runs)
+
+    print('{}: min {:.2f} ms, median {:.2f} ms, max {:.2f} ms ({} runs)'.format(
+        module,
+        results[0] * 1000,
+        results[len(results) // 2] * 1000,
+        results[-1] * 1000,
+        runs,
+    ))
+
+
+if __name__ == '__main__':
+    main()
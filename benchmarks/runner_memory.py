@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of memory overhead per DaemonRunner instance.
+
+Usage:
+
+    python benchmarks/runner_memory.py [fleet size]
+"""
+
+import os
+import sys
+import gc
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..',
+        ),
+    ),
+)
+
+import psutil
+
+from noseapp_daemon import utils
+from noseapp_daemon.runner import DaemonRunner
+
+
+DAEMON_BIN = utils.which('ls', default='/bin/ls')
+
+
+def rss():
+    gc.collect()
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def measure(size):
+    """
+    :return: bytes per runner
+    """
+    before = rss()
+
+    fleet = []
+
+    for i in range(size):
+        runner = DaemonRunner(
+            name='daemon_{}'.format(i),
+            daemon_bin=DAEMON_BIN,
+            pid_file='/tmp/daemon_{}.pid'.format(i),
+            stdout='/tmp/daemon_{}.log'.format(i),
+        )
+        runner.add_cmd_option('--port', 10000 + i)
+        runner.add_cmd_option('--verbose')
+        fleet.append(runner)
+
+    after = rss()
+
+    return (after - before) / float(size)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    # warm up of allocator and imports
+    measure(100)
+
+    print('{} runners: {:.0f} bytes per runner'.format(size, measure(size)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of daemon launch by popen (shell) and spawn launchers.
+Parent process carries big heap for making fork expensive.
+Both launchers fork the parent, spawn launcher only skips exec of /bin/sh,
+so the difference is the cost of shell startup, not of the fork.
+
+Usage:
+
+    python benchmarks/spawn.py [launches] [heap MB]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..',
+        ),
+    ),
+)
+
+from noseapp_daemon import utils
+from noseapp_daemon.runner import DaemonRunner
+from noseapp_daemon.runner import LAUNCHER_POPEN
+from noseapp_daemon.runner import LAUNCHER_SPAWN
+
+
+DAEMON_BIN = utils.which('sleep', default='/bin/sleep')
+
+
+def measure(launcher, launches):
+    """
+    :return: seconds per start
+    """
+    runners = [
+        DaemonRunner(
+            name='sleep_{}'.format(i),
+            daemon_bin=DAEMON_BIN,
+            launcher=launcher,
+        )
+        for i in range(launches)
+    ]
+
+    for runner in runners:
+        runner.add_cmd_option('60')
+
+    start = time.time()
+
+    for runner in runners:
+        runner.start()
+
+    elapsed = time.time() - start
+
+    utils.run_parallel(lambda r: r.stop(), runners)
+
+    return elapsed / launches
+
+
+def main():
+    launches = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    heap_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    heap = [bytearray(1024 * 1024) for _ in range(heap_mb)]
+
+    for launcher in (LAUNCHER_POPEN, LAUNCHER_SPAWN):
+        print('{}: {:.3f} ms per start ({} starts, {} MB heap)'.format(
+            launcher, measure(launcher, launches) * 1000, launches, len(heap),
+        ))
+
+
+if __name__ == '__main__':
+    main()
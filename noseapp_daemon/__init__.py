@@ -1,17 +1,61 @@
 # -*- coding: utf-8 -*-
 
-from noseapp.datastructures import ModifyDict as Options
+"""
+Package is imported lazily. Submodules, noseapp and psutil
+are loaded at first access to exported names.
+"""
 
-from noseapp_daemon.runner import DaemonPlugin
-from noseapp_daemon.runner import DaemonRunner
-from noseapp_daemon.service import DaemonService
-from noseapp_daemon.management import DaemonManagement
+import sys
+import types
+import importlib
+
+
+EXPORTS = {
+    'Options': ('noseapp.datastructures', 'ModifyDict'),
+    'DaemonPlugin': ('noseapp_daemon.runner', 'DaemonPlugin'),
+    'DaemonRunner': ('noseapp_daemon.runner', 'DaemonRunner'),
+    'DaemonService': ('noseapp_daemon.service', 'DaemonService'),
+    'DaemonManagement': ('noseapp_daemon.management', 'DaemonManagement'),
+}
 
 
 __all__ = (
-    Options,
-    DaemonPlugin,
-    DaemonRunner,
-    DaemonService,
-    DaemonManagement,
+    'Options',
+    'DaemonPlugin',
+    'DaemonRunner',
+    'DaemonService',
+    'DaemonManagement',
 )
+
+
+class LazyPackage(types.ModuleType):
+    """
+    Module object which resolves exported names at first access
+    """
+
+    def __getattr__(self, name):
+        try:
+            module_name, attr = EXPORTS[name]
+        except KeyError:
+            if name.startswith('__'):
+                raise AttributeError(name)
+            try:
+                return importlib.import_module('{}.{}'.format(self.__name__, name))
+            except ImportError:
+                raise AttributeError(name)
+
+        value = getattr(importlib.import_module(module_name), attr)
+        setattr(self, name, value)
+
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(EXPORTS))
+
+
+package = LazyPackage(__name__, __doc__)
+package.__dict__.update(sys.modules[__name__].__dict__)
+# original module must be alive, else globals will be cleared
+package.__dict__['_module'] = sys.modules[__name__]
+
+sys.modules[__name__] = package
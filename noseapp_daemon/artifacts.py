@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+Directories for artifacts of daemons: profiles, cores, etc.
+
+Artifacts are grouped by current test:
+    <root>/<test id>/<daemon name>-<kind>-<timestamp>
+
+Root is NOSEAPP_DAEMON_ARTIFACTS environment variable
+or noseapp_daemon/artifacts in temporary directory.
+
+Usage:
+    from noseapp_daemon import artifacts
+
+    with artifacts.test_scope('test_module.TestCase.test_method'):
+        ...
+
+    # test id is set by suite callbacks, management.install does it
+    artifacts.install_suite(suite)
+"""
+
+import os
+import time
+import logging
+import tempfile
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+ENV_ARTIFACTS_DIR = 'NOSEAPP_DAEMON_ARTIFACTS'
+ARTIFACTS_DIR = os.path.join(tempfile.gettempdir(), 'noseapp_daemon', 'artifacts')
+
+# directory of artifacts which were created out of test
+DEFAULT_TEST_ID = 'session'
+
+
+_test_id = None
+
+
+def root_dir():
+    return os.environ.get(ENV_ARTIFACTS_DIR) or ARTIFACTS_DIR
+
+
+def get_test_id():
+    return _test_id or DEFAULT_TEST_ID
+
+
+def set_test_id(test_id):
+    """
+    :param test_id: id of current test, None for reset
+    """
+    global _test_id
+    _test_id = test_id
+
+
+@contextmanager
+def test_scope(test_id):
+    previous = _test_id
+    set_test_id(test_id)
+    try:
+        yield
+    finally:
+        set_test_id(previous)
+
+
+def install_suite(suite):
+    """
+    Set id of current test before each test of suite
+
+    :type suite: noseapp.suite.Suite
+    """
+    suite.add_pre_run(lambda case: set_test_id(case.id()))
+    suite.add_post_run(lambda case: set_test_id(None))
+
+
+def make_dir(name, kind):
+    """
+    Create directory for artifacts of daemon in directory of current test
+
+    :param name: daemon name
+    :param kind: kind of artifacts, "profile" for example
+    """
+    test_dir = os.path.join(root_dir(), get_test_id().replace(os.sep, '_'))
+    base = path = os.path.join(test_dir, '{}-{}-{}'.format(name, kind, int(time.time() * 1000)))
+
+    suffix = 0
+    while os.path.exists(path):
+        suffix += 1
+        path = '{}.{}'.format(base, suffix)
+
+    os.makedirs(path)
+
+    return path
+
+
+def files_size(path):
+    """
+    Total size of files in directory
+    """
+    total = 0
+
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+
+    return total
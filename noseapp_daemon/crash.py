@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+Crash artifacts of daemons.
+
+Core file of crashed daemon is moved to crash directory of current
+test (see noseapp_daemon.artifacts), compressed by gzip in background
+thread and summarized by gdb backtrace if gdb is available.
+Total size of crash directories is limited by quota,
+least recently used directories are removed.
+
+Daemon must be started with core dumps enabled:
+    daemon.start(preexec_fn=utils.set_ulimit_c)
+
+Usage:
+    collector = CrashCollector(quota=2 * 1024 ** 3)
+    collector.attach(management.events)
+"""
+
+import os
+import re
+import glob
+import time
+import Queue
+import shutil
+import logging
+import threading
+import subprocess
+
+from noseapp_daemon import utils
+from noseapp_daemon import events
+from noseapp_daemon import artifacts
+
+
+logger = logging.getLogger(__name__)
+
+
+CORE_PATTERN_FILE = '/proc/sys/kernel/core_pattern'
+CORE_USES_PID_FILE = '/proc/sys/kernel/core_uses_pid'
+
+CRASH_KIND = 'crash'
+# summary of crash, it marks crash directory
+CRASH_INFO = 'crash.txt'
+
+# <daemon name>-crash-<timestamp>[.<suffix>], see artifacts.make_dir
+CRASH_DIR_RE = re.compile(r'^(?P<name>.+)-{}-\d+(\.\d+)?$'.format(CRASH_KIND))
+
+# bytes
+DEFAULT_QUOTA = 4 * 1024 ** 3
+CHUNK_SIZE = 1024 * 1024
+
+GDB_TIMEOUT = 60
+GDB_COMMANDS = ('bt', 'info registers', 'thread apply all bt')
+
+
+def read_sysctl(path, default=''):
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except IOError:
+        return default
+
+
+def core_globs(pid, working_dir):
+    """
+    Glob patterns of core file by kernel core_pattern.
+
+    :return: list of patterns, empty list if cores are piped to handler
+    """
+    pattern = read_sysctl(CORE_PATTERN_FILE, default='core')
+
+    if pattern.startswith('|'):
+        return []
+
+    uses_pid = read_sysctl(CORE_USES_PID_FILE, default='0') == '1'
+
+    if '%p' not in pattern and uses_pid:
+        pattern += '.%p'
+
+    directory = os.path.dirname(pattern) if os.path.isabs(pattern) else working_dir
+    name = os.path.basename(pattern)
+
+    globs = []
+
+    if pid:
+        exact = name.replace('%p', str(pid))
+        globs.append(os.path.join(directory, glob_specifiers(exact)))
+
+    globs.append(os.path.join(directory, glob_specifiers(name)))
+
+    return globs
+
+
+def glob_specifiers(name):
+    """
+    Replace specifiers of core_pattern by *
+    """
+    result = []
+    chars = iter(name)
+
+    for char in chars:
+        if char == '%':
+            next(chars, None)
+            result.append('*')
+        else:
+            result.append(char)
+
+    return ''.join(result)
+
+
+def locate_cores(pid, working_dir, since=0):
+    """
+    Find core files of crashed process
+
+    :param pid: pid of process
+    :param working_dir: working directory of process
+    :param since: cores older than this timestamp are ignored
+    """
+    for pattern in core_globs(pid, working_dir):
+        cores = []
+
+        for path in glob.glob(pattern):
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) >= since:
+                    cores.append(path)
+            except OSError:
+                continue
+
+        if cores:
+            return sorted(cores)
+
+    return []
+
+
+def is_elf(path):
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read(4) == b'\x7fELF'
+    except (IOError, OSError, TypeError):
+        return False
+
+
+def daemon_executable(daemon):
+    """
+    Executable file which was crashed, it is required by gdb
+    """
+    if is_elf(daemon.daemon_bin):
+        return daemon.daemon_bin
+
+    if daemon.cmd_prefix and isinstance(daemon.cmd_prefix, basestring):
+        prefix_bin = utils.which(daemon.cmd_prefix.split()[0], default=daemon.cmd_prefix.split()[0])
+        if is_elf(prefix_bin):
+            return prefix_bin
+
+    return None
+
+
+def backtrace(core, executable=None, timeout=GDB_TIMEOUT):
+    """
+    To get backtrace by gdb or None if gdb is not found
+    """
+    gdb = utils.find_bin(('gdb',))
+
+    if not gdb:
+        return None
+
+    cmd = [gdb, '-batch', '-nx']
+    for command in GDB_COMMANDS:
+        cmd.extend(['-ex', command])
+    if executable:
+        cmd.append(executable)
+    cmd.extend(['-c', core])
+
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        logger.warning('gdb was not started: %s', e)
+        return None
+
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        output, _ = process.communicate()
+    finally:
+        timer.cancel()
+
+    return output
+
+
+def crash_dirs(root, name=None):
+    """
+    To get crash directories of all tests.
+    Directories of other kinds can match glob by daemon name,
+    crash directory has crash info.
+
+    :param name: only crashes of daemon with this name
+    """
+    result = []
+
+    for path in glob.glob(os.path.join(root, '*', '*-{}-*'.format(CRASH_KIND))):
+        match = CRASH_DIR_RE.match(os.path.basename(path))
+
+        if not match or (name is not None and match.group('name') != name):
+            continue
+        if os.path.isfile(os.path.join(path, CRASH_INFO)):
+            result.append(path)
+
+    return result
+
+
+def enforce_quota(root, quota):
+    """
+    Remove least recently used crash directories while
+    total size is more than quota
+
+    :return: removed directories
+    """
+    entries = []
+
+    for path in crash_dirs(root):
+        try:
+            entries.append((os.path.getmtime(path), artifacts.files_size(path), path))
+        except OSError:
+            continue
+
+    total = sum(e[1] for e in entries)
+    removed = []
+
+    for _, size, path in sorted(entries):
+        if total <= quota:
+            break
+
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed.append(path)
+
+    if removed:
+        logger.info('Crash artifacts were removed by quota: %s', removed)
+
+    return removed
+
+
+class CrashCollector(object):
+    """
+    Collector of crash artifacts.
+    Cores are moved at crashed event, compression and
+    backtrace are done by background thread.
+    """
+
+    def __init__(self, quota=DEFAULT_QUOTA, gdb=True, keep_core=True):
+        """
+        :param quota: max size of all crash directories in bytes
+        :param gdb: extract backtrace by gdb
+        :param keep_core: keep compressed core, else only backtrace
+        """
+        self.quota = quota
+        self.gdb = gdb
+        self.keep_core = keep_core
+
+        self.crashes = []
+
+        self._started = {}
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def attach(self, bus):
+        """
+        :type bus: noseapp_daemon.events.EventBus
+        """
+        bus.subscribe(self.on_starting, events=[events.STARTING])
+        bus.subscribe(self.on_crashed, events=[events.CRASHED])
+
+    def detach(self, bus):
+        bus.unsubscribe(self.on_starting)
+        bus.unsubscribe(self.on_crashed)
+
+    def on_starting(self, event):
+        self._started[event.source.name] = event.timestamp
+
+    def on_crashed(self, event):
+        daemon = event.source
+        pid = daemon.process.pid if daemon.process else None
+
+        # mtime of file can be truncated to seconds
+        cores = locate_cores(
+            pid, daemon.working_dir, since=int(self._started.get(daemon.name, 0)),
+        )
+
+        crash_dir = artifacts.make_dir(daemon.name, CRASH_KIND)
+
+        with open(os.path.join(crash_dir, CRASH_INFO), 'w') as fp:
+            fp.write('daemon: {}\n'.format(daemon.name))
+            fp.write('pid: {}\n'.format(pid))
+            fp.write('exit_code: {}\n'.format(event.data.get('exit_code')))
+            fp.write('cmd: {}\n'.format(daemon.get_cmd()))
+            fp.write('time: {}\n'.format(time.ctime(event.timestamp)))
+
+        if not cores:
+            logger.warning('Core of daemon "%s" is not found', daemon.name)
+
+        for core in cores:
+            target = os.path.join(crash_dir, os.path.basename(core))
+
+            # working directory can be removed after stop, moving is cheap on the same device
+            try:
+                os.rename(core, target)
+            except OSError:
+                target = core
+
+            self._submit((daemon.name, target, crash_dir, daemon_executable(daemon)))
+
+        self.crashes.append(crash_dir)
+        logger.warning('Crash artifacts of daemon "%s": %s', daemon.name, crash_dir)
+
+    def _submit(self, job):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='noseapp_daemon.crash')
+                self._thread.daemon = True
+                self._thread.start()
+
+        self._queue.put(job)
+
+    def join(self):
+        """
+        Wait for all cores are processed
+        """
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self.process_core(*job)
+            except Exception:
+                logger.exception('Core processing error %r', job)
+            finally:
+                self._queue.task_done()
+
+    def process_core(self, name, core, crash_dir, executable):
+        if self.gdb:
+            output = backtrace(core, executable=executable)
+
+            if output is not None:
+                with open(os.path.join(crash_dir, 'backtrace.txt'), 'wb') as fp:
+                    fp.write(output)
+
+        if self.keep_core:
+            utils.gzip_file(core, os.path.join(crash_dir, os.path.basename(core) + '.gz'), CHUNK_SIZE)
+
+        os.unlink(core)
+
+        os.utime(crash_dir, None)
+        enforce_quota(artifacts.root_dir(), self.quota)
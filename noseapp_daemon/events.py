@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lifecycle events of daemons.
+
+Synchronous subscribers are called in thread of emitter
+in order of subscription. Asynchronous subscribers are called
+by worker pool, all events of one source are handled by the same
+worker, so they are delivered in order of emission.
+"""
+
+import time
+import Queue
+import logging
+import threading
+import itertools
+
+
+logger = logging.getLogger(__name__)
+
+
+STARTING = 'starting'
+STARTED = 'started'
+READY = 'ready'
+STOPPING = 'stopping'
+STOPPED = 'stopped'
+CRASHED = 'crashed'
+RESTARTED = 'restarted'
+
+EVENTS = (
+    STARTING,
+    STARTED,
+    READY,
+    STOPPING,
+    STOPPED,
+    CRASHED,
+    RESTARTED,
+)
+
+
+class Event(object):
+    """
+    Event of daemon lifecycle
+    """
+
+    __slots__ = ('name', 'source', 'data', 'timestamp', 'seq')
+
+    _counter = itertools.count(1)
+
+    def __init__(self, name, source, data):
+        self.name = name
+        self.source = source
+        self.data = data
+        self.timestamp = time.time()
+        self.seq = next(self._counter)
+
+    def __repr__(self):
+        return '<Event {} of {!r} #{}>'.format(
+            self.name, getattr(self.source, 'name', self.source), self.seq,
+        )
+
+
+class DispatchPool(object):
+    """
+    Worker threads for asynchronous subscribers.
+    Source of event is pinned to worker.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+
+        self._lock = threading.Lock()
+        self._queues = []
+
+    def _start(self):
+        """
+        :return: list of queues of workers
+        """
+        with self._lock:
+            if self._queues:
+                return self._queues
+
+            queues = []
+
+            for i in range(self.size):
+                queue = Queue.Queue()
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(queue,),
+                    name='noseapp_daemon.events.{}'.format(i),
+                )
+                thread.daemon = True
+                thread.start()
+                queues.append(queue)
+
+            # list is published when it is full, submit reads it without lock
+            self._queues = queues
+
+            return queues
+
+    def submit(self, event, callback):
+        queues = self._queues or self._start()
+
+        queue = queues[hash(id(event.source)) % len(queues)]
+        queue.put((event, callback))
+
+    def join(self):
+        """
+        Wait for all events are handled
+        """
+        for queue in list(self._queues):
+            queue.join()
+
+    @staticmethod
+    def _work(queue):
+        while True:
+            event, callback = queue.get()
+            try:
+                callback(event)
+            except Exception:
+                logger.exception('Subscriber %r error on %r', callback, event)
+            finally:
+                queue.task_done()
+
+
+default_pool = DispatchPool()
+
+
+class EventBus(object):
+    """
+    Bus of lifecycle events.
+    Event is delivered to subscribers of bus and then to parent bus.
+
+    Usage:
+        def on_crash(event):
+            print(event.source.name, event.data)
+
+        bus = EventBus()
+        bus.subscribe(on_crash, events=[CRASHED], asynchronous=True)
+    """
+
+    def __init__(self, parent=None, pool=None):
+        self.parent = parent
+        self.pool = pool or default_pool
+
+        self._subscribers = []
+
+    @property
+    def subscribers(self):
+        return list(self._subscribers)
+
+    def subscribe(self, callback, events=None, asynchronous=False):
+        """
+        :param callback: function with event argument
+        :param events: names of events, all events if None
+        :param asynchronous: call by worker pool
+        """
+        events = frozenset(events) if events is not None else None
+        self._subscribers.append((callback, events, asynchronous))
+
+    def unsubscribe(self, callback):
+        # bound methods are equal but not identical
+        self._subscribers = [s for s in self._subscribers if s[0] != callback]
+
+    def emit(self, name, source, **data):
+        """
+        :rtype: Event
+        """
+        event = Event(name, source, data)
+        self.dispatch(event)
+        return event
+
+    def dispatch(self, event):
+        for callback, events, asynchronous in self._subscribers:
+            if events is not None and event.name not in events:
+                continue
+
+            if asynchronous:
+                self.pool.submit(event, callback)
+                continue
+
+            try:
+                callback(event)
+            except Exception:
+                logger.exception('Subscriber %r error on %r', callback, event)
+
+        if self.parent is not None:
+            self.parent.dispatch(event)
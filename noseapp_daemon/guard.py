@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shutdown guard for launched daemons.
+
+Every launched process is registered in memory and
+in registry file. All registered process trees will be
+killed at interpreter exit or by SIGINT/SIGTERM.
+
+Daemons which were leaked by crashed test run can be
+found by registry files and environment marker and
+killed by sweep_orphans.
+"""
+
+import os
+import glob
+import atexit
+import signal
+import logging
+import tempfile
+import threading
+
+from noseapp_daemon import utils
+
+
+logger = logging.getLogger(__name__)
+
+psutil = utils.LazyImport('psutil')
+
+
+ENV_MARKER = 'NOSEAPP_DAEMON_OWNER'
+REGISTRY_DIR = os.path.join(tempfile.gettempdir(), 'noseapp_daemon')
+REGISTRY_EXT = '.pids'
+
+
+def make_marker(pid):
+    """
+    Owner marker is pid with create time of process.
+    It is unique even if pid was reused.
+    """
+    try:
+        create_time = psutil.Process(pid).create_time()
+    except psutil.NoSuchProcess:
+        return None
+
+    return '{}-{}'.format(pid, int(create_time))
+
+
+def marker_is_alive(marker):
+    """
+    Check process by marker is running
+    """
+    try:
+        pid = int(marker.split('-')[0])
+    except (ValueError, AttributeError):
+        return False
+
+    return make_marker(pid) == marker
+
+
+def read_environ(pid):
+    """
+    To get environment of process from procfs
+    """
+    try:
+        with open('/proc/{}/environ'.format(pid), 'rb') as fp:
+            data = fp.read()
+    except (IOError, OSError):
+        return {}
+
+    environ = {}
+
+    for item in data.split(b'\0'):
+        key, sep, value = item.partition(b'=')
+        if sep:
+            environ[key.decode('utf-8', 'replace')] = value.decode('utf-8', 'replace')
+
+    return environ
+
+
+class ShutdownGuard(object):
+    """
+    Kill registered processes at exit
+    """
+
+    def __init__(self, registry_dir=REGISTRY_DIR):
+        # reentrant, kill_all can be called by atexit while lock is held
+        self._lock = threading.RLock()
+        self._processes = {}
+        self._markers = {}
+        self._records = 0
+        self._installed = False
+        self._marked = False
+        self._warned = False
+        self._previous_handlers = {}
+
+        self.registry_dir = registry_dir
+        self._marker = None
+
+    @property
+    def marker(self):
+        if self._marker is None:
+            self._marker = make_marker(os.getpid())
+        return self._marker
+
+    @property
+    def registry_file(self):
+        return os.path.join(self.registry_dir, self.marker + REGISTRY_EXT)
+
+    @property
+    def processes(self):
+        return list(self._processes.values())
+
+    def install(self):
+        """
+        Install atexit and signal handlers, mark environment.
+        Processes launched after that will inherit marker.
+        Installation is repeated until signal handlers are installed.
+        """
+        with self._lock:
+            if self._installed:
+                return
+
+            if not self._marked:
+                os.environ[ENV_MARKER] = self.marker
+                atexit.register(self.kill_all)
+                self._marked = True
+
+            handlers = {}
+
+            try:
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    handlers[signum] = signal.signal(signum, self._signal_handler)
+            except ValueError:
+                # handlers can be installed only from main thread
+                if not self._warned:
+                    logger.warning('Shutdown guard signal handlers are not installed')
+                    self._warned = True
+                return
+
+            self._previous_handlers.update(handlers)
+            self._installed = True
+
+    def register(self, process):
+        """
+        :type process: psutil.Process
+        """
+        self.install()
+
+        marker = make_marker(process.pid) or str(process.pid)
+
+        with self._lock:
+            self._processes[process.pid] = process
+            self._markers[process.pid] = marker
+            self._append(marker)
+
+    def unregister(self, process):
+        """
+        :type process: psutil.Process
+        """
+        pid = getattr(process, 'pid', None)
+
+        with self._lock:
+            if self._processes.pop(pid, None) is None:
+                return
+
+            self._markers.pop(pid, None)
+
+            # stale records are compacted sometimes, they are not killed as orphans anyway
+            if not self._processes or self._records > 2 * len(self._processes) + 16:
+                self._rewrite()
+
+    def kill_all(self):
+        """
+        Kill all registered process trees
+        """
+        with self._lock:
+            pids = list(self._processes)
+            self._processes.clear()
+            self._markers.clear()
+            self._rewrite()
+
+        self._kill(pids)
+
+    @staticmethod
+    def _kill(pids):
+        if pids:
+            logger.warning('Shutdown guard kills processes: %s', pids)
+            utils.run_parallel(utils.kill_process_tree, pids)
+
+    def _append(self, marker):
+        if not os.path.isdir(self.registry_dir):
+            try:
+                os.makedirs(self.registry_dir)
+            except OSError:
+                pass
+
+        with open(self.registry_file, 'a') as fp:
+            fp.write('{}\n'.format(marker))
+
+        self._records += 1
+
+    def _rewrite(self):
+        if not self._markers:
+            try:
+                os.unlink(self.registry_file)
+            except OSError:
+                pass
+            self._records = 0
+            return
+
+        with open(self.registry_file, 'w') as fp:
+            fp.writelines('{}\n'.format(m) for m in self._markers.values())
+
+        self._records = len(self._markers)
+
+    def _signal_handler(self, signum, frame):
+        # lock is not taken, signal can be received while it is held by this thread
+        pids = list(self._processes)
+        self._processes.clear()
+        self._markers.clear()
+        self._kill(pids)
+
+        try:
+            os.unlink(self.registry_file)
+        except OSError:
+            pass
+
+        handler = self._previous_handlers.get(signum)
+
+        if callable(handler):
+            return handler(signum, frame)
+
+        if handler != signal.SIG_IGN:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+
+def find_orphans(registry_dir=REGISTRY_DIR):
+    """
+    To get pids of processes from previous runs.
+    Owner of process is dead and process is alive.
+
+    :return: (pids, registry files)
+    """
+    pids = set()
+    files = []
+
+    for registry_file in glob.iglob(os.path.join(registry_dir, '*' + REGISTRY_EXT)):
+        owner = os.path.basename(registry_file)[:-len(REGISTRY_EXT)]
+
+        if marker_is_alive(owner):
+            continue
+
+        files.append(registry_file)
+
+        try:
+            with open(registry_file) as fp:
+                markers = [line.strip() for line in fp if line.strip()]
+        except IOError:
+            continue
+
+        pids.update(
+            int(m.split('-')[0]) for m in markers if marker_is_alive(m)
+        )
+
+    for pid in psutil.pids():
+        owner = read_environ(pid).get(ENV_MARKER)
+
+        if owner and not marker_is_alive(owner):
+            pids.add(pid)
+
+    return sorted(pids), files
+
+
+def is_orphan(pid):
+    """
+    Process was launched by test run which is dead
+    """
+    owner = read_environ(pid).get(ENV_MARKER)
+    return bool(owner) and not marker_is_alive(owner)
+
+
+def sweep_orphans(registry_dir=REGISTRY_DIR):
+    """
+    Kill orphaned daemons of previous runs in parallel
+
+    :return: list of killed pids
+    """
+    pids, files = find_orphans(registry_dir=registry_dir)
+
+    if pids:
+        logger.warning('Orphaned daemons will be killed: %s', pids)
+        utils.run_parallel(utils.kill_process_tree, pids)
+
+    for registry_file in files:
+        try:
+            os.unlink(registry_file)
+        except OSError:
+            pass
+
+    return pids
+
+
+shutdown_guard = ShutdownGuard()
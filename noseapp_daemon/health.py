@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+
+"""
+Health monitoring of running daemons.
+
+All probes are called by single scheduler thread.
+Latency of probes is recorded to fixed bucket histogram.
+"""
+
+import time
+import heapq
+import socket
+import bisect
+import logging
+import threading
+from array import array
+
+from noseapp_daemon import utils
+
+
+logger = logging.getLogger(__name__)
+
+urllib2 = utils.LazyImport('urllib2')
+
+
+# upper bounds of buckets in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5,
+    5.0, 10.0, float('inf'),
+)
+
+
+class Histogram(object):
+    """
+    Compact histogram with fixed buckets
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = array('L', [0] * len(self.buckets))
+
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        self.counts[min(index, len(self.counts) - 1)] += 1
+
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q):
+        """
+        To get upper bound of bucket for percentile
+
+        :param q: percentile from 0 to 100
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, int(round(self.count * q / 100.0)))
+        seen = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return self.buckets[-1]
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def reset(self):
+        self.counts = array('L', [0] * len(self.buckets))
+        self.count = 0
+        self.total = 0.0
+
+    def __repr__(self):
+        return '<Histogram count={} p50={} p99={}>'.format(self.count, self.p50, self.p99)
+
+
+class TCPProbe(object):
+    """
+    Check port accepts connections
+    """
+
+    def __init__(self, port, host='127.0.0.1', timeout=1.0):
+        self.port = port
+        self.host = host
+        self.timeout = timeout
+
+    def __call__(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.close()
+        return True
+
+    def __repr__(self):
+        return '<TCPProbe {}:{}>'.format(self.host, self.port)
+
+
+class UnixSocketProbe(object):
+    """
+    Check unix socket accepts connections
+    """
+
+    def __init__(self, path, timeout=1.0):
+        self.path = path
+        self.timeout = timeout
+
+    def __call__(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        finally:
+            sock.close()
+        return True
+
+    def __repr__(self):
+        return '<UnixSocketProbe {}>'.format(self.path)
+
+
+class HTTPProbe(object):
+    """
+    Check url responds with success status code
+    """
+
+    def __init__(self, url, timeout=1.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self):
+        response = urllib2.urlopen(self.url, timeout=self.timeout)
+        try:
+            return response.getcode() < 400
+        finally:
+            response.close()
+
+    def __repr__(self):
+        return '<HTTPProbe {}>'.format(self.url)
+
+
+class CallableProbe(object):
+    """
+    Custom probe. Function returns bool or raises exception.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self):
+        return self.func()
+
+    def __repr__(self):
+        return '<CallableProbe {!r}>'.format(self.func)
+
+
+class HealthCheck(object):
+    """
+    State of probe for daemon
+    """
+
+    def __init__(self, daemon, probe, interval=1.0, threshold=None):
+        """
+        :type daemon: noseapp_daemon.runner.DaemonRunner
+        :param probe: callable object
+        :param interval: seconds between calls of probe
+        :param threshold: max latency in seconds
+        """
+        self.daemon = daemon
+        self.probe = probe
+        self.interval = interval
+        self.threshold = threshold
+
+        self.histogram = Histogram()
+        self.failures = 0
+        self.healthy = True
+        # removed check is not scheduled again
+        self.removed = False
+
+    def run(self):
+        start = time.time()
+
+        try:
+            ok = bool(self.probe())
+        except Exception as e:
+            logger.debug('Probe %r of daemon "%s" error: %s', self.probe, self.daemon.name, e)
+            ok = False
+
+        latency = time.time() - start
+        self.histogram.record(latency)
+
+        if not ok:
+            self.failures += 1
+
+        healthy = ok and (self.threshold is None or latency <= self.threshold)
+
+        if self.healthy and not healthy:
+            logger.warning(
+                'Daemon "%s" probe %r threshold crossed: latency %.4f ok %s',
+                self.daemon.name, self.probe, latency, ok,
+            )
+            self.daemon.threshold_crossed(self.probe, latency if ok else None)
+
+        self.healthy = healthy
+
+        return healthy
+
+    def stats(self):
+        return {
+            'count': self.histogram.count,
+            'failures': self.failures,
+            'healthy': self.healthy,
+            'p50': self.histogram.p50,
+            'p99': self.histogram.p99,
+        }
+
+
+class HealthMonitor(object):
+    """
+    Scheduler of health checks.
+
+    Usage:
+        monitor = HealthMonitor()
+        monitor.add(daemon, TCPProbe(8080), interval=0.5, threshold=0.01)
+        monitor.start()
+        ...
+        monitor.stats(daemon.name)
+        monitor.remove(daemon.name)
+        monitor.stop()
+    """
+
+    def __init__(self):
+        self._checks = {}
+        self._queue = []
+        self._counter = 0
+        self._thread = None
+        self._condition = threading.Condition()
+        self._stopped = True
+
+    @property
+    def running(self):
+        return not self._stopped
+
+    def add(self, daemon, probe, interval=1.0, threshold=None):
+        """
+        Add probe for daemon
+
+        :rtype: HealthCheck
+        """
+        check = HealthCheck(daemon, probe, interval=interval, threshold=threshold)
+
+        with self._condition:
+            self._checks.setdefault(daemon.name, []).append(check)
+            self._schedule(check, time.time())
+            self._condition.notify()
+
+        return check
+
+    def remove(self, name, probe=None):
+        """
+        Remove probes of daemon
+
+        :param probe: only this probe, all probes of daemon by default
+        :return: list of removed HealthCheck
+        """
+        with self._condition:
+            checks = self._checks.pop(name, [])
+            removed = [c for c in checks if probe is None or c.probe is probe]
+            kept = [c for c in checks if c not in removed]
+
+            if kept:
+                self._checks[name] = kept
+
+            for check in removed:
+                check.removed = True
+
+            # check which is running now is not in queue
+            self._queue = [entry for entry in self._queue if not entry[2].removed]
+            heapq.heapify(self._queue)
+            self._condition.notify()
+
+        return removed
+
+    def checks(self, name):
+        return list(self._checks.get(name, []))
+
+    def stats(self, name):
+        """
+        To get stats of probes for daemon
+        """
+        return [check.stats() for check in self.checks(name)]
+
+    def start(self):
+        with self._condition:
+            if not self._stopped:
+                return
+            self._stopped = False
+
+        self._thread = threading.Thread(target=self._loop, name='noseapp_daemon.health')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _schedule(self, check, when):
+        self._counter += 1
+        heapq.heappush(self._queue, (when, self._counter, check))
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    timeout = self._queue[0][0] - time.time() if self._queue else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+
+                if self._stopped:
+                    return
+
+                _, _, check = heapq.heappop(self._queue)
+
+            if check.daemon.started and not check.removed:
+                check.run()
+
+            with self._condition:
+                if not check.removed:
+                    self._schedule(check, time.time() + check.interval)
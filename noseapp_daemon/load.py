@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load generation for daemons under test.
+
+Requests are sent by worker threads, connections are taken
+from pool and reused. Latency is recorded to histogram,
+resources of daemon are sampled by psutil at the same time.
+
+Usage:
+    from noseapp_daemon.load import LoadHarness, HTTPRequest
+
+    harness = LoadHarness(daemon, HTTPRequest('http://127.0.0.1:8080/'), concurrency=8, rate=500)
+    result = harness.run(duration=10)
+    result.stats()  # {'requests': ..., 'throughput': ..., 'p99': ..., 'resources': {...}}
+"""
+
+import time
+import Queue
+import socket
+import logging
+import itertools
+import threading
+from collections import deque
+
+from noseapp_daemon import utils
+from noseapp_daemon.health import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+psutil = utils.LazyImport('psutil')
+httplib = utils.LazyImport('httplib')
+urlparse = utils.LazyImport('urlparse')
+
+
+class ConnectionPool(object):
+    """
+    Pool of reusable connections.
+    Connection is created if pool is empty, so number of
+    connections is not more than number of concurrent users.
+    """
+
+    def __init__(self, factory):
+        """
+        :param factory: function which returns new connection
+        """
+        self.factory = factory
+
+        self._idle = Queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    @property
+    def size(self):
+        return len(self._connections)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            pass
+
+        conn = self.factory()
+
+        with self._lock:
+            self._connections.append(conn)
+
+        return conn
+
+    def release(self, conn, broken=False):
+        """
+        Return connection to pool or close it if it is broken
+        """
+        if not broken:
+            self._idle.put(conn)
+            return
+
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+        self._close(conn)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for conn in connections:
+            self._close(conn)
+
+        self._idle = Queue.LifoQueue()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class TCPRequest(object):
+    """
+    Send payload to TCP port and read response
+    """
+
+    def __init__(self, port, payload, host='127.0.0.1', response_end=None, response_size=None, timeout=5.0):
+        """
+        :param payload: bytes for sending
+        :param response_end: response is read until it is ended by this bytes
+        :param response_size: response is read until this number of bytes
+        """
+        self.port = port
+        self.payload = payload
+        self.host = host
+        self.response_end = response_end
+        self.response_size = response_size
+        self.timeout = timeout
+
+    def connect(self):
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def __call__(self, conn):
+        conn.sendall(self.payload)
+
+        if self.response_end is None and self.response_size is None:
+            return True
+
+        data = b''
+
+        while True:
+            if self.response_end is not None and data.endswith(self.response_end):
+                break
+            if self.response_size is not None and len(data) >= self.response_size:
+                break
+
+            chunk = conn.recv(4096)
+
+            if not chunk:
+                raise IOError('Connection was closed by {!r}'.format(self))
+
+            data += chunk
+
+        return True
+
+    def __repr__(self):
+        return '<TCPRequest {}:{}>'.format(self.host, self.port)
+
+
+class UnixRequest(TCPRequest):
+    """
+    Send payload to unix socket and read response
+    """
+
+    def __init__(self, path, payload, **kwargs):
+        """
+        :param path: path to unix socket
+        """
+        super(UnixRequest, self).__init__(None, payload, host=path, **kwargs)
+
+        self.path = path
+
+    def connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(self.timeout)
+        conn.connect(self.path)
+        return conn
+
+    def __repr__(self):
+        return '<UnixRequest {}>'.format(self.path)
+
+
+class HTTPRequest(object):
+    """
+    HTTP request by keep-alive connection
+    """
+
+    def __init__(self, url, method='GET', body=None, headers=None, timeout=5.0):
+        self.url = url
+        self.method = method
+        self.body = body
+        self.headers = headers or {}
+        self.timeout = timeout
+
+        parsed = urlparse.urlsplit(url)
+
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path or '/'
+
+        if parsed.query:
+            self.path = '{}?{}'.format(self.path, parsed.query)
+
+    def connect(self):
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def __call__(self, conn):
+        conn.request(self.method, self.path, self.body, self.headers)
+
+        response = conn.getresponse()
+        response.read()
+
+        return response.status < 400
+
+    def __repr__(self):
+        return '<HTTPRequest {} {}>'.format(self.method, self.url)
+
+
+class ResourceSampler(object):
+    """
+    Sample cpu and memory of process with children
+    """
+
+    def __init__(self, pid, interval=0.5, max_samples=None):
+        """
+        :param max_samples: only last samples are kept if it is set
+        """
+        self.pid = pid
+        self.interval = interval
+
+        # (timestamp, cpu percent, rss bytes, threads)
+        self.samples = deque(maxlen=max_samples)
+
+        self._processes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        try:
+            main = psutil.Process(self.pid)
+            processes = [main] + main.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return None
+
+        cpu = 0.0
+        rss = 0
+        threads = 0
+
+        for process in processes:
+            # cpu percent is calculated from previous call for the same object
+            process = self._processes.setdefault(process.pid, process)
+
+            try:
+                cpu += process.cpu_percent()
+                rss += process.memory_info().rss
+                threads += process.num_threads()
+            except psutil.NoSuchProcess:
+                self._processes.pop(process.pid, None)
+
+        sample = (time.time(), cpu, rss, threads)
+        self.samples.append(sample)
+
+        return sample
+
+    def start(self):
+        self._stopped.clear()
+        self.sample()
+
+        self._thread = threading.Thread(target=self._loop, name='noseapp_daemon.load.sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        self.sample()
+
+    def summary(self):
+        # first sample of cpu is always zero
+        samples = list(self.samples)[1:]
+
+        if not samples:
+            return {}
+
+        cpu = [s[1] for s in samples]
+        rss = [s[2] for s in samples]
+
+        return {
+            'samples': len(samples),
+            'cpu_mean': sum(cpu) / len(cpu),
+            'cpu_max': max(cpu),
+            'rss_mean': sum(rss) / len(rss),
+            'rss_max': max(rss),
+            'threads_max': max(s[3] for s in samples),
+        }
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+
+class LoadResult(object):
+
+    def __init__(self, histogram, errors, duration, resources):
+        self.histogram = histogram
+        self.errors = errors
+        self.duration = duration
+        self.resources = resources
+
+    @property
+    def requests(self):
+        return self.histogram.count
+
+    @property
+    def throughput(self):
+        """
+        Successful requests per second
+        """
+        if not self.duration:
+            return 0.0
+        return (self.requests - self.errors) / self.duration
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'duration': self.duration,
+            'throughput': self.throughput,
+            'mean': self.histogram.mean,
+            'p50': self.histogram.p50,
+            'p99': self.histogram.p99,
+            'resources': self.resources,
+        }
+
+    def __repr__(self):
+        return '<LoadResult requests={} errors={} throughput={:.1f}>'.format(
+            self.requests, self.errors, self.throughput,
+        )
+
+
+class LoadHarness(object):
+    """
+    Drive load to daemon endpoint
+    """
+
+    def __init__(self, daemon, request, concurrency=4, rate=None, sample_interval=0.5):
+        """
+        :type daemon: noseapp_daemon.runner.DaemonRunner
+        :param request: TCPRequest, HTTPRequest or object with connect method
+            which returns connection and is called with connection
+        :param concurrency: number of worker threads
+        :param rate: target number of requests per second, unlimited if None
+        :param sample_interval: seconds between samples of daemon resources
+        """
+        self.daemon = daemon
+        self.request = request
+        self.concurrency = concurrency
+        self.rate = rate
+        self.sample_interval = sample_interval
+
+    def _daemon_pid(self):
+        pid = self.daemon.pid_file.pid
+
+        if not pid and self.daemon.process:
+            pid = self.daemon.process.pid
+
+        return pid
+
+    def run(self, duration=None, requests=None):
+        """
+        :param duration: seconds of load
+        :param requests: number of requests
+        :rtype: LoadResult
+        """
+        if duration is None and requests is None:
+            raise ValueError('duration or requests is required')
+
+        histogram = Histogram()
+        errors = [0]
+        lock = threading.Lock()
+
+        pool = ConnectionPool(self.request.connect)
+        counter = itertools.count()
+
+        pid = self._daemon_pid()
+        sampler = ResourceSampler(pid, interval=self.sample_interval) if pid else None
+
+        start = time.time()
+        deadline = start + duration if duration is not None else None
+
+        def work():
+            while True:
+                index = next(counter)
+
+                if requests is not None and index >= requests:
+                    return
+
+                broken = False
+                request_start = time.time()
+
+                if self.rate:
+                    # latency counts from the scheduled time, so a stalled
+                    # server is not hidden by requests sent late
+                    request_start = start + index / float(self.rate)
+                    delay = request_start - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if deadline is not None and time.time() >= deadline:
+                    return
+
+                try:
+                    conn = pool.acquire()
+                except Exception as e:
+                    logger.debug('Connection error %r: %s', self.request, e)
+                    conn, ok = None, False
+                else:
+                    try:
+                        ok = bool(self.request(conn))
+                    except Exception as e:
+                        logger.debug('Request error %r: %s', self.request, e)
+                        ok, broken = False, True
+
+                latency = time.time() - request_start
+
+                if conn is not None:
+                    pool.release(conn, broken=broken)
+
+                with lock:
+                    histogram.record(latency)
+                    if not ok:
+                        errors[0] += 1
+
+        if sampler:
+            sampler.start()
+
+        try:
+            utils.run_parallel(lambda _: work(), range(self.concurrency))
+        finally:
+            elapsed = time.time() - start
+
+            if sampler:
+                sampler.stop()
+
+            pool.close()
+
+        return LoadResult(
+            histogram,
+            errors[0],
+            elapsed,
+            sampler.summary() if sampler else {},
+        )
@@ -1,12 +1,29 @@
 # -*- coding: utf-8 -*-
 
+import time
+import threading
 from collections import OrderedDict
+from collections import defaultdict
 from contextlib import contextmanager
 
+from noseapp_daemon import guard
+from noseapp_daemon import trace
+from noseapp_daemon import events
+from noseapp_daemon import artifacts
+from noseapp_daemon.events import EventBus
+from noseapp_daemon.scope import SCOPE_LABEL
+from noseapp_daemon.scope import ScopeKeeper
+from noseapp_daemon.health import HealthMonitor
+from noseapp_daemon.runner import DaemonError
 from noseapp_daemon.runner import DaemonRunner
+from noseapp_daemon.runner import rolling_restart
 from noseapp_daemon.service import DaemonService
 
 
+# trace track of management operations
+MANAGEMENT_TRACK = 'management'
+
+
 class ServiceNotFound(LookupError):
     pass
 
@@ -15,6 +32,171 @@ class DaemonNotFound(LookupError):
     pass
 
 
+class PoolNotFound(LookupError):
+    pass
+
+
+def parse_selector(selector):
+    """
+    Convert selector to set of index terms
+
+    Usage:
+        parse_selector('role=web,uwsgi')
+        parse_selector({'role': 'web'})
+
+    :param selector: comma separated tags and "key=value" labels or dict of labels
+    :type selector: str, dict
+    """
+    if isinstance(selector, dict):
+        return frozenset(
+            '{}={}'.format(k, v) for k, v in selector.items()
+        )
+
+    return frozenset(
+        term.strip() for term in selector.split(',') if term.strip()
+    )
+
+
+def index_terms(obj):
+    """
+    To get index terms of daemon or service
+
+    :type obj: noseapp_daemon.runner.DaemonRunner, noseapp_daemon.service.DaemonService
+    """
+    terms = set(obj.tags)
+    terms.update(
+        '{}={}'.format(k, v) for k, v in obj.labels.items()
+    )
+    return terms
+
+
+class SelectorIndex(object):
+    """
+    Secondary index of names by tags and labels
+    """
+
+    def __init__(self):
+        self._terms = defaultdict(set)
+        self._positions = {}
+        self._counter = 0
+
+    def add(self, name, terms):
+        self.remove(name)
+
+        self._counter += 1
+        self._positions[name] = (self._counter, frozenset(terms))
+
+        for term in terms:
+            self._terms[term].add(name)
+
+    def remove(self, name):
+        try:
+            _, terms = self._positions.pop(name)
+        except KeyError:
+            return
+
+        for term in terms:
+            names = self._terms[term]
+            names.discard(name)
+            if not names:
+                del self._terms[term]
+
+    def select(self, terms):
+        """
+        To get names matched by all terms in order of registration
+        """
+        if not terms:
+            return []
+
+        sets = [self._terms.get(t) for t in terms]
+
+        if not all(sets):
+            return []
+
+        sets.sort(key=len)
+        names = sets[0].intersection(*sets[1:])
+
+        return sorted(names, key=lambda n: self._positions[n][0])
+
+
+class ReadinessCache(object):
+    """
+    Ready state of daemons by generations.
+    Generation is incremented at every start, stop and crash of daemon.
+    Only one thread probes daemon, other threads wait for result.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generations = {}
+        self._ready = {}
+        self._probing = set()
+
+    def generation(self, name):
+        return self._generations.get(name, 0)
+
+    def is_ready(self, name):
+        """
+        Cached state, daemon is not probed
+        """
+        with self._condition:
+            return self._ready.get(name) == self.generation(name)
+
+    def on_event(self, event):
+        name = event.source.name
+
+        with self._condition:
+            if event.name in (events.STARTING, events.STOPPING, events.CRASHED):
+                self._generations[name] = self.generation(name) + 1
+            elif event.name == events.READY:
+                self._ready[name] = self.generation(name)
+
+            self._condition.notify_all()
+
+    def wait_ready(self, daemon, timeout=10, interval=0.1):
+        """
+        Wait for daemon is ready for current generation
+
+        :return: generation
+        :raises: DaemonError if timeout was expired
+        """
+        name = daemon.name
+        deadline = time.time() + timeout
+
+        with self._condition:
+            while True:
+                generation = self.generation(name)
+
+                if self._ready.get(name) == generation:
+                    return generation
+
+                if (name, generation) not in self._probing:
+                    self._probing.add((name, generation))
+                    break
+
+                remaining = deadline - time.time()
+
+                if remaining <= 0:
+                    raise DaemonError(
+                        'Daemon "{}" is not ready after {} sec'.format(name, timeout),
+                    )
+
+                self._condition.wait(remaining)
+
+        try:
+            daemon.wait_ready(timeout=max(deadline - time.time(), 0), interval=interval)
+        finally:
+            with self._condition:
+                self._probing.discard((name, generation))
+                self._condition.notify_all()
+
+        with self._condition:
+            if self.generation(name) == generation:
+                self._ready[name] = generation
+
+        return generation
+
+
 class DaemonManagement(object):
     """
     Class implemented interface
@@ -27,6 +209,24 @@ class DaemonManagement(object):
 
         self.__daemons = OrderedDict()
         self.__services = OrderedDict()
+        self.__pools = OrderedDict()
+
+        self.__daemon_index = SelectorIndex()
+        self.__service_index = SelectorIndex()
+
+        self.__health = HealthMonitor()
+        self.__events = EventBus()
+
+        self.__scopes = ScopeKeeper()
+
+        # crash collector or profilers write artifacts
+        self.__collect_artifacts = False
+
+        self.__readiness = ReadinessCache()
+        self.__events.subscribe(
+            self.__readiness.on_event,
+            events=[events.STARTING, events.READY, events.STOPPING, events.CRASHED],
+        )
 
         self.setup()
 
@@ -46,12 +246,87 @@ class DaemonManagement(object):
     def daemons(self):
         return self.__daemons
 
+    @property
+    def pools(self):
+        return self.__pools
+
+    @property
+    def scopes(self):
+        """
+        :rtype: noseapp_daemon.scope.ScopeKeeper
+        """
+        return self.__scopes
+
+    @property
+    def health(self):
+        return self.__health
+
+    @property
+    def events(self):
+        """
+        Bus of lifecycle events of all registered daemons
+        """
+        return self.__events
+
+    def subscribe(self, callback, events=None, asynchronous=False):
+        """
+        Subscribe to lifecycle events of all registered daemons.
+        See noseapp_daemon.events.EventBus.subscribe.
+        """
+        self.__events.subscribe(callback, events=events, asynchronous=asynchronous)
+
     def setup(self):
         pass
 
+    def record_starts(self, path=None):
+        """
+        Record starts of daemons to append-only log.
+        See noseapp_daemon.recorder.StartRecorder.
+
+        :rtype: noseapp_daemon.recorder.StartRecorder
+        """
+        from noseapp_daemon.recorder import StartRecorder
+
+        recorder = StartRecorder(path=path)
+        recorder.attach(self.__events)
+
+        return recorder
+
+    def collect_crashes(self, quota=None, gdb=True):
+        """
+        Collect cores of crashed daemons.
+        See noseapp_daemon.crash.CrashCollector.
+
+        :param quota: max size of crash artifacts in bytes
+        :rtype: noseapp_daemon.crash.CrashCollector
+        """
+        from noseapp_daemon import crash
+
+        collector = crash.CrashCollector(
+            quota=crash.DEFAULT_QUOTA if quota is None else quota, gdb=gdb,
+        )
+        collector.attach(self.__events)
+
+        self.__collect_artifacts = True
+
+        return collector
+
+    def sweep_orphans(self):
+        """
+        Kill daemons leaked by previous test runs
+
+        :return: list of killed pids
+        """
+        return guard.sweep_orphans()
+
     def install(self, app=None):
         """
-        Shared services and daemons to suites
+        Shared services and daemons to suites.
+        Scoped daemons are started before suites and
+        reset by setup and teardown callbacks, see noseapp_daemon.scope.
+        Artifacts are grouped by test if they are collected,
+        see noseapp_daemon.artifacts.
+        Suites must be registered before install.
 
         :type app: noseapp.app.NoseApp
         """
@@ -62,17 +337,182 @@ class DaemonManagement(object):
         for name, daemon in self.__daemons.items():
             app.shared_extension(name=name, cls=self.daemon, args=(name,))
 
+        if self.__scopes.daemons:
+            self.__scopes.install(app)
+
+        if self.__collect_artifacts or any(d.profiler for d in self.__daemons.values()):
+            for suite in app.suites:
+                artifacts.install_suite(suite)
+
     def add_service(self, service):
         if not isinstance(service, DaemonService):
             raise TypeError('"service" param is not instance of "DaemonService"')
 
         self.__services[service.name] = service
+        self.__service_index.add(service.name, index_terms(service))
 
-    def add_daemon(self, daemon):
+    def add_daemon(self, daemon, scope=None, reset=None, timeout=10):
+        """
+        :param scope: lifetime scope from noseapp_daemon.scope,
+            SESSION, SUITE or TEST, lifetime is not managed by default
+        :param reset: reset strategy of scoped daemon, the cheapest by default
+        :param timeout: timeout of ready state of scoped daemon
+        """
         if not isinstance(daemon, DaemonRunner):
             raise TypeError('"daemon" param is not instance of "DaemonRunner"')
 
+        if scope is not None:
+            self.__scopes.add(daemon, scope, strategy=reset, timeout=timeout)
+            daemon.labels[SCOPE_LABEL] = scope
+
         self.__daemons[daemon.name] = daemon
+        self.__daemon_index.add(daemon.name, index_terms(daemon))
+
+        daemon.events.parent = self.__events
+
+    def remove_daemon(self, name):
+        """
+        Unregister daemon and its probes, it is not stopped
+        """
+        daemon = self.daemon(name)
+
+        del self.__daemons[name]
+        self.__daemon_index.remove(name)
+        self.__scopes.discard(name)
+        self.__health.remove(name)
+
+        daemon.events.parent = None
+
+        return daemon
+
+    def add_pool(self, template, size=0, name=None, **kwargs):
+        """
+        Add pool of daemons which are created from template.
+        Instances are registered as daemons labeled by pool name.
+        See noseapp_daemon.pool.DaemonPool.
+
+        Usage:
+            pool = management.add_pool(UWSGIDaemon(), size=2)
+            pool.scale_to(8)
+            management.select_daemons('pool=uwsgi')
+
+        :rtype: noseapp_daemon.pool.DaemonPool
+        """
+        from noseapp_daemon.pool import DaemonPool
+
+        pool = DaemonPool(
+            template,
+            name=name,
+            on_add=self.add_daemon,
+            on_remove=lambda daemon: self.remove_daemon(daemon.name),
+            **kwargs
+        )
+        self.__pools[pool.name] = pool
+
+        if size:
+            pool.scale_to(size)
+
+        return pool
+
+    def pool(self, name):
+        try:
+            pool = self.__pools[name]
+        except KeyError:
+            raise PoolNotFound(name)
+
+        return pool
+
+    def checkpoint(self, name):
+        """
+        Save current state of scoped daemon, it will be restored by reset.
+        Use it after fixtures were loaded.
+        """
+        scoped = self.__scopes.get(name)
+
+        if scoped is None:
+            raise DaemonNotFound(name)
+
+        scoped.checkpoint()
+
+    def select_daemons(self, selector):
+        """
+        To get daemons matched by selector.
+        Tags and labels are indexed at add_daemon.
+
+        :param selector: see parse_selector
+        """
+        names = self.__daemon_index.select(parse_selector(selector))
+        return [self.__daemons[name] for name in names]
+
+    def select_services(self, selector):
+        """
+        To get services matched by selector.
+        Tags and labels are indexed at add_service.
+
+        :param selector: see parse_selector
+        """
+        names = self.__service_index.select(parse_selector(selector))
+        return [self.__services[name] for name in names]
+
+    def wait_ready(self, name, timeout=10, interval=0.1):
+        """
+        Wait for daemon is ready.
+        Concurrent callers share one probe, ready state is cached
+        until daemon will be restarted or stopped.
+
+        :return: generation of daemon
+        :raises: DaemonError if timeout was expired
+        """
+        return self.__readiness.wait_ready(self.daemon(name), timeout=timeout, interval=interval)
+
+    def is_ready(self, name):
+        """
+        Cached ready state of daemon, daemon is not probed
+        """
+        return self.__readiness.is_ready(self.daemon(name).name)
+
+    def add_probe(self, name, probe, interval=1.0, threshold=None):
+        """
+        Add health probe for daemon
+
+        :param name: daemon name
+        :param probe: TCPProbe, HTTPProbe, CallableProbe or any callable
+        :param interval: seconds between calls of probe
+        :param threshold: max latency in seconds,
+            plugin.threshold_crossed will be called if it was crossed
+        """
+        return self.__health.add(
+            self.daemon(name), probe, interval=interval, threshold=threshold,
+        )
+
+    def remove_probe(self, name, probe=None):
+        """
+        Remove health probe of daemon
+
+        :param probe: only this probe, all probes of daemon by default
+        """
+        return self.__health.remove(self.daemon(name).name, probe=probe)
+
+    def health_stats(self, name):
+        """
+        To get p50, p99 and failures of daemon probes
+        """
+        return self.__health.stats(name)
+
+    def start_monitor(self):
+        self.__health.start()
+
+    def stop_monitor(self):
+        self.__health.stop()
+
+    def run_load(self, name, request, duration=None, requests=None, **kwargs):
+        """
+        Drive load to endpoint of daemon.
+        See noseapp_daemon.runner.DaemonRunner.run_load.
+        """
+        return self.daemon(name).run_load(
+            request, duration=duration, requests=requests, **kwargs
+        )
 
     def daemon(self, name):
         try:
@@ -117,29 +557,65 @@ class DaemonManagement(object):
             yield daemon
 
     def start_services(self):
-        for name in self.__services:
-            self.__services[name].start()
+        with trace.span('start_services', MANAGEMENT_TRACK):
+            for name in self.__services:
+                with trace.span('start', name):
+                    self.__services[name].start()
 
     def stop_services(self):
-        for name in self.__services:
-            self.__services[name].stop()
+        with trace.span('stop_services', MANAGEMENT_TRACK):
+            for name in self.__services:
+                with trace.span('stop', name):
+                    self.__services[name].stop()
 
     def restart_services(self):
         self.stop_services()
         self.start_services()
 
     def start_daemons(self):
-        for name in self.__daemons:
-            self.__daemons[name].start()
+        with trace.span('start_daemons', MANAGEMENT_TRACK):
+            for name in self.__daemons:
+                with trace.span('start', name):
+                    self.__daemons[name].start()
 
     def stop_daemons(self):
-        for name in self.__daemons:
-            self.__daemons[name].stop()
+        with trace.span('stop_daemons', MANAGEMENT_TRACK):
+            for name in self.__daemons:
+                with trace.span('stop', name):
+                    self.__daemons[name].stop()
 
     def restart_daemons(self):
         self.stop_daemons()
         self.start_daemons()
 
+    def rolling_restart(self, selector=None, batch_size=1, timeout=10, drain=None, undrain=None):
+        """
+        Restart daemons matched by selector or all daemons by batches
+        without stopping of whole group.
+        See noseapp_daemon.runner.rolling_restart.
+
+        Usage:
+            management.rolling_restart(
+                'role=backend',
+                batch_size=2,
+                drain=lambda d: nginx_upstream_down(d.port),
+                undrain=lambda d: nginx_upstream_up(d.port),
+            )
+        """
+        if selector is None:
+            daemons = list(self.__daemons.values())
+        else:
+            daemons = self.select_daemons(selector)
+
+        with trace.span('rolling_restart', MANAGEMENT_TRACK):
+            rolling_restart(
+                daemons,
+                batch_size=batch_size,
+                timeout=timeout,
+                drain=drain,
+                undrain=undrain,
+            )
+
     def start_all(self):
         self.start_daemons()
         self.start_services()
@@ -151,3 +627,34 @@ class DaemonManagement(object):
     def restart_all(self):
         self.stop_all()
         self.start_all()
+
+    def start(self, selector=None):
+        """
+        Start daemons and services matched by selector or all
+        """
+        if selector is None:
+            return self.start_all()
+
+        for daemon in self.select_daemons(selector):
+            daemon.start()
+        for service in self.select_services(selector):
+            service.start()
+
+    def stop(self, selector=None):
+        """
+        Stop daemons and services matched by selector or all
+        """
+        if selector is None:
+            return self.stop_all()
+
+        for daemon in self.select_daemons(selector):
+            daemon.stop()
+        for service in self.select_services(selector):
+            service.stop()
+
+    def restart(self, selector=None):
+        """
+        Restart daemons and services matched by selector or all
+        """
+        self.stop(selector=selector)
+        self.start(selector=selector)
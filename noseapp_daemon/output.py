@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""
+Output policies of daemons.
+
+Policy is used as stdout or stderr param of DaemonRunner
+instead of path to log file. Output is read from pipe by
+thread of policy, memory is bounded whatever daemon writes.
+
+Usage:
+    from noseapp_daemon import output
+
+    daemon = MyDaemon(
+        'my_daemon',
+        stdout=output.DISCARD,
+        stderr=output.RingBuffer(max_lines=1000),
+    )
+    daemon.stderr.lines()
+
+    # rotating file with gzip of rotated files
+    output.RotatingFile('/tmp/my_daemon.log', max_bytes=64 * 1024 ** 2, backups=3)
+
+    # every 100th line to ring buffer
+    output.Sampled(output.RingBuffer(), every=100)
+"""
+
+import os
+import abc
+import fcntl
+import logging
+import threading
+from collections import deque
+
+from noseapp_daemon import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+CHUNK_SIZE = 64 * 1024
+
+# longer lines are truncated
+MAX_LINE = 64 * 1024
+
+# seconds for reading of rest output at stop
+CLOSE_TIMEOUT = 1.0
+
+
+class OutputPolicy(object):
+    """
+    Base class of output policies
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def open(self):
+        """
+        :return: file object for child process
+        """
+        pass
+
+    def close(self):
+        """
+        Will be called after daemon was stopped
+        """
+        pass
+
+
+class Discard(OutputPolicy):
+    """
+    Output is written to /dev/null
+    """
+
+    def open(self):
+        return open(os.devnull, 'w')
+
+    def __repr__(self):
+        return '<Discard>'
+
+
+DISCARD = Discard()
+
+
+class PipeOutput(OutputPolicy):
+    """
+    Output is read from pipe line by line
+    """
+
+    def __init__(self, max_line=MAX_LINE):
+        self.max_line = max_line
+
+        self._thread = None
+
+    def open(self):
+        read_fd, write_fd = os.pipe()
+
+        # daemons which are started in parallel must not inherit pipes of each other,
+        # else end of output is not seen, stdout of child is made by dup2 without flag
+        for fd in (read_fd, write_fd):
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+        self._thread = threading.Thread(
+            target=self._read, args=(read_fd,), name='noseapp_daemon.output',
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+        return os.fdopen(write_fd, 'w')
+
+    def close(self):
+        if self._thread is None:
+            return
+
+        # pipe can be kept open by leaked children of daemon
+        self._thread.join(CLOSE_TIMEOUT)
+
+        if self._thread.is_alive():
+            logger.warning('Output of %r is not closed after %s sec', self, CLOSE_TIMEOUT)
+
+        self._thread = None
+
+    @abc.abstractmethod
+    def write_line(self, line):
+        pass
+
+    def flush(self):
+        """
+        Will be called after each chunk of output
+        """
+        pass
+
+    def finish(self):
+        """
+        Will be called at end of output
+        """
+        pass
+
+    def _read(self, fd):
+        tail = b''
+
+        try:
+            while True:
+                data = os.read(fd, CHUNK_SIZE)
+
+                if not data:
+                    break
+
+                lines = (tail + data).split(b'\n')
+                tail = lines.pop()
+
+                for line in lines:
+                    self.write_line(line[:self.max_line] + b'\n')
+
+                if len(tail) > self.max_line:
+                    self.write_line(tail[:self.max_line] + b'\n')
+                    tail = b''
+
+                self.flush()
+
+            if tail:
+                self.write_line(tail)
+        except Exception:
+            logger.exception('Output reading error %r', self)
+        finally:
+            os.close(fd)
+            self.finish()
+
+
+class RingBuffer(PipeOutput):
+    """
+    Last lines of output in memory
+    """
+
+    def __init__(self, max_lines=1000, max_bytes=1024 * 1024, **kwargs):
+        super(RingBuffer, self).__init__(**kwargs)
+
+        self.max_bytes = max_bytes
+
+        self._lines = deque(maxlen=max_lines)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def write_line(self, line):
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self._size -= len(self._lines[0])
+
+            self._lines.append(line)
+            self._size += len(line)
+
+            while self._size > self.max_bytes and self._lines:
+                self._size -= len(self._lines.popleft())
+
+    def lines(self):
+        with self._lock:
+            return list(self._lines)
+
+    def getvalue(self):
+        return b''.join(self.lines())
+
+    def __repr__(self):
+        return '<RingBuffer lines={}>'.format(len(self._lines))
+
+
+class RotatingFile(PipeOutput):
+    """
+    Output to file which is rotated by size.
+    Rotated files are compressed by gzip in background thread,
+    so pipe is drained while large file is compressed.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=3, compress=True, **kwargs):
+        """
+        :param max_bytes: max size of file
+        :param backups: number of rotated files
+        """
+        super(RotatingFile, self).__init__(**kwargs)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+
+        self._file = None
+        self._size = 0
+        self._compressor = None
+
+    def _backup_path(self, index):
+        return '{}.{}{}'.format(self.path, index, '.gz' if self.compress else '')
+
+    def rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        # backups are shifted after previous file was compressed
+        self.wait_compressed()
+
+        if self.backups:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(self._backup_path(index)):
+                    os.rename(self._backup_path(index), self._backup_path(index + 1))
+
+            if self.compress:
+                source = '{}.1'.format(self.path)
+                os.rename(self.path, source)
+                self._compressor = threading.Thread(
+                    target=self._gzip, args=(source, self._backup_path(1)), name='noseapp_daemon.output.gzip',
+                )
+                self._compressor.daemon = True
+                self._compressor.start()
+            else:
+                os.rename(self.path, self._backup_path(1))
+        else:
+            os.unlink(self.path)
+
+    @staticmethod
+    def _gzip(source, destination):
+        try:
+            utils.gzip_file(source, destination)
+            os.unlink(source)
+        except Exception:
+            logger.exception('Compression error of "%s"', source)
+
+    def wait_compressed(self):
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def close(self):
+        super(RotatingFile, self).close()
+        self.wait_compressed()
+
+    def write_line(self, line):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+            self._size = os.fstat(self._file.fileno()).st_size
+
+        if self._size and self._size + len(line) > self.max_bytes:
+            self.rotate()
+            self._file = open(self.path, 'ab')
+            self._size = 0
+
+        self._file.write(line)
+        self._size += len(line)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __repr__(self):
+        return '<RotatingFile {}>'.format(self.path)
+
+
+class Sampled(PipeOutput):
+    """
+    Every n-th line of output is written to other policy
+    """
+
+    def __init__(self, target, every=100, **kwargs):
+        """
+        :param target: RingBuffer, RotatingFile or other pipe output
+        """
+        super(Sampled, self).__init__(**kwargs)
+
+        self.target = target
+        self.every = every
+
+        self._count = 0
+
+    def write_line(self, line):
+        if self._count % self.every == 0:
+            self.target.write_line(line)
+
+        self._count += 1
+
+    def flush(self):
+        self.target.flush()
+
+    def finish(self):
+        self.target.finish()
+
+    def __repr__(self):
+        return '<Sampled {!r} every {}>'.format(self.target, self.every)
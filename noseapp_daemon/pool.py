@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pool of identical daemons.
+
+Instances are created from template runner, each instance
+has unique name, port or unix socket, pid file and log files. Instances are
+labeled by name of pool, so pool can be selected by
+DaemonManagement.select_daemons('pool=<name>').
+
+Usage:
+    pool = management.add_pool(UWSGIDaemon(), port_option='--http-socket', port_format=':{}')
+    pool.scale_to(4)
+    pool.scale_to(2)
+"""
+
+import os
+import sys
+import logging
+import threading
+
+from noseapp_daemon import utils
+from noseapp_daemon import trace
+from noseapp_daemon.runner import rolling_restart
+
+
+logger = logging.getLogger(__name__)
+
+
+POOL_LABEL = 'pool'
+
+
+def indexed_path(path, index):
+    """
+    /var/log/daemon.log -> /var/log/daemon-1.log
+    """
+    if not path:
+        return None
+
+    root, ext = os.path.splitext(path)
+    return '{}-{}{}'.format(root, index, ext)
+
+
+class DaemonPool(object):
+    """
+    Group of daemons which are created from template
+    """
+
+    def __init__(self,
+                 template,
+                 name=None,
+                 port_option=None,
+                 port_format='{}',
+                 pid_option=None,
+                 configure=None,
+                 wait_ready=True,
+                 timeout=10,
+                 on_add=None,
+                 on_remove=None):
+        """
+        :type template: noseapp_daemon.runner.DaemonRunner
+        :param name: name of pool, name of template by default
+        :param port_option: cmd option which is set to unique port,
+            PORT_OPTION of presets by default if template does not listen
+            unix socket, unix sockets of instances are unique anyway
+        :param port_format: format of port option value, ':{}' for uwsgi sockets
+        :param pid_option: cmd option which is set to pid file of instance
+        :param configure: function with instance and index arguments
+            for other unique settings, output policies for example
+        :param wait_ready: wait for new instances are ready
+        :param on_add: function with instance argument, is called before start
+        :param on_remove: function with instance argument, is called after stop
+        """
+        self.template = template
+        self.name = name or template.name
+        self.port_option = port_option or (
+            None if getattr(template, 'unix_socket', None) else getattr(template, 'PORT_OPTION', None)
+        )
+        self.port_format = port_format
+        self.pid_option = pid_option
+        self.configure = configure
+        self.wait_ready = wait_ready
+        self.timeout = timeout
+        self.on_add = on_add
+        self.on_remove = on_remove
+
+        self._lock = threading.Lock()
+        self._daemons = []
+        self._counter = 0
+
+    @property
+    def daemons(self):
+        return list(self._daemons)
+
+    @property
+    def size(self):
+        return len(self._daemons)
+
+    def create(self):
+        """
+        Create instance from template, it is not started
+        """
+        with self._lock:
+            self._counter += 1
+            index = self._counter
+
+        template = self.template
+        output = lambda o: indexed_path(o, index) if isinstance(o, basestring) else None
+
+        daemon = template.clone(
+            '{}-{}'.format(self.name, index),
+            pid_file=indexed_path(template.pid_file.path, index),
+            stdout=output(template.stdout),
+            stderr=output(template.stderr),
+        )
+        daemon.labels[POOL_LABEL] = self.name
+
+        if self.port_option:
+            daemon.add_cmd_option(self.port_option, self.port_format.format(utils.RandomizePort.get()))
+        if self.pid_option and daemon.pid_file.path:
+            daemon.add_cmd_option(self.pid_option, daemon.pid_file.path)
+        if self.configure:
+            self.configure(daemon, index)
+
+        return daemon
+
+    def _start(self, daemon):
+        daemon.start()
+
+        if self.wait_ready:
+            daemon.wait_ready(timeout=self.timeout)
+
+    def scale_to(self, size):
+        """
+        Start or stop instances in parallel.
+        Last instances are stopped at first.
+
+        :return: list of started or stopped instances
+        """
+        size = max(0, int(size))
+
+        with trace.span('scale_to', self.name, size=size):
+            if size > self.size:
+                return self._grow(size - self.size)
+            if size < self.size:
+                return self._shrink(self.size - size)
+
+        return []
+
+    def _grow(self, count):
+        daemons = [self.create() for _ in range(count)]
+
+        for daemon in daemons:
+            if self.on_add:
+                self.on_add(daemon)
+            self._daemons.append(daemon)
+
+        try:
+            utils.run_parallel(self._start, daemons)
+        except BaseException:
+            # exception of cleanup replaces it on python 2
+            exc_info = sys.exc_info()
+            logger.error('Pool "%s" was not scaled, new instances will be stopped', self.name)
+
+            try:
+                self._shrink(count, daemons=daemons)
+            except BaseException as e:
+                logger.error('Pool "%s" cleanup error: %r', self.name, e)
+
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        return daemons
+
+    def _shrink(self, count, daemons=None):
+        if daemons is None:
+            daemons = self._daemons[-count:]
+
+        try:
+            # instances are not started again
+            utils.run_parallel(lambda d: d.cleanup(), daemons)
+        finally:
+            # instances are removed even if callback fails
+            self._daemons = [d for d in self._daemons if d not in daemons]
+
+            if self.on_remove:
+                for daemon in daemons:
+                    self.on_remove(daemon)
+
+        return daemons
+
+    def start(self):
+        utils.run_parallel(self._start, self.daemons)
+
+    def stop(self):
+        utils.run_parallel(lambda d: d.stop(), self.daemons)
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def rolling_restart(self, batch_size=1, drain=None, undrain=None):
+        rolling_restart(
+            self.daemons,
+            batch_size=batch_size,
+            timeout=self.timeout,
+            drain=drain,
+            undrain=undrain,
+        )
+
+    def __iter__(self):
+        return iter(self.daemons)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '<DaemonPool {} size={}>'.format(self.name, self.size)
@@ -1,32 +1,103 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import glob
+import json
+import stat
+import time
+import errno
+import shutil
+import signal
+import socket
+import hashlib
 import logging
+import threading
 import subprocess
 
+from noseapp_daemon import scope
 from noseapp_daemon import utils
+from noseapp_daemon.health import TCPProbe
+from noseapp_daemon.health import UnixSocketProbe
 from noseapp_daemon.runner import DaemonError
 from noseapp_daemon.runner import DaemonRunner
 
 
 logger = logging.getLogger(__name__)
 
+psutil = utils.LazyImport('psutil')
+urllib2 = utils.LazyImport('urllib2')
 
-class NGINXDaemon(DaemonRunner):
+
+class BinaryLookup(object):
     """
-    Preset for nginx daemon
+    Lazy lookup of preset bin file by BINARY_NAMES and DEFAULT_BIN.
+    PATH is not scanned at import, result is memoized until PATH is changed.
+    """
+
+    def __get__(self, instance, owner):
+        return utils.find_bin(owner.BINARY_NAMES, default=owner.DEFAULT_BIN)
+
+
+class PresetDaemon(DaemonRunner):
+    """
+    Declarative base for presets
 
     Usage:
-        from noseapp.daemon.presets import NGINXDaemon
+        class RedisDaemon(PresetDaemon):
+
+            DEFAULT_NAME = 'redis'
+            BINARY_NAMES = ('redis-server',)
+            OPTION_SEPARATOR = ' '
+            DEFAULT_OPTIONS = (('--daemonize', 'no'),)
+            PORT_OPTION = '--port'
+            DEFAULT_PORT = 6379
+            SOCKET_OPTION = '--unixsocket'
+            SOCKET_OPTIONS = (('--port', 0),)
+            STATE_PATHS = ('dump.rdb', 'appendonly.aof')
 
-        nginx = NGINXDaemon()
-        nginx.add_option('-c', '/path/to/config_file.cfg')
-        nginx.start()
+        redis = RedisDaemon(unix_socket=True)
+        redis.unix_socket  # /tmp/noseapp_daemon/sockets/<pid>/redis-1.sock
     """
 
-    DEFAULT_NAME = 'nginx'
-    DAEMON_BIN = utils.which('nginx', default='/usr/sbin/nginx')
+    DEFAULT_NAME = None
+    # candidates of command name
+    BINARY_NAMES = ()
+    DEFAULT_BIN = ''
+    DAEMON_BIN = BinaryLookup()
+    # pairs of (option, value) which will be added at init
+    DEFAULT_OPTIONS = ()
+    # readiness probe is tcp connection to port from this option
+    PORT_OPTION = None
+    DEFAULT_PORT = None
+    # readiness probe is connection to unix socket from this option if it is set
+    SOCKET_OPTION = None
+    # pairs of (option, value) which will be added with unix socket
+    SOCKET_OPTIONS = ()
+    # stop policy
+    STOP_SIGNAL = signal.SIGTERM
+    STOP_TIMEOUT = 10
+    # reload strategy, reload is not supported if None
+    RELOAD_SIGNAL = None
+    # globs of state files relative to working directory
+    STATE_PATHS = ()
+    # reset strategy of scoped daemon, see noseapp_daemon.scope
+    RESET_STRATEGY = None
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param unix_socket: path to unix socket or True for unique path
+        """
+        unix_socket = kwargs.pop('unix_socket', None)
+
+        super(PresetDaemon, self).__init__(*args, **kwargs)
+
+        for opt, value in self.DEFAULT_OPTIONS:
+            if self.get_cmd_option(opt) is None:
+                self.add_cmd_option(opt, value)
+
+        if unix_socket:
+            self.listen_unix_socket(None if unix_socket is True else unix_socket)
 
     @property
     def name(self):
@@ -34,43 +105,659 @@ class NGINXDaemon(DaemonRunner):
             return self._name
         return self.DEFAULT_NAME
 
+    @property
+    def port(self):
+        if not self.PORT_OPTION:
+            return None
+        return int(self.get_cmd_option(self.PORT_OPTION, self.DEFAULT_PORT))
+
+    @property
+    def unix_socket(self):
+        if not self.SOCKET_OPTION:
+            return None
+        return self.get_cmd_option(self.SOCKET_OPTION)
+
+    def listen_unix_socket(self, path=None):
+        """
+        Listen unix socket by SOCKET_OPTION
+
+        :param path: unique path in directory of current run by default
+        :return: path to socket
+        """
+        if not self.SOCKET_OPTION:
+            raise DaemonError('Unix socket is not supported by "{}"'.format(self.name))
+
+        if path:
+            self.sockets.append(path)
+            self.add_cmd_option(self.SOCKET_OPTION, path)
+        else:
+            path = self.allocate_socket(self.SOCKET_OPTION)
+
+        for opt, value in self.SOCKET_OPTIONS:
+            self.add_cmd_option(opt, value)
+
+        return path
+
+    @property
+    def main_pid(self):
+        pid = self.pid_file.pid
+
+        if pid:
+            return pid
+
+        if self.process:
+            return self.process.pid
+
+        return None
+
+    def ready_probe(self):
+        """
+        To get probe for readiness check or None
+        """
+        if self.unix_socket:
+            return UnixSocketProbe(self.unix_socket)
+        if self.port:
+            return TCPProbe(self.port)
+        return None
+
+    @property
+    def ready(self):
+        probe = self.ready_probe()
+
+        if not self.started or probe is None:
+            return self.started
+
+        try:
+            return bool(probe())
+        except (socket.error, IOError):
+            return False
+
+    def send_signal(self, sig):
+        pid = self.main_pid
+
+        if not pid:
+            raise DaemonError('Main pid of "{}" is unknown'.format(self.name))
 
-class TarantoolDaemon(DaemonRunner):
+        os.kill(pid, sig)
+
+    def reload(self):
+        """
+        Reload daemon by RELOAD_SIGNAL or restart
+        """
+        if self.RELOAD_SIGNAL is None:
+            return self.restart()
+
+        self.send_signal(self.RELOAD_SIGNAL)
+
+    def worker_pids(self):
+        """
+        To get pids of workers which are replaced by reload
+        or None if they are unknown
+        """
+        return None
+
+    def wait_reloaded(self, pids, timeout=10, interval=0.05):
+        """
+        Reload is asynchronous, it is done when workers
+        which were alive before it are replaced
+
+        :param pids: result of worker_pids before reload
+        :raises: DaemonError if timeout was expired
+        """
+        def is_reloaded():
+            current = self.worker_pids()
+            return bool(current) and not current & pids
+
+        if not utils.wait_for(is_reloaded, timeout=timeout, interval=interval):
+            raise DaemonError(
+                'Workers of "{}" are not reloaded after {} sec'.format(self.name, timeout),
+            )
+
+    def stop(self, recursive=True):
+        pid = self.main_pid
+
+        if self.started and pid and self.STOP_SIGNAL != signal.SIGTERM:
+            try:
+                os.kill(pid, self.STOP_SIGNAL)
+            except OSError:
+                pass
+            else:
+                utils.wait_for(
+                    lambda: not utils.process_is_alive(pid), timeout=self.STOP_TIMEOUT,
+                )
+
+        super(PresetDaemon, self).stop(recursive=recursive)
+
+    @classmethod
+    def remove_state(cls, cwd=None):
+        """
+        Remove files matched by STATE_PATHS
+        """
+        cwd = cwd or os.getcwd()
+
+        for pattern in cls.STATE_PATHS:
+            for filename in glob.iglob(os.path.join(cwd, pattern)):
+                os.unlink(filename)
+
+    def save_state(self, path):
+        """
+        Copy files matched by STATE_PATHS to directory.
+        Daemon must write its state to files before it.
+        """
+        cwd = self.working_dir
+
+        for pattern in self.STATE_PATHS:
+            for filename in glob.iglob(os.path.join(cwd, pattern)):
+                target = os.path.join(path, os.path.relpath(filename, cwd))
+
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+
+                shutil.copy2(filename, target)
+
+    def restore_state(self, path):
+        """
+        Restart daemon with state files which were saved by save_state
+        """
+        self.stop()
+
+        cwd = self.prepare_workdir()
+        self.remove_state(cwd=cwd)
+
+        for root, _, files in os.walk(path):
+            target_dir = os.path.join(cwd, os.path.relpath(root, path))
+
+            if not os.path.isdir(target_dir):
+                os.makedirs(target_dir)
+
+            for filename in files:
+                shutil.copy2(os.path.join(root, filename), target_dir)
+
+        self.start()
+
+
+def parse_stub_status(text):
     """
-    Preset for tarantool box
+    Parse output of nginx stub_status module
+
+    :rtype: dict
+    """
+    numbers = [int(n) for n in re.findall(r'\d+', text)]
+
+    if len(numbers) != 7:
+        raise ValueError('Unknown stub_status format: {!r}'.format(text))
+
+    keys = (
+        'active', 'accepts', 'handled', 'requests',
+        'reading', 'writing', 'waiting',
+    )
+
+    return dict(zip(keys, numbers))
+
+
+# directive starts config or follows other directive or block
+NGINX_DIRECTIVE_RE = r'(?:^|[;{{}}])\s*{}\s+([^\s;]+)'
+NGINX_DEFAULT_PORT = 80
+
+
+def parse_listen(value):
+    """
+    Parse address of nginx listen directive
+
+    :return: port or path to unix socket
+    """
+    if value.startswith('unix:'):
+        return value[len('unix:'):]
+
+    port = value.rpartition(':')[2]
+
+    if port.isdigit():
+        return int(port)
+
+    # host without port
+    return NGINX_DEFAULT_PORT
+
+
+def nginx_config_files(config_file, prefix=None, seen=None):
+    """
+    Walk nginx config and included files
+
+    :param prefix: directory of relative includes, directory of config by default
+    :return: list of (path, content) in order of includes
+    """
+    prefix = prefix or os.path.dirname(os.path.abspath(config_file))
+    seen = set() if seen is None else seen
+
+    if config_file in seen:
+        return []
+    seen.add(config_file)
+
+    try:
+        with open(config_file, 'rb') as fp:
+            content = fp.read()
+    except IOError:
+        return []
+
+    files = [(config_file, content)]
+    text = re.sub(r'#.*', '', content)
+
+    for pattern in re.findall(NGINX_DIRECTIVE_RE.format('include'), text):
+        for path in sorted(glob.glob(os.path.join(prefix, pattern))):
+            files.extend(nginx_config_files(path, prefix=prefix, seen=seen))
+
+    return files
+
+
+def nginx_listeners(config_file):
+    """
+    Listeners of nginx config and included files
+
+    :return: set of ports and paths to unix sockets
+    """
+    listeners = set()
+
+    for _, content in nginx_config_files(config_file):
+        text = re.sub(r'#.*', '', content)
+        listeners.update(
+            parse_listen(value) for value in re.findall(NGINX_DIRECTIVE_RE.format('listen'), text)
+        )
+
+    return listeners
+
+
+class NGINXDaemon(PresetDaemon):
+    """
+    Preset for nginx daemon
 
     Usage:
         from noseapp.daemon.presets import NGINXDaemon
 
-        tnt = TarantoolDaemon()
-        tnt.add_option('-c', '/path/to/config_file.cfg')
-        tnt.start()
+        nginx = NGINXDaemon(pid_file='/path/to/nginx.pid')
+        nginx.add_cmd_option('-c', '/path/to/config_file.cfg')
+        nginx.start()  # config will be tested before
+        nginx.wait_ready()
+
+        nginx.reload()
+        nginx.upgrade()
+        nginx.stub_status('http://127.0.0.1:8080/status')
     """
 
-    DEFAULT_NAME = 'tarantool'
-    DAEMON_BIN = utils.which('tarantool_box')
+    DEFAULT_NAME = 'nginx'
+    BINARY_NAMES = ('nginx',)
+    DEFAULT_BIN = '/usr/sbin/nginx'
+    OPTION_SEPARATOR = ' '
+    RELOAD_SIGNAL = signal.SIGHUP
+
+    # successful config tests by (cmd, hash of config)
+    config_test_cache = set()
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param stub_status_url: url of stub_status location
+        :param listen: ports and paths to unix sockets which
+            are checked by readiness, they are read from config by default
+        """
+        self.stub_status_url = kwargs.pop('stub_status_url', None)
+        self.listen = kwargs.pop('listen', None)
+        super(NGINXDaemon, self).__init__(*args, **kwargs)
 
     @property
-    def name(self):
-        if self._name:
-            return self._name
-        return self.DEFAULT_NAME
+    def config_file(self):
+        return self.get_cmd_option('-c')
 
-    @staticmethod
-    def remove_snapshots(cwd=os.getcwd()):
-        logger.debug('Remove tarantool snapshots')
+    @property
+    def master_pid(self):
+        return self.main_pid
 
-        with utils.cd(cwd):
-            for filename in glob.iglob('*.snap'):
-                os.unlink(filename)
+    def listeners(self):
+        """
+        Ports and paths to unix sockets of daemon
 
-            for filename in glob.iglob('*.xlog'):
-                os.unlink(filename)
+        :rtype: set
+        """
+        if self.listen is not None:
+            return set(self.listen)
+
+        if not self.config_file:
+            return set()
+
+        return nginx_listeners(os.path.join(self.working_dir, self.config_file))
+
+    @property
+    def ready(self):
+        """
+        Master has workers and all listeners of config are bound.
+        Bound unix sockets are listening, there are no listen status of them.
+        Any listening port is enough if listeners are unknown.
+        """
+        try:
+            master = psutil.Process(self.master_pid)
+
+            if not master.children():
+                return False
+
+            bound = set()
+
+            for c in master.connections('all'):
+                if c.family == socket.AF_UNIX:
+                    if c.laddr:
+                        bound.add(c.laddr)
+                elif c.status == psutil.CONN_LISTEN:
+                    bound.add(c.laddr[1])
+        except (psutil.NoSuchProcess, psutil.AccessDenied, ValueError, TypeError):
+            return False
+
+        listeners = self.listeners()
+
+        if listeners:
+            return listeners <= bound
+
+        return any(isinstance(b, int) for b in bound)
+
+    def worker_pids(self):
+        """
+        Workers, cache manager and loader are replaced by SIGHUP
+        """
+        try:
+            return frozenset(p.pid for p in psutil.Process(self.master_pid).children())
+        except (psutil.NoSuchProcess, ValueError, TypeError):
+            return frozenset()
+
+    def config_hash(self):
+        """
+        Hash of config with included files
+        """
+        config_file = self.config_file
+        digest = hashlib.sha1()
+
+        if not config_file:
+            return digest.hexdigest()
+
+        for path, content in nginx_config_files(os.path.join(self.working_dir, config_file)):
+            digest.update(path)
+            digest.update(b'\0')
+            digest.update(content)
+
+        return digest.hexdigest()
+
+    def test_config(self):
+        """
+        Run "nginx -t" with working directory and environment of daemon,
+        relative paths of config are resolved as at start.
+        Successful result is cached by hash of config file.
+
+        :raises: DaemonError if config is invalid
+        """
+        cmd = self.get_cmd() + ' -t'
+        cwd = self.prepare_workdir() if self.cwd or self.temp_workdir else None
+        key = (cmd, cwd, self.config_hash())
+
+        if key in self.config_test_cache:
+            return
+
+        process = subprocess.Popen(
+            cmd,
+            shell=True,
+            cwd=cwd,
+            env=utils.make_env(self.env) if self.env else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        output, _ = process.communicate()
+
+        if process.returncode != 0:
+            raise DaemonError(
+                'Config test of "{}" was failed: {}'.format(self.name, output.strip()),
+            )
+
+        self.config_test_cache.add(key)
+
+    def start(self, **kwargs):
+        if not self.started:
+            self.test_config()
+
+        super(NGINXDaemon, self).start(**kwargs)
+
+    def reload(self):
+        """
+        Graceful reload of config
+        """
+        self.test_config()
+        super(NGINXDaemon, self).reload()
+
+    def upgrade(self, timeout=10):
+        """
+        Upgrade of binary without downtime.
+        New master is started by USR2, old master is stopped by QUIT.
+        Pid file is required.
+        """
+        if not self.pid_file.path:
+            raise DaemonError('Pid file is required for upgrade of "{}"'.format(self.name))
+
+        old_pid = self.master_pid
+        old_bin_pid_file = utils.PidFileObject(self.pid_file.path + '.oldbin')
+
+        self.send_signal(signal.SIGUSR2)
+
+        def new_master_started():
+            return old_bin_pid_file.exist and self.pid_file.pid not in (None, old_pid)
+
+        if not utils.wait_for(new_master_started, timeout=timeout):
+            raise DaemonError('New master of "{}" is not started'.format(self.name))
+
+        os.kill(old_pid, signal.SIGQUIT)
+
+        if not utils.wait_for(lambda: not utils.process_is_alive(old_pid), timeout=timeout):
+            raise DaemonError('Old master of "{}" is not stopped'.format(self.name))
+
+    def stub_status(self, url=None, timeout=1.0):
+        """
+        Read counters from stub_status location
+
+        :rtype: dict
+        """
+        response = urllib2.urlopen(url or self.stub_status_url, timeout=timeout)
+
+        try:
+            return parse_stub_status(response.read())
+        finally:
+            response.close()
+
+
+def lua_literal(value):
+    """
+    Convert python value to lua literal
+    """
+    if value is None:
+        return 'nil'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, long, float)):
+        return repr(value).rstrip('L')
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    if isinstance(value, bytes):
+        return "'{}'".format(
+            value.replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n'),
+        )
+    if isinstance(value, dict):
+        return '{{{}}}'.format(', '.join(
+            '[{}] = {}'.format(lua_literal(k), lua_literal(v)) for k, v in value.items()
+        ))
+    if isinstance(value, (list, tuple)):
+        return '{{{}}}'.format(', '.join(lua_literal(v) for v in value))
+
+    raise TypeError('Can not convert {!r} to lua'.format(value))
+
+
+class TarantoolDaemon(PresetDaemon):
+    """
+    Preset for tarantool box
+
+    Usage:
+        from noseapp.daemon.presets import TarantoolDaemon
+
+        tnt = TarantoolDaemon(admin_port=33015, fixtures='/path/to/fixtures.lua')
+        tnt.add_cmd_option('-c', '/path/to/config_file.cfg')
+        tnt.start()  # wait for admin port and load fixtures
+    """
+
+    DEFAULT_NAME = 'tarantool'
+    BINARY_NAMES = ('tarantool_box',)
+    STATE_PATHS = ('*.snap', '*.xlog')
+
+    # format of admin console commands
+    LUA_COMMAND = 'lua {}'
+    INSERT_COMMAND = 'box.insert({space}, {values})'
+    # end of admin console response
+    RESPONSE_END = b'\n...\n'
+
+    READY_TIMEOUT = 10
+    SOCKET_TIMEOUT = 30
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param admin_port: port of admin console
+        :param primary_port: port of binary protocol
+        :param fixtures: path to lua script or msgpack stream
+            which will be loaded after start
+        """
+        self.host = kwargs.pop('host', '127.0.0.1')
+        self.admin_port = kwargs.pop('admin_port', None)
+        self.primary_port = kwargs.pop('primary_port', None)
+        self.fixtures = kwargs.pop('fixtures', None)
+
+        super(TarantoolDaemon, self).__init__(*args, **kwargs)
+
+    def ready_probe(self):
+        """
+        Admin or primary port accepts connections
+        """
+        port = self.admin_port or self.primary_port
+
+        if port:
+            return TCPProbe(port, host=self.host)
+        return None
+
+    def start(self, **kwargs):
+        started = self.started
+
+        super(TarantoolDaemon, self).start(**kwargs)
+
+        if self.fixtures and not started:
+            self.wait_ready(timeout=self.READY_TIMEOUT)
+            self.load_fixtures(self.fixtures)
+
+    def read_fixtures(self, path):
+        """
+        To get admin console commands from fixtures file.
+        Lua script contains one statement per line.
+        Msgpack stream contains [space, [field, ...]] items.
+        """
+        if path.endswith(('.msgpack', '.mp')):
+            import msgpack
+
+            with open(path, 'rb') as fp:
+                for space, values in msgpack.Unpacker(fp):
+                    yield self.LUA_COMMAND.format(
+                        self.INSERT_COMMAND.format(
+                            space=lua_literal(space),
+                            values=', '.join(lua_literal(v) for v in values),
+                        ),
+                    )
+        else:
+            with open(path) as fp:
+                for line in fp:
+                    line = line.strip()
+                    if line and not line.startswith('--'):
+                        yield self.LUA_COMMAND.format(line)
+
+    def load_fixtures(self, path):
+        """
+        Send all fixtures to admin console in one pass.
+        Commands are written by pipeline, responses are read concurrently.
+
+        :return: (rows, rows per second)
+        """
+        if not self.admin_port:
+            raise DaemonError('Admin port of "{}" is required for fixtures'.format(self.name))
+
+        payload = ''.join(
+            '{}\n'.format(command) for command in self.read_fixtures(path)
+        )
+        rows = payload.count('\n')
+
+        logger.debug('Load %s rows to tarantool "%s" from "%s"', rows, self.name, path)
+
+        sock = socket.create_connection((self.host, self.admin_port), timeout=self.SOCKET_TIMEOUT)
+        start = time.time()
+
+        try:
+            writer = threading.Thread(target=sock.sendall, args=(payload,))
+            writer.daemon = True
+            writer.start()
+
+            responses = 0
+            buff = b''
+
+            while responses < rows:
+                chunk = sock.recv(64 * 1024)
+                if not chunk:
+                    raise DaemonError('Connection to "{}" was closed'.format(self.name))
+
+                buff += chunk
+                end = buff.rfind(self.RESPONSE_END)
+
+                if end < 0:
+                    continue
+
+                done, buff = buff[:end], buff[end + len(self.RESPONSE_END):]
+
+                if b'error:' in done:
+                    raise DaemonError(
+                        'Fixtures loading of "{}" error: {}'.format(self.name, done.strip()),
+                    )
+
+                responses += done.count(self.RESPONSE_END) + 1
+
+            writer.join()
+        finally:
+            sock.close()
+
+        elapsed = time.time() - start
+        rate = rows / elapsed if elapsed else float(rows)
+
+        logger.info(
+            'Tarantool "%s": %s rows were loaded in %.3f sec (%.0f rows/sec)',
+            self.name, rows, elapsed, rate,
+        )
+
+        return rows, rate
+
+    def restore_state(self, path):
+        """
+        Fixtures are not loaded, they are in restored snapshot
+        """
+        fixtures, self.fixtures = self.fixtures, None
+
+        try:
+            super(TarantoolDaemon, self).restore_state(path)
+        finally:
+            self.fixtures = fixtures
+
+    @classmethod
+    def remove_snapshots(cls, cwd=None):
+        logger.debug('Remove tarantool snapshots')
+        cls.remove_state(cwd=cwd)
 
     def init_storage(self, **kwargs):
         logger.debug('Init tarantool storage')
 
         kwargs.update(shell=True)
+        kwargs.setdefault('cwd', self.prepare_workdir())
+        if self.env:
+            kwargs.setdefault('env', utils.make_env(self.env))
+
         cmd_options = ' --init-storage'
         cmd = self.get_cmd() + cmd_options
         exit_code = subprocess.call(cmd, **kwargs)
@@ -79,13 +766,326 @@ class TarantoolDaemon(DaemonRunner):
             raise DaemonError('Init storage error')
 
 
-class UWSGIDaemon(DaemonRunner):
+class UWSGIDaemon(PresetDaemon):
+    """
+    Preset for uwsgi daemon with stats server and master fifo
+
+    Usage:
+        from noseapp.daemon.presets import UWSGIDaemon
+
+        uwsgi = UWSGIDaemon(unix_socket=True)
+        uwsgi.add_cmd_option('--ini', '/path/to/config.ini')
+        uwsgi.start()
+        uwsgi.wait_ready()
+
+        uwsgi.workers()  # [{'id': 1, 'requests': 0, 'rss': 0, 'status': 'idle', ...}]
+        uwsgi.wait_idle()
+        uwsgi.add_workers(2)
+    """
 
     DEFAULT_NAME = 'uwsgi'
-    DAEMON_BIN = utils.which('uwsgi', default='/usr/local/bin/uwsgi')
+    BINARY_NAMES = ('uwsgi',)
+    DEFAULT_BIN = '/usr/local/bin/uwsgi'
+    # uwsgi protocol socket for nginx
+    SOCKET_OPTION = '--socket'
+    # workers are respawned by master fifo
+    RESET_STRATEGY = scope.RESET_RELOAD
+
+    STATS_TIMEOUT = 1.0
+    STATS_BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param stats_socket: path to unix socket of stats server
+        :param master_fifo: path to master fifo
+        """
+        stats_socket = kwargs.pop('stats_socket', None)
+        master_fifo = kwargs.pop('master_fifo', None)
+
+        super(UWSGIDaemon, self).__init__(*args, **kwargs)
+
+        if stats_socket:
+            self.sockets.append(stats_socket)
+            self.add_cmd_option('--stats', stats_socket)
+        else:
+            self.allocate_socket('--stats', name='{}-stats'.format(self.name))
+
+        self.add_cmd_option('--master-fifo', master_fifo or self._runtime_path('fifo'))
 
     @property
-    def name(self):
-        if self._name:
-            return self._name
-        return self.DEFAULT_NAME
+    def stats_socket(self):
+        return self.get_cmd_option('--stats')
+
+    @property
+    def master_fifo(self):
+        return self.get_cmd_option('--master-fifo')
+
+    def clone(self, name, **kwargs):
+        """
+        Copy gets own master fifo, sockets are copied by DaemonRunner.clone
+        """
+        daemon = super(UWSGIDaemon, self).clone(name, **kwargs)
+        daemon.add_cmd_option('--master-fifo', daemon._runtime_path('fifo'))
+
+        return daemon
+
+    def remove_fifo(self):
+        try:
+            if stat.S_ISFIFO(os.stat(self.master_fifo).st_mode):
+                os.unlink(self.master_fifo)
+        except OSError:
+            pass
+
+    def start(self, **kwargs):
+        if not self.started:
+            self.remove_fifo()
+
+        super(UWSGIDaemon, self).start(**kwargs)
+
+    def stop(self, recursive=True):
+        super(UWSGIDaemon, self).stop(recursive=recursive)
+        self.remove_fifo()
+
+    @property
+    def ready(self):
+        """
+        All workers are accepting requests
+        """
+        if not self.started:
+            return False
+
+        try:
+            workers = self.workers()
+        except (socket.error, ValueError):
+            return False
+
+        active = [w for w in workers if w.get('status') != 'cheap']
+
+        return bool(active) and all(
+            w.get('accepting', 1) and w.get('status') in ('idle', 'busy')
+            for w in active
+        )
+
+    def _runtime_path(self, suffix):
+        return os.path.join(
+            utils.socket_dir(),
+            '{}-{}.{}'.format(self.name, id(self), suffix),
+        )
+
+    def stats(self):
+        """
+        Read json from stats server
+
+        :rtype: dict
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.STATS_TIMEOUT)
+
+        try:
+            sock.connect(self.stats_socket)
+            chunks = []
+
+            while True:
+                chunk = sock.recv(self.STATS_BUFFER_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+
+        return json.loads(b''.join(chunks).decode('utf-8'))
+
+    def workers(self):
+        """
+        To get list of workers stats with requests, rss and status
+        """
+        return self.stats().get('workers', [])
+
+    def worker_pids(self):
+        """
+        Workers are respawned by reload, cheap workers have no pid
+        """
+        try:
+            return frozenset(w['pid'] for w in self.workers() if w.get('pid'))
+        except (socket.error, ValueError):
+            return frozenset()
+
+    def busy_workers(self):
+        return [w for w in self.workers() if w.get('status') == 'busy']
+
+    def wait_idle(self, timeout=10, interval=0.05):
+        """
+        Wait for all workers have done requests
+
+        :raises: DaemonError if timeout was expired
+        """
+        def is_idle():
+            try:
+                return not self.busy_workers()
+            except (socket.error, ValueError):
+                return False
+
+        if not utils.wait_for(is_idle, timeout=timeout, interval=interval):
+            raise DaemonError(
+                'Workers of "{}" are busy after {} sec'.format(self.name, timeout),
+            )
+
+    def send_fifo_command(self, command):
+        """
+        Write command to master fifo
+
+        :param command: see uwsgi master fifo docs
+        """
+        try:
+            fd = os.open(self.master_fifo, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENXIO):
+                raise DaemonError(
+                    'Master fifo "{}" is not opened by uwsgi'.format(self.master_fifo),
+                )
+            raise
+
+        try:
+            os.write(fd, command.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def add_workers(self, count=1):
+        """
+        Spawn workers in cheaper mode
+        """
+        self.send_fifo_command('+' * count)
+
+    def remove_workers(self, count=1):
+        """
+        Stop workers in cheaper mode
+        """
+        self.send_fifo_command('-' * count)
+
+    def scale_workers(self, count):
+        """
+        Change number of active workers to count
+        """
+        active = len([w for w in self.workers() if w.get('status') != 'cheap'])
+
+        if count > active:
+            self.add_workers(count - active)
+        elif count < active:
+            self.remove_workers(active - count)
+
+    def reload(self):
+        """
+        Graceful reload of workers
+        """
+        self.send_fifo_command('r')
+
+
+class RedisDaemon(PresetDaemon):
+    """
+    Preset for redis server
+
+    Usage:
+        redis = RedisDaemon()
+        redis.add_cmd_option('--port', 6380)
+        redis.start()
+        redis.wait_ready()
+    """
+
+    DEFAULT_NAME = 'redis'
+    BINARY_NAMES = ('redis-server',)
+    OPTION_SEPARATOR = ' '
+    DEFAULT_OPTIONS = (('--daemonize', 'no'),)
+    PORT_OPTION = '--port'
+    DEFAULT_PORT = 6379
+    SOCKET_OPTION = '--unixsocket'
+    # tcp listener is disabled
+    SOCKET_OPTIONS = (('--port', 0),)
+    STATE_PATHS = ('dump.rdb', 'appendonly.aof')
+
+
+class MemcachedDaemon(PresetDaemon):
+    """
+    Preset for memcached
+    """
+
+    DEFAULT_NAME = 'memcached'
+    BINARY_NAMES = ('memcached',)
+    OPTION_SEPARATOR = ' '
+    PORT_OPTION = '-p'
+    DEFAULT_PORT = 11211
+    # tcp listener is disabled by unix socket
+    SOCKET_OPTION = '-s'
+
+
+class PostgresDaemon(PresetDaemon):
+    """
+    Preset for postgres server.
+    Data directory must be created by initdb.
+    State is copy of data directory which is made after shutdown.
+
+    Usage:
+        postgres = PostgresDaemon()
+        postgres.add_cmd_option('-D', '/path/to/data')
+        postgres.start()
+    """
+
+    DEFAULT_NAME = 'postgres'
+    BINARY_NAMES = ('postgres',)
+    OPTION_SEPARATOR = ' '
+    PORT_OPTION = '-p'
+    DEFAULT_PORT = 5432
+    # fast shutdown
+    STOP_SIGNAL = signal.SIGINT
+    RELOAD_SIGNAL = signal.SIGHUP
+    # reload of config does not reset data, it is restored from copy
+    RESET_STRATEGY = scope.RESET_RESTORE
+
+    SNAPSHOT_NAME = 'data'
+
+    @property
+    def data_dir(self):
+        """
+        Data directory from -D option or PGDATA
+        """
+        data_dir = self.get_cmd_option('-D') or (self.env or {}).get('PGDATA')
+
+        if not data_dir:
+            return None
+
+        return os.path.join(self.working_dir, data_dir)
+
+    def _require_data_dir(self):
+        if not self.data_dir:
+            raise DaemonError('Data directory of "{}" is unknown'.format(self.name))
+
+        return self.data_dir
+
+    def save_state(self, path):
+        """
+        Copy data directory.
+        Copy is consistent after shutdown only, so daemon is restarted.
+        """
+        data_dir = self._require_data_dir()
+        started = self.started
+
+        self.stop()
+
+        try:
+            shutil.copytree(data_dir, os.path.join(path, self.SNAPSHOT_NAME))
+        finally:
+            if started:
+                self.start()
+                self.wait_ready()
+
+    def restore_state(self, path):
+        """
+        Restart daemon with data directory which was saved by save_state
+        """
+        data_dir = self._require_data_dir()
+
+        self.stop()
+
+        shutil.rmtree(data_dir, ignore_errors=True)
+        shutil.copytree(os.path.join(path, self.SNAPSHOT_NAME), data_dir)
+
+        self.start()
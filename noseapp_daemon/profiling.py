@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+Profiling of daemons.
+
+Command profilers launch daemon under wrapper by command prefix,
+sampling profiler samples cpu and memory of daemon by psutil.
+Artifacts are written to directory of current test,
+see noseapp_daemon.artifacts.
+
+Usage:
+    from noseapp_daemon.profiling import PerfProfiler
+
+    daemon = MyDaemon('my_daemon', profiler=PerfProfiler(frequency=99))
+    daemon.start()
+    ...
+    daemon.stop()
+    daemon.artifact_dir  # perf.data is here
+"""
+
+import os
+import signal
+import logging
+
+from noseapp_daemon import utils
+from noseapp_daemon import artifacts
+
+
+logger = logging.getLogger(__name__)
+
+psutil = utils.LazyImport('psutil')
+
+
+# bytes
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# file extensions of py-spy output formats
+PY_SPY_EXTENSIONS = {
+    'speedscope': 'json',
+    'flamegraph': 'svg',
+    'raw': 'txt',
+}
+
+
+class Profiler(object):
+    """
+    Base class of profilers
+    """
+
+    KIND = 'profile'
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param max_size: max size of artifacts in bytes, profilers
+            bound writing by it, artifacts of wrappers which can not
+            bound output are removed if it was exceeded
+        """
+        self.max_size = max_size
+
+    def remaining_size(self, artifact_dir):
+        """
+        Bytes which can be written to artifact directory, None if size is not bounded
+        """
+        if self.max_size is None:
+            return None
+
+        return max(self.max_size - artifacts.files_size(artifact_dir), 0)
+
+    def command_prefix(self, artifact_dir):
+        """
+        :return: command line prefix or None
+        """
+        return None
+
+    def start(self, daemon, artifact_dir):
+        """
+        Will be called after daemon was launched
+        """
+        pass
+
+    def stop(self, daemon, artifact_dir):
+        """
+        Will be called before daemon will be terminated
+        """
+        pass
+
+    def collect(self, daemon, artifact_dir):
+        """
+        Will be called after daemon was terminated
+
+        :return: list of artifacts
+        """
+        size = artifacts.files_size(artifact_dir)
+
+        if self.max_size is not None and size > self.max_size:
+            logger.warning(
+                'Profile of daemon "%s" is removed, size %s is more than %s bytes',
+                daemon.name, size, self.max_size,
+            )
+            for name in os.listdir(artifact_dir):
+                os.unlink(os.path.join(artifact_dir, name))
+
+        return sorted(
+            os.path.join(artifact_dir, name) for name in os.listdir(artifact_dir)
+        )
+
+
+class CommandProfiler(Profiler):
+    """
+    Profiler which launches daemon.
+    Signal is sent to profiler before termination
+    of daemon, so profile can be written.
+    """
+
+    COMMAND = None
+    STOP_SIGNAL = signal.SIGINT
+    FLUSH_TIMEOUT = 10
+
+    def __init__(self, command=None, **kwargs):
+        """
+        :param command: command prefix, "{dir}" is replaced by artifact directory
+        """
+        super(CommandProfiler, self).__init__(**kwargs)
+
+        self.command = command or self.COMMAND
+
+    def command_prefix(self, artifact_dir):
+        return self.command.format(dir=artifact_dir)
+
+    def stop(self, daemon, artifact_dir):
+        if not daemon.process or daemon.is_dead:
+            return
+
+        try:
+            os.kill(daemon.process.pid, self.STOP_SIGNAL)
+        except OSError:
+            return
+
+        # process is waited by reaper only
+        if daemon.exit_future.result(timeout=self.FLUSH_TIMEOUT) is None:
+            logger.warning('Profiler of daemon "%s" was not stopped in %s sec', daemon.name, self.FLUSH_TIMEOUT)
+
+
+class PerfProfiler(CommandProfiler):
+    """
+    Linux perf sampling profiler.
+    Overhead is bounded by sampling frequency.
+    """
+
+    def __init__(self, frequency=99, call_graph=True, **kwargs):
+        max_size = kwargs.get('max_size', DEFAULT_MAX_SIZE)
+
+        # perf stops writing at max size
+        command = 'perf record -F {} {} {}-o {{dir}}/perf.data --'.format(
+            int(frequency),
+            '-g' if call_graph else '',
+            '--max-size={}K '.format(max_size // 1024) if max_size else '',
+        )
+        super(PerfProfiler, self).__init__(command=command, **kwargs)
+
+
+class PySpyProfiler(CommandProfiler):
+    """
+    Sampling profiler of python daemons
+    """
+
+    def __init__(self, rate=100, output_format='speedscope', subprocesses=True, **kwargs):
+        command = 'py-spy record --rate {} --format {} {} -o {{dir}}/profile.{} --'.format(
+            int(rate),
+            output_format,
+            '--subprocesses' if subprocesses else '',
+            PY_SPY_EXTENSIONS.get(output_format, 'out'),
+        )
+        super(PySpyProfiler, self).__init__(command=command, **kwargs)
+
+
+class MassifProfiler(CommandProfiler):
+    """
+    Heap profiler of valgrind.
+    Size of profile is bounded by number of snapshots.
+    """
+
+    STOP_SIGNAL = signal.SIGTERM
+
+    def __init__(self, max_snapshots=100, **kwargs):
+        command = 'valgrind --tool=massif --max-snapshots={} --massif-out-file={{dir}}/massif.out.%p'.format(
+            int(max_snapshots),
+        )
+        super(MassifProfiler, self).__init__(command=command, **kwargs)
+
+
+class SamplingProfiler(Profiler):
+    """
+    Sample cpu, memory and threads of daemon by psutil.
+    Samples are written to samples.csv, it is truncated by max size.
+    """
+
+    def __init__(self, interval=1.0, max_samples=3600, **kwargs):
+        """
+        :param interval: seconds between samples
+        :param max_samples: only last samples are written
+        """
+        super(SamplingProfiler, self).__init__(**kwargs)
+
+        self.interval = interval
+        self.max_samples = max_samples
+
+        self._samplers = {}
+
+    def start(self, daemon, artifact_dir):
+        from noseapp_daemon.load import ResourceSampler
+
+        sampler = ResourceSampler(daemon.process.pid, interval=self.interval, max_samples=self.max_samples)
+        sampler.start()
+
+        self._samplers[daemon.name] = sampler
+
+    def stop(self, daemon, artifact_dir):
+        sampler = self._samplers.pop(daemon.name, None)
+
+        if sampler is None:
+            return
+
+        sampler.stop()
+
+        lines = ['timestamp,cpu_percent,rss,threads\n']
+        lines.extend('{:.3f},{:.1f},{},{}\n'.format(*sample) for sample in sampler.samples)
+
+        remaining = self.remaining_size(artifact_dir)
+
+        if remaining is not None:
+            size = 0
+
+            for count, line in enumerate(lines):
+                size += len(line)
+
+                if size > remaining:
+                    logger.warning(
+                        'Samples of daemon "%s" are truncated to %s lines by max size %s bytes',
+                        daemon.name, count, self.max_size,
+                    )
+                    lines = lines[:count]
+                    break
+
+        # header only is not written
+        if len(lines) < 2:
+            return
+
+        with open(os.path.join(artifact_dir, 'samples.csv'), 'w') as fp:
+            fp.writelines(lines)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reaping of daemon processes.
+
+Every launched process is waited by thread which is blocked
+in os.wait4, so exit is detected without polling and resource
+usage of process is available after exit.
+
+Reaper thread is the only waiter of process, other code waits
+for ExitFuture, else exit status can be taken by somebody else.
+"""
+
+import os
+import time
+import errno
+import signal
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExitStatus(object):
+    """
+    Exit status of process
+    """
+
+    __slots__ = ('pid', 'exit_code', 'signal', 'core_dumped', 'rusage')
+
+    def __init__(self, pid, status=None, rusage=None):
+        """
+        :param status: status from os.wait4, None if process was reaped by somebody else
+        """
+        self.pid = pid
+        self.rusage = rusage
+
+        self.exit_code = None
+        self.signal = None
+        self.core_dumped = False
+
+        if status is None:
+            return
+
+        if os.WIFSIGNALED(status):
+            self.signal = os.WTERMSIG(status)
+            self.core_dumped = os.WCOREDUMP(status)
+        elif os.WIFEXITED(status):
+            self.exit_code = os.WEXITSTATUS(status)
+
+    @property
+    def returncode(self):
+        """
+        Exit code as subprocess returns it, negative signal if process was killed
+        """
+        if self.signal is not None:
+            return -self.signal
+        return self.exit_code
+
+    @property
+    def signal_name(self):
+        if self.signal is None:
+            return None
+
+        for name in dir(signal):
+            if name.startswith('SIG') and not name.startswith('SIG_') and getattr(signal, name) == self.signal:
+                return name
+
+        return str(self.signal)
+
+    def __repr__(self):
+        if self.signal is not None:
+            return '<ExitStatus pid={} signal={}>'.format(self.pid, self.signal_name)
+        return '<ExitStatus pid={} exit_code={}>'.format(self.pid, self.exit_code)
+
+
+class ExitFuture(object):
+    """
+    Result of waiting for process exit
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+
+        self._condition = threading.Condition()
+        self._status = None
+        self._callbacks = []
+        self._called = False
+        self._caller = None
+
+    def done(self):
+        return self._status is not None
+
+    def result(self, timeout=None):
+        """
+        :return: ExitStatus or None if timeout was expired
+        """
+        with self._condition:
+            if self._status is None:
+                self._condition.wait(timeout)
+
+            return self._status
+
+    def wait_callbacks(self, timeout=None):
+        """
+        Wait for done callbacks are called by reaper thread
+
+        :return: True if callbacks were called
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            # callback waits for itself
+            while not self._called and self._caller is not threading.current_thread():
+                remaining = None if deadline is None else deadline - time.time()
+
+                if remaining is not None and remaining <= 0:
+                    break
+
+                # result is notified before callbacks
+                self._condition.wait(remaining)
+
+            return self._called
+
+    def add_done_callback(self, callback):
+        """
+        :param callback: function with future argument,
+            it is called by reaper thread or immediately if process is dead
+        """
+        with self._condition:
+            if self._status is None:
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def set_result(self, status):
+        with self._condition:
+            self._status = status
+            self._caller = threading.current_thread()
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception('Exit callback %r error of pid %s', callback, self.pid)
+
+        with self._condition:
+            self._called = True
+            self._condition.notify_all()
+
+
+def _reap(future):
+    while True:
+        try:
+            pid, status, rusage = os.wait4(future.pid, 0)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            if e.errno != errno.ECHILD:
+                logger.warning('Process %s was not waited: %s', future.pid, e)
+            # process was reaped by somebody else
+            future.set_result(ExitStatus(future.pid))
+            return
+
+        if pid == future.pid:
+            future.set_result(ExitStatus(pid, status, rusage))
+            return
+
+
+def watch(pid):
+    """
+    Start waiting for exit of child process
+
+    :rtype: ExitFuture
+    """
+    future = ExitFuture(pid)
+
+    thread = threading.Thread(target=_reap, args=(future,), name='noseapp_daemon.reaper.{}'.format(pid))
+    thread.daemon = True
+    thread.start()
+
+    return future
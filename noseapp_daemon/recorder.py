@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recorder of daemon starts.
+
+Every start is written to append-only log as one JSON line:
+command, digest of environment, times of pid file, port and
+log line appearance, resources at ready state and exit code.
+Times are seconds from starting event.
+
+Record is written at stop or crash of daemon. Records of daemons
+which are alive at exit are written by atexit hook as interrupted.
+
+Usage:
+    recorder = management.record_starts('/tmp/starts.log')
+    recorder.watch('nginx', port=8080, log_pattern='start worker process')
+
+Query:
+    python -m noseapp_daemon.recorder /tmp/starts.log --metric ready
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+
+from noseapp_daemon import utils
+
+
+logger = logging.getLogger(__name__)
+
+psutil = utils.LazyImport('psutil')
+
+
+ENV_STARTS_LOG = 'NOSEAPP_DAEMON_STARTS'
+STARTS_LOG = os.path.join(tempfile.gettempdir(), 'noseapp_daemon', 'starts.log')
+
+# phases of start, seconds from starting event
+METRICS = ('launched', 'pid_file', 'port', 'log_line', 'ready')
+
+WATCH_INTERVAL = 0.01
+WATCH_TIMEOUT = 60
+
+# outlier is farther from median than factor * median absolute deviation
+OUTLIER_FACTOR = 5.0
+
+
+# variables which differ between identical starts
+VOLATILE_ENV = frozenset((
+    '_', 'PWD', 'OLDPWD', 'SHLVL',
+    'SSH_CLIENT', 'SSH_CONNECTION', 'SSH_TTY', 'SSH_AUTH_SOCK',
+    'WINDOWID', 'XDG_SESSION_ID', 'TERM_SESSION_ID',
+))
+# markers of run, owner of shutdown guard for example
+VOLATILE_PREFIXES = ('NOSEAPP_DAEMON_',)
+
+
+def env_digest(env=None):
+    """
+    Short digest of environment.
+    Volatile variables and markers of noseapp_daemon are ignored,
+    so identical starts of different runs have the same digest.
+    """
+    env = os.environ if env is None else env
+    data = '\0'.join(
+        '{}={}'.format(k, v) for k, v in sorted(env.items())
+        if k not in VOLATILE_ENV and not k.startswith(VOLATILE_PREFIXES)
+    )
+    return hashlib.sha1(data.encode('utf-8') if isinstance(data, unicode) else data).hexdigest()[:12]
+
+
+def process_resources(pid):
+    """
+    Cpu times and rss of process with children
+    """
+    try:
+        main = psutil.Process(pid)
+        processes = [main] + main.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return {}
+
+    cpu = 0.0
+    rss = 0
+
+    for process in processes:
+        try:
+            times = process.cpu_times()
+            cpu += times.user + times.system
+            rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+
+    return {'cpu': round(cpu, 3), 'rss': rss, 'processes': len(processes)}
+
+
+class StartWatcher(object):
+    """
+    Poll appearance of pid file, port and log line
+    """
+
+    def __init__(self, record, pid_file=None, port=None, log_file=None, log_pattern=None, log_offset=0):
+        self.record = record
+        self.pid_file = pid_file
+        self.port = port
+        self.log_file = log_file
+        self.log_pattern = re.compile(log_pattern) if log_pattern else None
+        self.log_offset = log_offset
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='noseapp_daemon.recorder')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _mark(self, metric):
+        self.record[metric] = round(time.time() - self.record['timestamp'], 4)
+
+    def _log_line_found(self):
+        try:
+            with open(self.log_file, 'rb') as fp:
+                fp.seek(self.log_offset)
+                data = fp.read()
+        except IOError:
+            return False
+
+        # only complete lines are checked
+        end = data.rfind(b'\n') + 1
+        found = any(self.log_pattern.search(line) for line in data[:end].splitlines())
+        self.log_offset += end
+
+        return found
+
+    def _loop(self):
+        waiting = set()
+
+        if self.pid_file:
+            waiting.add('pid_file')
+        if self.port:
+            waiting.add('port')
+        if self.log_file and self.log_pattern:
+            waiting.add('log_line')
+
+        deadline = time.time() + WATCH_TIMEOUT
+
+        while waiting and time.time() < deadline:
+            if 'pid_file' in waiting and os.path.isfile(self.pid_file):
+                self._mark('pid_file')
+                waiting.discard('pid_file')
+
+            if 'port' in waiting and not utils.port_is_free(self.port):
+                self._mark('port')
+                waiting.discard('port')
+
+            if 'log_line' in waiting and self._log_line_found():
+                self._mark('log_line')
+                waiting.discard('log_line')
+
+            if self._stopped.wait(WATCH_INTERVAL):
+                return
+
+
+class StartRecorder(object):
+    """
+    Record starts of daemons to append-only log
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(ENV_STARTS_LOG) or STARTS_LOG
+
+        self._lock = threading.Lock()
+        self._watch = {}
+        self._records = {}
+        self._watchers = {}
+
+        # starts which are not finished by stop or crash
+        atexit.register(self.flush)
+
+    def watch(self, name, port=None, log_pattern=None, log_file=None):
+        """
+        :param name: daemon name
+        :param port: record time when port accepts connections
+        :param log_pattern: record time when line is matched by regexp
+        :param log_file: file for log_pattern, stderr or stdout of daemon by default
+        """
+        self._watch[name] = dict(port=port, log_pattern=log_pattern, log_file=log_file)
+
+    def attach(self, bus):
+        """
+        :type bus: noseapp_daemon.events.EventBus
+        """
+        bus.subscribe(self.on_event)
+
+    def detach(self, bus):
+        bus.unsubscribe(self.on_event)
+
+    def on_event(self, event):
+        handler = getattr(self, '_on_{}'.format(event.name), None)
+
+        if handler is not None:
+            handler(event.source, event)
+
+    @staticmethod
+    def _offset(record, event):
+        return round(event.timestamp - record['timestamp'], 4)
+
+    def _on_starting(self, daemon, event):
+        watch = self._watch.get(daemon.name, {})
+        log_file = watch.get('log_file')
+
+        for output in (daemon.stderr, daemon.stdout):
+            if not log_file:
+                log_file = output if isinstance(output, basestring) else getattr(output, 'path', None)
+
+        try:
+            log_offset = os.path.getsize(log_file) if log_file else 0
+        except OSError:
+            log_offset = 0
+
+        self._records[daemon.name] = record = {
+            'daemon': daemon.name,
+            'timestamp': event.timestamp,
+            'cmd': daemon.get_cmd(),
+            'env': env_digest(utils.make_env(daemon.env) if daemon.env else None),
+        }
+
+        self._watchers[daemon.name] = StartWatcher(
+            record,
+            pid_file=daemon.pid_file.path,
+            port=watch.get('port'),
+            log_file=log_file,
+            log_pattern=watch.get('log_pattern'),
+            log_offset=log_offset,
+        )
+
+    def _on_started(self, daemon, event):
+        if daemon.name not in self._records:
+            return
+
+        record = self._records[daemon.name]
+        record['pid'] = event.data.get('pid')
+        record['launched'] = self._offset(record, event)
+
+        self._watchers[daemon.name].start()
+
+    def _on_ready(self, daemon, event):
+        record = self._records.get(daemon.name)
+
+        if record is None or 'ready' in record:
+            return
+
+        record['ready'] = self._offset(record, event)
+
+        if record.get('pid'):
+            record['resources'] = process_resources(record['pid'])
+
+    def _on_crashed(self, daemon, event):
+        record = self._records.get(daemon.name)
+
+        if record is not None:
+            self._finish(
+                daemon.name, crashed=self._offset(record, event), exit_code=event.data.get('exit_code'),
+            )
+
+    def _on_stopped(self, daemon, event):
+        record = self._records.get(daemon.name)
+
+        if record is not None:
+            self._finish(daemon.name, stopped=self._offset(record, event))
+
+    def _finish(self, name, **fields):
+        # crash is reported by reaper thread
+        record = self._records.pop(name, None)
+        watcher = self._watchers.pop(name, None)
+
+        if watcher is not None:
+            watcher.stop()
+
+        if record is None:
+            return
+
+        record.update(fields)
+        record.setdefault('exit_code', None)
+
+        self.write(record)
+
+    def flush(self):
+        """
+        Write records of starts which are not finished,
+        daemon can be killed by shutdown guard after it
+        """
+        for name in list(self._records):
+            self._finish(name, interrupted=True)
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':'), sort_keys=True) + '\n'
+
+        directory = os.path.dirname(self.path)
+
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+
+        # one write call per record, O_APPEND keeps records of processes whole
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+
+def read_records(path, daemon=None):
+    """
+    :param daemon: only records of daemon
+    """
+    with open(path) as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # last line can be incomplete
+                continue
+
+            if daemon is None or record.get('daemon') == daemon:
+                yield record
+
+
+def percentile(values, q):
+    """
+    Nearest rank percentile of sorted values
+    """
+    if not values:
+        return None
+
+    rank = max(1, int(round(len(values) * q / 100.0)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(records, metric='ready'):
+    """
+    Percentiles of metric by daemons
+
+    :return: dict of daemon name -> stats
+    """
+    values = {}
+
+    for record in records:
+        value = record.get(metric)
+        if value is not None:
+            values.setdefault(record['daemon'], []).append(value)
+
+    summary = {}
+
+    for name, items in values.items():
+        items.sort()
+        summary[name] = {
+            'count': len(items),
+            'p50': percentile(items, 50),
+            'p90': percentile(items, 90),
+            'p99': percentile(items, 99),
+            'max': items[-1],
+        }
+
+    return summary
+
+
+def outliers(records, metric='ready', factor=OUTLIER_FACTOR):
+    """
+    Starts which are much slower than usual starts of daemon.
+    Median absolute deviation is used, it is not affected by outliers.
+    """
+    records = [r for r in records if r.get(metric) is not None]
+    by_daemon = {}
+
+    for record in records:
+        by_daemon.setdefault(record['daemon'], []).append(record)
+
+    result = []
+
+    for name, items in by_daemon.items():
+        values = sorted(r[metric] for r in items)
+        median = percentile(values, 50)
+        mad = percentile(sorted(abs(v - median) for v in values), 50)
+
+        # very stable starts have zero deviation
+        limit = median + factor * max(mad, median * 0.05, 0.001)
+
+        result.extend(r for r in items if r[metric] > limit)
+
+    return sorted(result, key=lambda r: r[metric], reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Statistics of daemon starts')
+    parser.add_argument('path', nargs='?', default=os.environ.get(ENV_STARTS_LOG) or STARTS_LOG)
+    parser.add_argument('--daemon', default=None)
+    parser.add_argument('--metric', default='ready', choices=METRICS + ('stopped',))
+    parser.add_argument('--factor', type=float, default=OUTLIER_FACTOR)
+    parser.add_argument('--limit', type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    records = list(read_records(args.path, daemon=args.daemon))
+
+    out = sys.stdout
+    out.write('{:<24} {:>8} {:>8} {:>8} {:>8} {:>8}\n'.format('daemon', 'count', 'p50', 'p90', 'p99', 'max'))
+
+    for name, stats in sorted(summarize(records, metric=args.metric).items()):
+        out.write('{:<24} {count:>8} {p50:>8.3f} {p90:>8.3f} {p99:>8.3f} {max:>8.3f}\n'.format(name, **stats))
+
+    found = outliers(records, metric=args.metric, factor=args.factor)
+
+    if found:
+        out.write('\noutliers by {}:\n'.format(args.metric))
+
+    for record in found[:args.limit]:
+        out.write('{} {} {}={} exit_code={} env={} cmd={}\n'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['timestamp'])),
+            record['daemon'],
+            args.metric,
+            record[args.metric],
+            record.get('exit_code'),
+            record.get('env'),
+            record.get('cmd'),
+        ))
+
+
+if __name__ == '__main__':
+    main()
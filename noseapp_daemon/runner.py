@@ -1,16 +1,28 @@
 # -*- coding: utf-8 -*-
 
 import os
+import copy
+import shlex
+import atexit
+import signal
+import shutil
 import logging
-from collections import OrderedDict
-
-import psutil
+import tempfile
+import threading
 
 from noseapp_daemon import utils
+from noseapp_daemon import guard
+from noseapp_daemon import trace
+from noseapp_daemon import events
+from noseapp_daemon import reaper
+from noseapp_daemon import artifacts
 
 
 logger = logging.getLogger(__name__)
 
+psutil = utils.LazyImport('psutil')
+subprocess = utils.LazyImport('subprocess')
+
 
 def compile_cmd(
         cmd_prefix=None,
@@ -31,32 +43,95 @@ def compile_cmd(
     return cmd
 
 
+def open_output(output):
+    """
+    Open log file or output policy for child process
+
+    :param output: path to log file or policy from noseapp_daemon.output
+    """
+    if isinstance(output, basestring):
+        return open(output, 'a')
+
+    return output.open()
+
+
 class DaemonError(BaseException):
     pass
 
 
+# seconds for reaping of dead process
+REAP_TIMEOUT = 1.0
+# seconds for exit after SIGTERM, then process is killed
+STOP_TIMEOUT = 3.0
+
+# fork and exec of daemons are serialized, see DaemonRunner.start
+LAUNCH_LOCK = threading.Lock()
+# exit of process is reported as crash by reaper or by stop, not by both
+EXIT_LOCK = threading.Lock()
+
+# run cmd by shell with subprocess.Popen
+LAUNCHER_POPEN = 'popen'
+# run cmd without shell, it is the only process of daemon
+LAUNCHER_SPAWN = 'spawn'
+
+# temporary working directories which are not cleaned up yet
+TEMP_WORKDIRS = set()
+
+
+@atexit.register
+def remove_temp_workdirs():
+    while TEMP_WORKDIRS:
+        shutil.rmtree(TEMP_WORKDIRS.pop(), ignore_errors=True)
+
+
 class CmdArgs(object):
     """
-    Command line options for running daemon
+    Command line options for running daemon.
+    Options are stored as list of pairs, there are few of them.
     """
 
-    def __init__(self):
-        self._options = OrderedDict()
+    __slots__ = ('_options', '_separator')
+
+    def __init__(self, separator='='):
+        self._options = []
+        self._separator = separator
 
     def add_option(self, opt, value=None):
-        self._options[opt] = value
+        for i, (o, _) in enumerate(self._options):
+            if o == opt:
+                self._options[i] = (opt, value)
+                return
+
+        self._options.append((opt, value))
 
     def get_option(self, opt, default=None):
-        return self._options.get(opt, default)
+        for o, value in self._options:
+            if o == opt:
+                return value
+
+        return default
+
+    def replace_value(self, old, new):
+        """
+        Replace value of all options which have old value
+        """
+        self._options = [
+            (opt, new if value == old else value) for opt, value in self._options
+        ]
+
+    def copy(self):
+        args = CmdArgs(separator=self._separator)
+        args._options = list(self._options)
+        return args
 
     def to_string(self):
         string = ''
 
-        for opt, value in self._options.items():
+        for opt, value in self._options:
             if value is None or type(value) is bool:
                 string += '{} '.format(opt)
             else:
-                string += '{}={} '.format(opt, value)
+                string += '{}{}{} '.format(opt, self._separator, value)
 
         return string.strip()
 
@@ -100,14 +175,54 @@ class DaemonPlugin(object):
         """
         pass
 
+    def threshold_crossed(self, daemon, probe, latency):
+        """
+        Will be called when health probe became slow or failed.
+        Latency is None if probe was failed.
+        """
+        pass
+
+
+# shared by runners without custom plugin
+DEFAULT_PLUGIN = DaemonPlugin()
+
 
 class DaemonRunner(object):
     """
     Base class for daemon run
     """
 
+    __slots__ = (
+        '_name',
+        'options',
+        'tags',
+        'labels',
+        'cmd_args',
+        'pid_file',
+        'cmd_prefix',
+        'daemon_bin',
+        'process',
+        'stdout',
+        'stderr',
+        'plugin',
+        'launcher',
+        'cwd',
+        'env',
+        'temp_workdir',
+        'workdir',
+        'profiler',
+        'artifact_dir',
+        'sockets',
+        '_events',
+        '_exit',
+        '_exit_handled',
+        '__weakref__',
+    )
+
     CMD_PREFIX = None
     DAEMON_BIN = None
+    OPTION_SEPARATOR = '='
+    LAUNCHER = LAUNCHER_POPEN
 
     plugin_class = DaemonPlugin
 
@@ -119,7 +234,14 @@ class DaemonRunner(object):
                  pid_file=None,
                  cmd_prefix=None,
                  plugin=None,
-                 options=None):
+                 options=None,
+                 tags=None,
+                 labels=None,
+                 launcher=None,
+                 cwd=None,
+                 env=None,
+                 temp_workdir=False,
+                 profiler=None):
         """
         :param daemon_bin: path to executable file
         :type daemon_bin: str
@@ -127,16 +249,32 @@ class DaemonRunner(object):
         :type pid_file: str
         :param cmd_prefix: pre start command line prefix
         :type cmd_prefix: basestring, tuple
-        :param stdout: path to stdout log file.
-        :type stdout: str
-        :param stderr: path to stderr log file.
-        :type stderr: str
+        :param stdout: path to stdout log file or output policy
+        :type stdout: str, noseapp_daemon.output.OutputPolicy
+        :param stderr: path to stderr log file or output policy
+        :type stderr: str, noseapp_daemon.output.OutputPolicy
         :param options: will be use as options property
+        :param tags: tags for lookup by DaemonManagement
+        :type tags: list, tuple, set
+        :param labels: key value labels for lookup by DaemonManagement
+        :type labels: dict
+        :param launcher: LAUNCHER_POPEN or LAUNCHER_SPAWN
+        :param cwd: working directory of daemon
+        :type cwd: str
+        :param env: overlay of environment, None value removes variable
+        :type env: dict
+        :param temp_workdir: create temporary working directory at start
+            and remove it at stop, if cwd is not set
+        :type temp_workdir: bool
+        :param profiler: profiler from noseapp_daemon.profiling,
+            artifacts are collected to artifact_dir at stop
         """
         self._name = name
 
         self.options = options
-        self.cmd_args = CmdArgs()
+        self.tags = frozenset(tags or ())
+        self.labels = dict(labels or {})
+        self.cmd_args = CmdArgs(separator=self.OPTION_SEPARATOR)
         self.pid_file = utils.PidFileObject(pid_file)
         self.cmd_prefix = cmd_prefix or self.CMD_PREFIX
         self.daemon_bin = daemon_bin or self.DAEMON_BIN
@@ -146,7 +284,29 @@ class DaemonRunner(object):
         self.stdout = stdout
         self.stderr = stderr
 
-        self.plugin = plugin if plugin else self.plugin_class()
+        self.launcher = launcher or self.LAUNCHER
+
+        self.cwd = cwd
+        self.env = env
+        self.temp_workdir = temp_workdir
+        self.workdir = None
+
+        self.profiler = profiler
+        self.artifact_dir = None
+
+        # paths of unix sockets which are owned by daemon
+        self.sockets = []
+
+        self._events = None
+        self._exit = None
+        self._exit_handled = None
+
+        if plugin:
+            self.plugin = plugin
+        elif self.plugin_class is DaemonPlugin:
+            self.plugin = DEFAULT_PLUGIN
+        else:
+            self.plugin = self.plugin_class()
 
         if hasattr(self.plugin, 'init'):
             self.plugin.init(self)
@@ -182,6 +342,31 @@ class DaemonRunner(object):
         """
         return {}
 
+    @property
+    def events(self):
+        """
+        Bus of lifecycle events, it is created at first access.
+
+        :rtype: noseapp_daemon.events.EventBus
+        """
+        if self._events is None:
+            self._events = events.EventBus()
+        return self._events
+
+    def emit(self, name, **data):
+        """
+        Emit lifecycle event if somebody is subscribed
+        """
+        if self._events is not None:
+            self._events.emit(name, self, **data)
+
+    @property
+    def working_dir(self):
+        """
+        Working directory of daemon
+        """
+        return self.cwd or self.workdir or os.getcwd()
+
     @property
     def started(self):
         return bool(self.process) or self.pid_file.exist
@@ -190,11 +375,22 @@ class DaemonRunner(object):
     def stopped(self):
         return not self.started
 
+    @property
+    def ready(self):
+        """
+        To return True if daemon is ready for work.
+        Presets can override it for checking of ports, sockets, etc.
+        """
+        return self.started
+
     @property
     def is_dead(self):
         """
         To return True if process is dead else False.
         """
+        if self._exit is not None and self._exit.done():
+            return True
+
         try:
             return self.process.status() in (
                 psutil.STATUS_DEAD,
@@ -208,28 +404,146 @@ class DaemonRunner(object):
         Pre start callback.
         """
         if hasattr(self.plugin, 'before_start'):
-            self.plugin.before_start(self)
+            with trace.span('before_start', self.name):
+                self.plugin.before_start(self)
 
     def after_start(self):
         """
         Post start callback.
         """
         if hasattr(self.plugin, 'after_start'):
-            self.plugin.after_start(self)
+            with trace.span('after_start', self.name):
+                self.plugin.after_start(self)
 
     def before_stop(self):
         """
         Pre stop callback.
         """
         if hasattr(self.plugin, 'before_stop'):
-            self.plugin.before_stop(self)
+            with trace.span('before_stop', self.name):
+                self.plugin.before_stop(self)
 
     def after_stop(self):
         """
         Post stop callback.
         """
         if hasattr(self.plugin, 'after_stop'):
-            self.plugin.after_stop(self)
+            with trace.span('after_stop', self.name):
+                self.plugin.after_stop(self)
+
+    def threshold_crossed(self, probe, latency):
+        """
+        Health probe callback.
+        """
+        if hasattr(self.plugin, 'threshold_crossed'):
+            self.plugin.threshold_crossed(self, probe, latency)
+
+    def exit_code(self):
+        """
+        To get exit code of launched process if it was exited.
+        Negative value is number of signal.
+        """
+        if self.process is None or self._exit is None or not self.is_dead:
+            return None
+
+        # dead process is reaped by reaper thread right now,
+        # it is the only waiter of process
+        status = self._exit.result(timeout=REAP_TIMEOUT)
+
+        return status.returncode if status is not None else None
+
+    @property
+    def exit_future(self):
+        """
+        Future of exit status of launched process
+
+        :rtype: noseapp_daemon.reaper.ExitFuture
+        """
+        return self._exit
+
+    def wait(self, timeout=None):
+        """
+        Wait for daemon exits by itself without polling
+
+        :return: noseapp_daemon.reaper.ExitStatus with exit code,
+            signal and resource usage
+        :raises: DaemonError if daemon was not started or timeout was expired
+        """
+        if self._exit is None:
+            raise DaemonError('Daemon "{}" was not started'.format(self.name))
+
+        status = self._exit.result(timeout=timeout)
+
+        if status is None:
+            raise DaemonError(
+                'Daemon "{}" is not exited after {} sec'.format(self.name, timeout),
+            )
+
+        return status
+
+    def prepare_workdir(self):
+        """
+        Create temporary working directory if it is required.
+        It is kept by stop and restart, it is removed by cleanup or at exit.
+
+        :return: working directory
+        """
+        if self.temp_workdir and not self.cwd and not self.workdir:
+            self.workdir = tempfile.mkdtemp(prefix='{}-'.format(self.name))
+            TEMP_WORKDIRS.add(self.workdir)
+
+        return self.working_dir
+
+    def clone(self, name, pid_file=None, stdout=None, stderr=None):
+        """
+        To get stopped copy of runner with other name.
+        Command options, tags and labels are copied,
+        state of process is not copied.
+
+        :param pid_file: path to pid file of copy
+        :param stdout: path to stdout log file or output policy of copy
+        :param stderr: path to stderr log file or output policy of copy
+        """
+        daemon = copy.copy(self)
+
+        daemon._name = name
+        daemon.labels = dict(self.labels)
+        daemon.cmd_args = self.cmd_args.copy()
+        daemon.pid_file = utils.PidFileObject(pid_file)
+        daemon.stdout = stdout
+        daemon.stderr = stderr
+        daemon.process = None
+        daemon.workdir = None
+        daemon.artifact_dir = None
+        daemon.sockets = []
+        daemon._events = None
+        daemon._exit = None
+        daemon._exit_handled = None
+
+        # copy listens on own sockets
+        for path in self.sockets:
+            new_path = utils.socket_path(name)
+            daemon.cmd_args.replace_value(path, new_path)
+            daemon.sockets.append(new_path)
+
+        return daemon
+
+    def allocate_socket(self, option=None, name=None):
+        """
+        To get unique path of unix socket for daemon.
+        Socket file is removed before start and after stop,
+        copy of runner gets other path.
+
+        :param option: cmd option which is set to path
+        :param name: part of file name, name of daemon by default
+        """
+        path = utils.socket_path(name or self.name)
+        self.sockets.append(path)
+
+        if option:
+            self.add_cmd_option(option, path)
+
+        return path
 
     def get_cmd(self):
         """
@@ -260,7 +574,16 @@ class DaemonRunner(object):
 
         :param kwargs: subprocess.Popen kwargs
         """
+        if self.launcher not in (LAUNCHER_POPEN, LAUNCHER_SPAWN):
+            raise DaemonError('Unknown launcher "{}"'.format(self.launcher))
+
         if not self.process and self.pid_file.exist:
+            pid = self.pid_file.pid
+
+            if pid and guard.is_orphan(pid):
+                utils.kill_process_tree(pid)
+                logger.warning('Orphaned daemon "%s" with pid %s was killed', self.name, pid)
+
             self.pid_file.remove()
             logger.warning('Old pid file "%s" was removed', self.pid_file.path)
 
@@ -269,27 +592,81 @@ class DaemonRunner(object):
 
         logger.debug('Daemod "%s" start', self.name)
 
+        # bind to stale socket file is failed
+        for path in self.sockets:
+            utils.remove_socket(path)
+
         self.before_start()
+        self.emit(events.STARTING)
 
         cmd = self.get_cmd()
         process_options = self.process_options.copy()
 
-        if self.stdout:
-            process_options.update(stdout=open(self.stdout, 'a'))
-        if self.stderr:
-            process_options.update(stderr=open(self.stderr, 'a'))
+        if self.profiler:
+            self.artifact_dir = artifacts.make_dir(self.name, self.profiler.KIND)
+            prefix = self.profiler.command_prefix(self.artifact_dir)
+
+            if prefix:
+                cmd = '{} {}'.format(prefix, cmd)
+
+                if self.launcher == LAUNCHER_POPEN:
+                    # signals of profiler are received by wrapper instead of shell
+                    cmd = 'exec {}'.format(cmd)
+
+        if self.cwd or self.temp_workdir:
+            process_options.update(cwd=self.prepare_workdir())
+
         if kwargs:
             process_options.update(kwargs)
 
-        process_options.update(shell=True)
-
-        logger.debug(
-            'Daemon "{}" cmd: "{}" process_options: {}'.format(
-                self.name, cmd, process_options,
-            ),
-        )
-        self.process = psutil.Popen(cmd, **process_options)
+        guard.shutdown_guard.install()
+
+        if self.env:
+            process_options.setdefault('env', utils.make_env(self.env))
+
+        # descriptors which are created without O_CLOEXEC must not be
+        # inherited by process which is launched by other thread at the same time
+        with LAUNCH_LOCK:
+            log_files = []
+
+            if self.stdout:
+                log_files.append(open_output(self.stdout))
+                process_options.update(stdout=log_files[-1])
+            if self.stderr and self.stderr is self.stdout and not isinstance(self.stderr, basestring):
+                process_options.update(stderr=subprocess.STDOUT)
+            elif self.stderr:
+                log_files.append(open_output(self.stderr))
+                process_options.update(stderr=log_files[-1])
+
+            logger.debug(
+                'Daemon "{}" cmd: "{}" launcher: {} process_options: {}'.format(
+                    self.name, cmd, self.launcher, process_options,
+                ),
+            )
 
+            with trace.span('launch', self.name, launcher=self.launcher):
+                try:
+                    if self.launcher == LAUNCHER_SPAWN:
+                        self.process = utils.spawn(shlex.split(cmd), **process_options)
+                    else:
+                        process_options.update(
+                            shell=True,
+                            preexec_fn=utils.new_session(process_options.get('preexec_fn')),
+                        )
+                        self.process = psutil.Popen(cmd, **process_options)
+                finally:
+                    # child process has own descriptors of log files
+                    for log_file in log_files:
+                        log_file.close()
+
+        guard.shutdown_guard.register(self.process)
+        self._exit = reaper.watch(self.process.pid)
+        self._exit.add_done_callback(self._on_exit)
+
+        if self.profiler:
+            self.profiler.start(self, self.artifact_dir)
+
+        self.emit(events.STARTED, pid=self.process.pid)
         self.after_start()
 
     def stop(self, recursive=True):
@@ -304,19 +681,177 @@ class DaemonRunner(object):
         logger.debug('Daemod "%s" stop', self.name)
 
         self.before_stop()
+        self.emit(events.STOPPING)
+
+        exit_code = self.exit_code()
+
+        if exit_code is not None:
+            # crash is reported by reaper thread right now
+            self._exit.wait_callbacks(timeout=REAP_TIMEOUT)
+
+        # exit after this point is expected
+        if self._mark_exit_handled(self._exit) and exit_code:
+            self._report_crash(exit_code)
+
+        if self.profiler and self.artifact_dir:
+            self.profiler.stop(self, self.artifact_dir)
+
+        with trace.span('terminate', self.name):
+            utils.process_terminate_by_pid_file(self.pid_file)
 
-        utils.process_terminate_by_pid_file(self.pid_file)
-        utils.safe_shot_down(self.process, recursive=recursive)
+            if self.process:
+                self._terminate(recursive=recursive)
+
+                if recursive:
+                    utils.terminate_process_group(self.process.pid)
+                guard.shutdown_guard.unregister(self.process)
 
         self.pid_file.remove()
 
         self.process = None
 
+        for path in self.sockets:
+            utils.remove_socket(path)
+
+        for output in set((self.stdout, self.stderr)):
+            if output is not None and not isinstance(output, basestring):
+                output.close()
+
+        if self.profiler and self.artifact_dir:
+            profiles = self.profiler.collect(self, self.artifact_dir)
+            logger.info('Profile artifacts of daemon "%s": %s', self.name, profiles)
+
+        self.emit(events.STOPPED)
         self.after_stop()
 
+    def _terminate(self, recursive=True):
+        """
+        Terminate process and wait for it by reaper.
+        Process is killed if it is alive after STOP_TIMEOUT.
+        """
+        if recursive:
+            try:
+                children = self.process.children(recursive=True)
+            except psutil.NoSuchProcess:
+                children = []
+
+            # children are not waited by reaper, they are not our children
+            for child in children:
+                utils.safe_shot_down(child, recursive=False)
+
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.kill(self.process.pid, sig)
+            except OSError:
+                pass
+
+            if self._exit.result(timeout=STOP_TIMEOUT) is not None:
+                return
+
+            logger.warning('Daemon "%s" is not exited after %s sec', self.name, STOP_TIMEOUT)
+
+    def _mark_exit_handled(self, future):
+        """
+        :return: True if exit of process was not handled yet
+        """
+        with EXIT_LOCK:
+            if future is None or self._exit_handled is future:
+                return False
+
+            self._exit_handled = future
+            return True
+
+    def _report_crash(self, exit_code):
+        logger.warning('Daemon "%s" was crashed with exit code %s', self.name, exit_code)
+        trace.instant('crashed', self.name, exit_code=exit_code)
+        self.emit(events.CRASHED, exit_code=exit_code)
+
+    def _on_exit(self, future):
+        """
+        Crash is reported by reaper at once, without stop
+        """
+        status = future.result()
+
+        if status.returncode and self._mark_exit_handled(future):
+            self._report_crash(status.returncode)
+
+    def cleanup(self):
+        """
+        Stop daemon and remove temporary working directory
+        """
+        self.stop()
+
+        if self.workdir:
+            TEMP_WORKDIRS.discard(self.workdir)
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def wait_ready(self, timeout=10, interval=0.1):
+        """
+        Wait for daemon is ready.
+
+        :raises: DaemonError if timeout was expired
+        """
+        with trace.span('wait_ready', self.name):
+            ready = utils.wait_for(lambda: self.ready, timeout=timeout, interval=interval)
+
+        if not ready:
+            raise DaemonError(
+                'Daemon "{}" is not ready after {} sec'.format(self.name, timeout),
+            )
+
+        self.emit(events.READY)
+
     def restart(self):
         """
         Restart daemon
         """
         self.stop()
         self.start()
+        self.emit(events.RESTARTED)
+
+    def run_load(self, request, duration=None, requests=None, **kwargs):
+        """
+        Drive load to endpoint of daemon.
+        See noseapp_daemon.load.LoadHarness.
+
+        :param request: noseapp_daemon.load.TCPRequest, HTTPRequest, etc
+        :param kwargs: concurrency, rate, sample_interval
+        :rtype: noseapp_daemon.load.LoadResult
+        """
+        from noseapp_daemon.load import LoadHarness
+
+        harness = LoadHarness(self, request, **kwargs)
+
+        with trace.span('load', self.name):
+            return harness.run(duration=duration, requests=requests)
+
+
+def rolling_restart(daemons, batch_size=1, timeout=10, drain=None, undrain=None):
+    """
+    Restart daemons by batches. Daemons of batch are restarted
+    concurrently, next batch is restarted when previous is ready.
+    Rest of daemons are not touched if batch was failed.
+
+    :param batch_size: number of daemons which are restarted at once
+    :param timeout: seconds for waiting of ready state
+    :param drain: function with daemon argument, is called before stop
+    :param undrain: function with daemon argument, is called after daemon is ready
+    :raises: DaemonError if daemon is not ready after restart
+    """
+    daemons = list(daemons)
+    batch_size = max(1, int(batch_size))
+
+    def restart(daemon):
+        with trace.span('restart', daemon.name):
+            if drain is not None:
+                drain(daemon)
+
+            daemon.restart()
+            daemon.wait_ready(timeout=timeout)
+
+            if undrain is not None:
+                undrain(daemon)
+
+    for index in range(0, len(daemons), batch_size):
+        utils.run_parallel(restart, daemons[index:index + batch_size])
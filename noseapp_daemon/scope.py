@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lifetime scopes of registered daemons.
+
+Scoped daemon is started once before suites and stopped after them.
+Its state is checkpointed after start and is reset at end of scope
+by the cheapest strategy of daemon:
+
+    none     daemon has no state between tests
+    reload   RELOAD_SIGNAL or reload method of preset,
+             reset is done when workers are replaced
+    restore  restart with state files which were saved at checkpoint
+    restart  restart with removed state files
+
+Strategy is RESET_STRATEGY of preset or it is chosen by
+STATE_PATHS and RELOAD_SIGNAL.
+
+Usage:
+    management.add_daemon(RedisDaemon(), scope=scope.TEST)
+    management.add_daemon(NGINXDaemon(), scope=scope.SUITE)
+    management.install(app)
+
+    # state after fixtures loading by suite
+    management.checkpoint('redis')
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+from collections import OrderedDict
+
+from noseapp_daemon import utils
+from noseapp_daemon import trace
+
+
+logger = logging.getLogger(__name__)
+
+
+# daemon is not reset
+SESSION = 'session'
+# daemon is reset after each suite which requires it
+SUITE = 'suite'
+# daemon is reset after each test of suite which requires it
+TEST = 'test'
+
+SCOPES = (SESSION, SUITE, TEST)
+
+SCOPE_LABEL = 'scope'
+
+RESET_NONE = 'none'
+RESET_RELOAD = 'reload'
+RESET_RESTORE = 'restore'
+RESET_RESTART = 'restart'
+
+# from cheapest to most expensive
+RESET_STRATEGIES = (RESET_NONE, RESET_RELOAD, RESET_RESTORE, RESET_RESTART)
+
+SCOPE_TRACK = 'scope'
+
+
+def reset_strategy(daemon):
+    """
+    To get the cheapest reset strategy of daemon
+    """
+    strategy = getattr(daemon, 'RESET_STRATEGY', None)
+
+    if strategy:
+        return strategy
+    if getattr(daemon, 'STATE_PATHS', None):
+        return RESET_RESTORE
+    if getattr(daemon, 'RELOAD_SIGNAL', None) is not None:
+        return RESET_RELOAD
+
+    return RESET_RESTART
+
+
+class ScopedDaemon(object):
+    """
+    Daemon with lifetime scope and checkpoint of state
+    """
+
+    def __init__(self, daemon, scope, strategy=None, timeout=10):
+        """
+        :type daemon: noseapp_daemon.runner.DaemonRunner
+        :param scope: SESSION, SUITE or TEST
+        :param strategy: reset strategy, the cheapest strategy of daemon by default
+        :param timeout: timeout of ready state after start and reset
+        """
+        if scope not in SCOPES:
+            raise ValueError('Unknown scope "{}" of "{}"'.format(scope, daemon.name))
+
+        strategy = strategy or reset_strategy(daemon)
+
+        if strategy not in RESET_STRATEGIES:
+            raise ValueError('Unknown reset strategy "{}" of "{}"'.format(strategy, daemon.name))
+        if strategy == RESET_RELOAD and not hasattr(daemon, 'reload'):
+            raise ValueError('Reload is not supported by "{}"'.format(daemon.name))
+        if strategy == RESET_RESTORE and not hasattr(daemon, 'restore_state'):
+            raise ValueError('State restore is not supported by "{}"'.format(daemon.name))
+
+        self.daemon = daemon
+        self.scope = scope
+        self.strategy = strategy
+        self.timeout = timeout
+
+        self.snapshot_dir = None
+        self.resets = 0
+
+    @property
+    def name(self):
+        return self.daemon.name
+
+    @property
+    def alive(self):
+        daemon = self.daemon
+
+        if daemon.process is not None:
+            return not daemon.is_dead
+
+        return daemon.started
+
+    def setup(self):
+        with trace.span('setup', self.name, scope=self.scope):
+            self.daemon.start()
+            self.daemon.wait_ready(timeout=self.timeout)
+
+        self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Save state which will be restored by reset
+        """
+        if self.strategy != RESET_RESTORE:
+            return
+
+        if self.snapshot_dir:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+
+        self.snapshot_dir = tempfile.mkdtemp(prefix='{}-snapshot-'.format(self.name))
+
+        with trace.span('checkpoint', self.name):
+            self.daemon.save_state(self.snapshot_dir)
+
+    def reset(self):
+        """
+        Reset daemon to checkpoint.
+        Stopped or crashed daemon is started again.
+        """
+        if self.strategy == RESET_NONE and self.alive:
+            return
+
+        daemon = self.daemon
+
+        with trace.span('reset', self.name, strategy=self.strategy):
+            if self.strategy == RESET_RELOAD and self.alive:
+                self.reload()
+            elif self.strategy == RESET_RESTORE and self.snapshot_dir:
+                daemon.restore_state(self.snapshot_dir)
+            else:
+                cwd = daemon.working_dir
+                daemon.stop()
+
+                # working directory with state is kept by stop
+                if hasattr(daemon, 'remove_state') and os.path.isdir(cwd):
+                    daemon.remove_state(cwd=cwd)
+
+                daemon.start()
+
+            daemon.wait_ready(timeout=self.timeout)
+
+        self.resets += 1
+
+    def reload(self):
+        """
+        Reload is asynchronous, ready state of daemon is not changed by it.
+        Old workers are waited for replacement if daemon knows them.
+        """
+        daemon = self.daemon
+        pids = daemon.worker_pids() if hasattr(daemon, 'worker_pids') else None
+
+        daemon.reload()
+
+        if pids:
+            daemon.wait_reloaded(pids, timeout=self.timeout)
+
+    def teardown(self):
+        with trace.span('teardown', self.name, scope=self.scope):
+            self.daemon.cleanup()
+
+        if self.snapshot_dir:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self.snapshot_dir = None
+
+    def __repr__(self):
+        return '<ScopedDaemon {} scope={} strategy={}>'.format(self.name, self.scope, self.strategy)
+
+
+class ScopeKeeper(object):
+    """
+    Enforce scopes of daemons by setup and teardown
+    callbacks of noseapp application and suites
+    """
+
+    def __init__(self):
+        self._daemons = OrderedDict()
+
+    @property
+    def daemons(self):
+        return list(self._daemons.values())
+
+    def add(self, daemon, scope, strategy=None, timeout=10):
+        """
+        :rtype: ScopedDaemon
+        """
+        scoped = ScopedDaemon(daemon, scope, strategy=strategy, timeout=timeout)
+        self._daemons[daemon.name] = scoped
+
+        return scoped
+
+    def discard(self, name):
+        return self._daemons.pop(name, None)
+
+    def get(self, name):
+        return self._daemons.get(name)
+
+    def setup(self):
+        """
+        Start all scoped daemons in parallel
+        """
+        with trace.span('setup_scopes', SCOPE_TRACK):
+            utils.run_parallel(lambda s: s.setup(), self.daemons)
+
+    def teardown(self):
+        with trace.span('teardown_scopes', SCOPE_TRACK):
+            utils.run_parallel(lambda s: s.teardown(), self.daemons)
+
+    def reset(self, scope, names=None):
+        """
+        Reset daemons of scope in parallel
+
+        :param names: only daemons with these names
+        :return: reset daemons
+        """
+        daemons = [
+            s for s in self.daemons
+            if s.scope == scope and (names is None or s.name in names)
+        ]
+
+        utils.run_parallel(lambda s: s.reset(), daemons)
+
+        return daemons
+
+    def end_suite(self, names=None):
+        return self.reset(SUITE, names=names)
+
+    def end_test(self, names=None):
+        return self.reset(TEST, names=names)
+
+    def install(self, app):
+        """
+        :type app: noseapp.app.NoseApp
+        """
+        app.add_setup(self.setup)
+        app.add_teardown(self.teardown)
+
+        for suite in app.suites:
+            self.install_suite(suite)
+
+    def install_suite(self, suite):
+        """
+        Daemons which are required by suite are reset after its tests and after it
+
+        :type suite: noseapp.suite.Suite
+        """
+        names = frozenset(suite.require)
+
+        suite.add_post_run(lambda case: self.end_test(names))
+        suite.add_teardown(lambda: self.end_suite(names))
@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import abc
+import sys
+import logging
+from collections import OrderedDict
+
+from noseapp_daemon import utils
+from noseapp_daemon import trace
+from noseapp_daemon.runner import rolling_restart
+
+
+logger = logging.getLogger(__name__)
 
 
 class DaemonService(object):
@@ -10,10 +20,16 @@ class DaemonService(object):
 
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, config=None, options=None):
+    tags = ()
+    labels = {}
+
+    def __init__(self, config=None, options=None, tags=None, labels=None):
         self.__options = options
         self.__config = config
 
+        self.tags = frozenset(self.tags if tags is None else tags)
+        self.labels = dict(self.labels if labels is None else labels)
+
         self.daemon = None
 
         self.setup()
@@ -27,8 +43,9 @@ class DaemonService(object):
         return self.__options
 
     def restart(self):
-        self.stop()
-        self.start()
+        with trace.span('restart', self.name):
+            self.stop()
+            self.start()
 
     @abc.abstractproperty
     def name(self):
@@ -45,3 +62,166 @@ class DaemonService(object):
     @abc.abstractmethod
     def setup(self):
         pass
+
+
+def dependency_levels(requires):
+    """
+    Split names to levels by dependencies.
+    Names of one level are independent from each other.
+
+    :param requires: ordered dict of name -> names which are required by it
+    :return: list of lists of names
+    """
+    levels = []
+    done = set()
+    left = OrderedDict(requires)
+
+    for name, deps in left.items():
+        unknown = set(deps) - set(left)
+        if unknown:
+            raise ValueError(
+                'Member "{}" requires unknown members: {}'.format(name, ', '.join(sorted(unknown))),
+            )
+
+    while left:
+        level = [name for name, deps in left.items() if done.issuperset(deps)]
+
+        if not level:
+            raise ValueError(
+                'Cyclic dependencies of members: {}'.format(', '.join(left)),
+            )
+
+        for name in level:
+            del left[name]
+
+        done.update(level)
+        levels.append(level)
+
+    return levels
+
+
+class CompositeService(DaemonService):
+    """
+    Service of several daemons.
+
+    Independent members are started and stopped concurrently,
+    dependencies are started before and stopped after members
+    which require them. If start of member was failed then
+    members which were started will be stopped.
+
+    Usage:
+        class BackendService(CompositeService):
+
+            name = 'backend'
+
+            def setup(self):
+                self.add_member(TarantoolDaemon())
+                self.add_member(UWSGIDaemon(), requires=['tarantool'])
+                self.add_member(NGINXDaemon(), requires=['uwsgi'])
+    """
+
+    # wait for member is ready before start of members which require it
+    WAIT_READY = True
+    READY_TIMEOUT = 10
+
+    def __init__(self, *args, **kwargs):
+        self.__members = OrderedDict()
+        self.__requires = OrderedDict()
+        self.__levels = None
+
+        super(CompositeService, self).__init__(*args, **kwargs)
+
+    @property
+    def members(self):
+        return list(self.__members.values())
+
+    @property
+    def levels(self):
+        """
+        Members grouped by levels of dependencies
+        """
+        if self.__levels is None:
+            self.__levels = [
+                [self.__members[name] for name in level]
+                for level in dependency_levels(self.__requires)
+            ]
+
+        return self.__levels
+
+    def add_member(self, daemon, requires=None):
+        """
+        :type daemon: noseapp_daemon.runner.DaemonRunner
+        :param requires: names of members which must be started before
+        """
+        self.__members[daemon.name] = daemon
+        self.__requires[daemon.name] = tuple(requires or ())
+        self.__levels = None
+
+    def member(self, name):
+        return self.__members[name]
+
+    def setup(self):
+        pass
+
+    def _start_member(self, daemon):
+        with trace.span('start', daemon.name):
+            daemon.start()
+
+            if self.WAIT_READY:
+                daemon.wait_ready(timeout=self.READY_TIMEOUT)
+
+    def _stop_member(self, daemon):
+        with trace.span('stop', daemon.name):
+            daemon.stop()
+
+    def _stop_levels(self, levels):
+        """
+        Stop levels in reverse order, errors are raised after all levels
+        """
+        errors = []
+
+        for level in reversed(levels):
+            try:
+                utils.run_parallel(self._stop_member, level)
+            except BaseException as e:
+                logger.error('Service "%s" stop error: %r', self.name, e)
+                errors.append(e)
+
+        if errors:
+            raise errors[0]
+
+    def start(self):
+        levels = self.levels
+
+        for index, level in enumerate(levels):
+            try:
+                utils.run_parallel(self._start_member, level)
+            except BaseException:
+                # exception of rollback replaces it on python 2
+                exc_info = sys.exc_info()
+                logger.error('Service "%s" start was failed, started members will be stopped', self.name)
+
+                try:
+                    self._stop_levels(levels[:index + 1])
+                except BaseException as e:
+                    logger.error('Service "%s" rollback error: %r', self.name, e)
+
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+    def stop(self):
+        self._stop_levels(self.levels)
+
+    def rolling_restart(self, timeout=None):
+        """
+        Restart members one by one in order of dependencies.
+        Next member is restarted when previous is ready.
+
+        :raises: DaemonError if member is not ready after restart
+        """
+        timeout = self.READY_TIMEOUT if timeout is None else timeout
+
+        with trace.span('rolling_restart', self.name):
+            rolling_restart(
+                (daemon for level in self.levels for daemon in level),
+                timeout=timeout,
+            )
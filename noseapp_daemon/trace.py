@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Startup tracer.
+
+Spans of daemons, services and management are recorded
+by active tracer and can be written as Chrome trace JSON
+which is opened by chrome://tracing or Perfetto UI.
+Each daemon has own track.
+
+Usage:
+    from noseapp_daemon import trace
+
+    trace.enable()
+    management.start_all()
+    trace.active_tracer.dump('/tmp/startup.json')
+
+Tracer is enabled at import if NOSEAPP_DAEMON_TRACE environment variable
+is set, file by its value will be written at exit.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+
+
+ENV_TRACE_FILE = 'NOSEAPP_DAEMON_TRACE'
+
+# pid of trace events, it is constant for single process
+TRACE_PID = 1
+
+
+class NullSpan(object):
+    """
+    Span of disabled tracer
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+
+    __slots__ = ('tracer', 'name', 'track', 'args', 'start')
+
+    def __init__(self, tracer, name, track, args):
+        self.tracer = tracer
+        self.name = name
+        self.track = track
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.args['error'] = repr(exc_value)
+
+        self.tracer.record(self.name, self.track, self.start, time.time(), self.args)
+
+        return False
+
+
+class Tracer(object):
+    """
+    Recorder of spans
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._tracks = {}
+
+        self.epoch = time.time()
+
+    def span(self, name, track, **args):
+        """
+        :param name: name of span
+        :param track: name of track, daemon name for example
+        """
+        return Span(self, name, track, args)
+
+    def _tid(self, track):
+        try:
+            return self._tracks[track]
+        except KeyError:
+            tid = self._tracks[track] = len(self._tracks) + 1
+            return tid
+
+    def record(self, name, track, start, end, args=None):
+        with self._lock:
+            self._events.append({
+                'name': name,
+                'ph': 'X',
+                'pid': TRACE_PID,
+                'tid': self._tid(track),
+                'ts': int((start - self.epoch) * 1e6),
+                'dur': int((end - start) * 1e6),
+                'args': args or {},
+            })
+
+    def instant(self, name, track, **args):
+        """
+        Event without duration, crash of daemon for example
+        """
+        with self._lock:
+            self._events.append({
+                'name': name,
+                'ph': 'i',
+                's': 't',
+                'pid': TRACE_PID,
+                'tid': self._tid(track),
+                'ts': int((time.time() - self.epoch) * 1e6),
+                'args': args,
+            })
+
+    def to_chrome(self):
+        """
+        :rtype: dict
+        """
+        with self._lock:
+            metadata = [
+                {
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': TRACE_PID,
+                    'tid': tid,
+                    'args': {'name': track},
+                }
+                for track, tid in sorted(self._tracks.items(), key=lambda t: t[1])
+            ]
+            trace_events = metadata + sorted(self._events, key=lambda e: e['ts'])
+
+        return {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as fp:
+            json.dump(self.to_chrome(), fp)
+
+
+active_tracer = None
+
+
+def enable(tracer=None):
+    """
+    Set active tracer
+
+    :rtype: Tracer
+    """
+    global active_tracer
+    active_tracer = tracer or Tracer()
+    return active_tracer
+
+
+def disable():
+    """
+    :return: tracer which was active
+    """
+    global active_tracer
+    tracer, active_tracer = active_tracer, None
+    return tracer
+
+
+def span(name, track, **args):
+    """
+    Span of active tracer or null span if tracer is disabled
+    """
+    tracer = active_tracer
+
+    if tracer is None:
+        return NULL_SPAN
+
+    return tracer.span(name, track, **args)
+
+
+def instant(name, track, **args):
+    """
+    Instant event of active tracer, nothing if tracer is disabled
+    """
+    tracer = active_tracer
+
+    if tracer is not None:
+        tracer.instant(name, track, **args)
+
+
+if os.environ.get(ENV_TRACE_FILE):
+    atexit.register(enable().dump, os.environ[ENV_TRACE_FILE])
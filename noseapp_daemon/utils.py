@@ -1,27 +1,63 @@
 # -*- coding: utf-8 -*-
 
 import os
+import stat
+import time
 import errno
+import atexit
+import shutil
 import signal
 import socket
 import logging
 import resource
+import tempfile
+import itertools
+import threading
+import importlib
 from random import Random
 from collections import Iterator
 from contextlib import contextmanager
 
-import psutil
-
 
 logger = logging.getLogger(__name__)
 
 
+class LazyImport(object):
+    """
+    Module will be imported at first access to attribute.
+
+    Usage:
+        psutil = LazyImport('psutil')
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+
+        return getattr(self.__module, attr)
+
+    def __repr__(self):
+        return '<LazyImport {}>'.format(self.__name)
+
+
+psutil = LazyImport('psutil')
+gzip = LazyImport('gzip')
+
+
 def safe_shot_down(process, recursive=True):
     """
     :type process: psutil.Popen
     """
     if recursive:
-        children = (c for c in process.children(recursive=True))
+        try:
+            children = process.children(recursive=True)
+        except (psutil.NoSuchProcess, AttributeError):
+            children = []
+
         for ch in children:
             safe_shot_down(ch, recursive=False)
 
@@ -51,8 +87,191 @@ def process_terminate_by_pid_file(pid_file):
         kill_process_by_pid(pid_file.pid)
 
 
+def kill_process_group(pgid, sig=signal.SIGTERM):
+    """
+    :param pgid: process group id
+    :type pgid: int
+    """
+    try:
+        os.killpg(pgid, sig)
+    except OSError:
+        pass
+
+
+def process_is_alive(pid):
+    """
+    Process exists and it is not zombie
+    """
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+def process_group_members(pgid):
+    """
+    :param pgid: process group id
+    :rtype: list of psutil.Process
+    """
+    members = []
+
+    for pid in psutil.pids():
+        try:
+            if os.getpgid(pid) == pgid:
+                members.append(psutil.Process(pid))
+        except (OSError, psutil.NoSuchProcess):
+            pass
+
+    return members
+
+
+def process_group_exists(pgid):
+    """
+    Group exists if it has members which are not zombies.
+    Orphaned zombies can be reaped by init not at once.
+    """
+    try:
+        os.killpg(pgid, 0)
+    except OSError:
+        return False
+
+    for process in process_group_members(pgid):
+        try:
+            if process.status() != psutil.STATUS_ZOMBIE:
+                return True
+        except psutil.NoSuchProcess:
+            pass
+
+    return False
+
+
+def terminate_process_group(pgid, timeout=3):
+    """
+    Terminate process group and wait for it.
+    Group will be killed if it is alive after timeout.
+
+    :param pgid: process group id
+    :type pgid: int
+    """
+    kill_process_group(pgid)
+
+    deadline = time.time() + timeout
+
+    while process_group_exists(pgid):
+        if time.time() > deadline:
+            kill_process_group(pgid, signal.SIGKILL)
+            break
+        time.sleep(0.01)
+
+
+def kill_process_tree(pid, timeout=3):
+    """
+    Terminate process with children and his group.
+    Processes which are alive after timeout will be killed.
+
+    :param pid: pid of root process
+    :type pid: int
+    """
+    try:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        processes = []
+
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.NoSuchProcess:
+            pass
+
+    kill_process_group(pid)
+
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+    kill_process_group(pid, signal.SIGKILL)
+
+
+def new_session(preexec_fn=None):
+    """
+    Make preexec_fn for subprocess.Popen which
+    starts process in new session and process group.
+
+    :param preexec_fn: will be called after setsid
+    """
+    def wrapper():
+        os.setsid()
+
+        if preexec_fn:
+            preexec_fn()
+
+    return wrapper
+
+
+def spawn(argv, env=None, cwd=None, stdout=None, stderr=None, **popen_kwargs):
+    """
+    Launch process in new session by subprocess.Popen without shell
+
+    :param argv: command line
+    :type argv: list
+    :param stdout: file object
+    :param stderr: file object
+    :param popen_kwargs: other subprocess.Popen kwargs
+    :rtype: psutil.Popen
+    """
+    return psutil.Popen(
+        argv,
+        env=env,
+        cwd=cwd,
+        stdout=stdout,
+        stderr=stderr,
+        preexec_fn=new_session(popen_kwargs.pop('preexec_fn', None)),
+        **popen_kwargs
+    )
+
+
+def run_parallel(func, items):
+    """
+    Call func for each item in separate thread.
+    First exception will be raised after all calls are done.
+
+    :return: list of results in order of items
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+
+    def target(index, item):
+        try:
+            results[index] = func(item)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=target, args=(i, item))
+        for i, item in enumerate(items)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return results
+
+
 class PidFileObject(object):
 
+    __slots__ = ('_file_path',)
+
     def __init__(self, file_path):
         """
         :param file_path: pid file path
@@ -106,7 +325,7 @@ def which(command, default=''):
     if is_bin(default):
         return default
 
-    for path in os.environ['PATH'].split(os.pathsep):
+    for path in os.environ.get('PATH', '').split(os.pathsep):
         bin_file = os.path.join(path, command)
         if is_bin(bin_file):
             return bin_file
@@ -114,6 +333,53 @@ def which(command, default=''):
     return None
 
 
+_bin_cache = {}
+
+
+def find_bin(names, default=''):
+    """
+    Get full path to bin file by first found name.
+    Result is memoized until PATH is changed.
+
+    :param names: candidates of command name
+    :type names: tuple
+    """
+    key = (tuple(names), default, os.environ.get('PATH'))
+
+    try:
+        return _bin_cache[key]
+    except KeyError:
+        pass
+
+    bin_file = None
+
+    for name in names:
+        bin_file = which(name, default=default)
+        if bin_file:
+            break
+
+    _bin_cache[key] = bin_file
+
+    return bin_file
+
+
+def wait_for(predicate, timeout=10, interval=0.1):
+    """
+    Wait for predicate returns True
+
+    :return: result of last call
+    """
+    deadline = time.time() + timeout
+
+    while True:
+        result = predicate()
+
+        if result or time.time() >= deadline:
+            return bool(result)
+
+        time.sleep(interval)
+
+
 def port_is_free(port):
     """
     Check port is freedom
@@ -132,10 +398,29 @@ def port_is_free(port):
     return bool(result)
 
 
+def make_env(overlay):
+    """
+    Copy of environment with overlay.
+    Variable is removed if value of overlay is None.
+
+    :type overlay: dict
+    """
+    env = dict(os.environ)
+
+    for key, value in overlay.items():
+        if value is None:
+            env.pop(key, None)
+        else:
+            env[key] = str(value)
+
+    return env
+
+
 @contextmanager
 def cd(new_path):
     """
-    Change directory
+    Change directory.
+    It changes cwd of whole process, use cwd param of DaemonRunner for daemons.
 
     :param new_path: path to change
     """
@@ -189,6 +474,91 @@ class RandomizePort(Iterator):
         return cls().next()
 
 
+SOCKETS_DIR = os.path.join(tempfile.gettempdir(), 'noseapp_daemon', 'sockets')
+
+# sun_path is limited by 108 bytes with null byte
+MAX_SOCKET_PATH = 107
+
+_socket_lock = threading.Lock()
+_socket_counter = itertools.count(1)
+_socket_dir = {}
+
+
+def socket_dir():
+    """
+    Directory for unix sockets of current run.
+    It is removed at interpreter exit, directories of
+    dead runs are removed at creation.
+    """
+    pid = os.getpid()
+
+    with _socket_lock:
+        if pid in _socket_dir:
+            return _socket_dir[pid]
+
+        if os.path.isdir(SOCKETS_DIR):
+            for name in os.listdir(SOCKETS_DIR):
+                if name.isdigit() and not process_is_alive(int(name)):
+                    shutil.rmtree(os.path.join(SOCKETS_DIR, name), ignore_errors=True)
+
+        path = os.path.join(SOCKETS_DIR, str(pid))
+
+        try:
+            os.makedirs(path, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        atexit.register(shutil.rmtree, path, True)
+        _socket_dir[pid] = path
+
+        return path
+
+
+def socket_path(name='daemon'):
+    """
+    To get unique path of unix socket in directory of current run.
+
+    Usage:
+        path = socket_path('redis')
+    """
+    path = os.path.join(
+        socket_dir(), '{}-{}.sock'.format(name[:32], next(_socket_counter)),
+    )
+
+    if len(path) > MAX_SOCKET_PATH:
+        raise ValueError(
+            'Path of unix socket is too long: "{}", set shorter TMPDIR'.format(path),
+        )
+
+    return path
+
+
+def remove_socket(path):
+    """
+    Remove unix socket file, other files are not removed
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def unix_socket_is_free(path):
+    """
+    Check nobody accepts connections on unix socket
+    """
+    sock = socket.socket(
+        socket.AF_UNIX,
+        socket.SOCK_STREAM,
+    )
+    result = sock.connect_ex(path)
+    sock.close()
+
+    return bool(result)
+
+
 def set_ulimit_c(soft=None, hard=None):
     """
     Use for preexec_fn param of subprocess.Popen
@@ -199,3 +569,15 @@ def set_ulimit_c(soft=None, hard=None):
         hard = resource.RLIM_INFINITY
 
     resource.setrlimit(resource.RLIMIT_CORE, (soft, hard))
+
+
+def gzip_file(source, destination, chunk_size=1024 * 1024):
+    """
+    Streaming gzip compression, memory usage is bounded by chunk size
+    """
+    with open(source, 'rb') as src:
+        dst = gzip.open(destination, 'wb', 6)
+        try:
+            shutil.copyfileobj(src, dst, chunk_size)
+        finally:
+            dst.close()
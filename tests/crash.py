@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+
+from noseapp_daemon import crash
+from noseapp_daemon import artifacts
+from noseapp_daemon import management
+from noseapp_daemon.runner import DaemonRunner
+
+
+# writes fake core to working directory and kills itself
+CRASH_SCRIPT = 'echo core-data > core; kill -SEGV $$\n'
+
+
+class TestCrashCollector(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.environ[artifacts.ENV_ARTIFACTS_DIR] = os.path.join(self.tmp, 'artifacts')
+
+        self.script = os.path.join(self.tmp, 'crash.sh')
+        with open(self.script, 'w') as fp:
+            fp.write(CRASH_SCRIPT)
+
+    def tearDown(self):
+        del os.environ[artifacts.ENV_ARTIFACTS_DIR]
+        shutil.rmtree(self.tmp)
+
+    def test_glob_specifiers(self):
+        self.assertEqual(crash.glob_specifiers('core.%e.%p'), 'core.*.*')
+        self.assertEqual(crash.glob_specifiers('core'), 'core')
+
+    def test_locate_cores(self):
+        core = os.path.join(self.tmp, 'core')
+        with open(core, 'w') as fp:
+            fp.write('core')
+
+        self.assertEqual(crash.locate_cores(1, self.tmp), [core])
+        self.assertEqual(crash.locate_cores(1, self.tmp, since=time.time() + 60), [])
+
+    def test_collect_core(self):
+        m = management.DaemonManagement()
+        m.add_daemon(DaemonRunner('crasher', cmd_prefix='sh', daemon_bin=self.script, temp_workdir=True))
+
+        collector = m.collect_crashes(gdb=False)
+        if not crash.core_globs(None, self.tmp):
+            self.skipTest('cores are piped to handler')
+
+        daemon = m.daemon('crasher')
+        daemon.start()
+        daemon.wait_ready()
+        self.assertTrue(daemon.wait(timeout=5).exit_code)
+
+        # crash is collected without stop
+        daemon.exit_future.wait_callbacks(timeout=5)
+        collector.join()
+        self.assertEqual(len(collector.crashes), 1)
+
+        daemon.stop()
+        self.assertEqual(len(collector.crashes), 1)
+        self.assertEqual(crash.crash_dirs(artifacts.root_dir(), name='crasher'), collector.crashes)
+        self.assertEqual(crash.crash_dirs(artifacts.root_dir(), name='crash'), [])
+
+        collector.detach(m.events)
+        self.assertNotIn(collector.on_crashed, [s[0] for s in m.events.subscribers])
+
+        crash_dir = collector.crashes[0]
+        self.assertEqual(sorted(os.listdir(crash_dir)), ['core.gz', 'crash.txt'])
+
+        with open(os.path.join(crash_dir, 'crash.txt')) as fp:
+            self.assertIn('daemon: crasher', fp.read())
+
+        with gzip.open(os.path.join(crash_dir, 'core.gz')) as fp:
+            self.assertEqual(fp.read(), 'core-data\n')
+
+    def test_enforce_quota(self):
+        root = os.path.join(self.tmp, 'quota')
+        paths = []
+
+        for i in range(3):
+            path = os.path.join(root, 'test', 'daemon-crash-{}'.format(i))
+            os.makedirs(path)
+            with open(os.path.join(path, 'core.gz'), 'w') as fp:
+                fp.write('x' * 100)
+            open(os.path.join(path, crash.CRASH_INFO), 'w').close()
+            os.utime(path, (1000 + i, 1000 + i))
+            paths.append(path)
+
+        # profile of daemon which name looks like crash directory
+        profile = os.path.join(root, 'test', 'daemon-crash-1-profile-1')
+        os.makedirs(profile)
+        with open(os.path.join(profile, 'perf.data'), 'w') as fp:
+            fp.write('x' * 100)
+
+        self.assertEqual(crash.enforce_quota(root, 250), [paths[0]])
+        self.assertEqual(crash.enforce_quota(root, 250), [])
+        self.assertEqual(crash.enforce_quota(root, 0), paths[1:])
+        self.assertTrue(os.path.isdir(profile))
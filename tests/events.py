@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from unittest import TestCase
+
+from noseapp_daemon import utils
+from noseapp_daemon import events
+from noseapp_daemon import management
+from noseapp_daemon.runner import DaemonRunner
+
+from .daemon import create_fake_daemon
+
+
+class CrashedDaemon(DaemonRunner):
+
+    cmd = 'exit 3'
+
+
+class TestEventBus(TestCase):
+
+    def test_sync_subscribers_order(self):
+        calls = []
+        parent = events.EventBus()
+        bus = events.EventBus(parent=parent)
+
+        bus.subscribe(lambda e: calls.append(('first', e.name)))
+        bus.subscribe(lambda e: calls.append(('second', e.name)), events=[events.STARTED])
+        parent.subscribe(lambda e: calls.append(('parent', e.name)))
+
+        bus.emit(events.STARTING, 'source')
+        bus.emit(events.STARTED, 'source')
+
+        self.assertEqual(calls, [
+            ('first', events.STARTING),
+            ('parent', events.STARTING),
+            ('first', events.STARTED),
+            ('second', events.STARTED),
+            ('parent', events.STARTED),
+        ])
+
+    def test_subscriber_error(self):
+        calls = []
+        bus = events.EventBus()
+
+        def error(event):
+            raise ValueError()
+
+        bus.subscribe(error)
+        bus.subscribe(calls.append)
+        event = bus.emit(events.READY, 'source')
+
+        self.assertEqual(calls, [event])
+
+    def test_async_subscribers_order(self):
+        pool = events.DispatchPool(size=2)
+        bus = events.EventBus(pool=pool)
+        main_thread = threading.current_thread()
+        calls = []
+
+        def subscriber(event):
+            time.sleep(0.001)
+            calls.append((event.source, event.data['n'], threading.current_thread() is main_thread))
+
+        bus.subscribe(subscriber, asynchronous=True)
+
+        for n in range(20):
+            bus.emit(events.STARTED, 'a', n=n)
+            bus.emit(events.STARTED, 'b', n=n)
+
+        pool.join()
+
+        for source in ('a', 'b'):
+            self.assertEqual([c[1] for c in calls if c[0] == source], list(range(20)))
+        self.assertFalse(any(c[2] for c in calls))
+
+
+    def test_concurrent_submit(self):
+        pool = events.DispatchPool(size=16)
+        bus = events.EventBus(pool=pool)
+        calls = []
+        go = threading.Event()
+
+        bus.subscribe(calls.append, asynchronous=True)
+
+        def emit(n):
+            go.wait()
+            bus.emit(events.STARTED, n)
+
+        threads = [threading.Thread(target=emit, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+
+        # workers are started by first submits at the same time
+        go.set()
+        for thread in threads:
+            thread.join()
+        pool.join()
+
+        self.assertEqual(sorted(e.source for e in calls), list(range(16)))
+
+
+class TestRunnerEvents(TestCase):
+
+    def test_lifecycle_events(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('test'))
+
+        daemon_events = []
+        management_events = []
+
+        daemon = m.daemon('test')
+        daemon.events.subscribe(lambda e: daemon_events.append(e.name))
+        m.subscribe(lambda e: management_events.append((e.source.name, e.name)))
+
+        daemon.start()
+        daemon.wait_ready(timeout=1)
+        daemon.restart()
+        daemon.stop()
+
+        expected = [
+            events.STARTING, events.STARTED, events.READY,
+            events.STOPPING, events.STOPPED,
+            events.STARTING, events.STARTED, events.RESTARTED,
+            events.STOPPING, events.STOPPED,
+        ]
+        self.assertEqual(daemon_events, expected)
+        self.assertEqual(management_events, [('test', e) for e in expected])
+
+    def test_crashed_event(self):
+        calls = []
+        daemon = CrashedDaemon('crash', daemon_bin=utils.which('ls', default='/bin/ls'))
+        daemon.events.subscribe(calls.append, events=[events.CRASHED])
+
+        daemon.start()
+        # crash is reported without stop
+        utils.wait_for(lambda: calls, timeout=5, interval=0.01)
+        daemon.stop()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0].data, {'exit_code': 3})
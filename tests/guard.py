@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+from unittest import TestCase
+
+import psutil
+
+from noseapp_daemon import guard
+
+from .daemon import create_fake_daemon
+
+
+class TestShutdownGuard(TestCase):
+
+    def setUp(self):
+        self.registry_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.registry_dir, ignore_errors=True)
+
+    def test_marker(self):
+        marker = guard.make_marker(os.getpid())
+
+        self.assertTrue(marker.startswith('{}-'.format(os.getpid())))
+        self.assertTrue(guard.marker_is_alive(marker))
+        self.assertFalse(guard.marker_is_alive('{}-0'.format(os.getpid())))
+        self.assertFalse(guard.marker_is_alive(None))
+
+    def test_register_unregister(self):
+        shutdown_guard = guard.ShutdownGuard(registry_dir=self.registry_dir)
+        process = psutil.Popen('sleep 30', shell=True)
+
+        try:
+            shutdown_guard._installed = True
+            shutdown_guard.register(process)
+            self.assertTrue(os.path.isfile(shutdown_guard.registry_file))
+
+            shutdown_guard.unregister(process)
+            self.assertFalse(os.path.isfile(shutdown_guard.registry_file))
+
+            shutdown_guard.register(process)
+            shutdown_guard.kill_all()
+            self.assertFalse(process.is_running())
+            self.assertEqual(shutdown_guard.processes, [])
+        finally:
+            if process.is_running():
+                process.kill()
+
+    def test_registry_is_appended(self):
+        shutdown_guard = guard.ShutdownGuard(registry_dir=self.registry_dir)
+        shutdown_guard._installed = True
+        processes = [psutil.Popen('sleep 30', shell=True) for _ in range(2)]
+
+        try:
+            for process in processes:
+                shutdown_guard.register(process)
+
+            with open(shutdown_guard.registry_file) as fp:
+                self.assertEqual(
+                    fp.read().split(), [guard.make_marker(p.pid) for p in processes],
+                )
+
+            shutdown_guard.unregister(processes[0])
+            self.assertTrue(os.path.isfile(shutdown_guard.registry_file))
+        finally:
+            shutdown_guard.kill_all()
+
+        self.assertFalse(os.path.isfile(shutdown_guard.registry_file))
+
+    def test_signal_handler_with_held_lock(self):
+        shutdown_guard = guard.ShutdownGuard(registry_dir=self.registry_dir)
+        shutdown_guard._installed = True
+        shutdown_guard._previous_handlers[signal.SIGTERM] = lambda signum, frame: None
+        process = psutil.Popen('sleep 30', shell=True)
+
+        try:
+            shutdown_guard.register(process)
+
+            # signal is received inside register of other process
+            with shutdown_guard._lock:
+                shutdown_guard._signal_handler(signal.SIGTERM, None)
+
+            self.assertFalse(process.is_running())
+            self.assertFalse(os.path.isfile(shutdown_guard.registry_file))
+        finally:
+            if process.is_running():
+                process.kill()
+
+    def test_install_outside_main_thread(self):
+        shutdown_guard = guard.ShutdownGuard(registry_dir=self.registry_dir)
+        previous = dict((s, signal.getsignal(s)) for s in (signal.SIGINT, signal.SIGTERM))
+
+        thread = threading.Thread(target=shutdown_guard.install)
+        thread.start()
+        thread.join()
+        self.assertFalse(shutdown_guard._installed)
+
+        try:
+            shutdown_guard.install()
+            self.assertTrue(shutdown_guard._installed)
+            self.assertEqual(signal.getsignal(signal.SIGTERM), shutdown_guard._signal_handler)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def test_sweep_orphans(self):
+        process = subprocess.Popen(['sleep', '30'])
+
+        try:
+            registry_file = os.path.join(self.registry_dir, '1-0' + guard.REGISTRY_EXT)
+            with open(registry_file, 'w') as fp:
+                fp.write('{}\n'.format(guard.make_marker(process.pid)))
+
+            pids, files = guard.find_orphans(registry_dir=self.registry_dir)
+            self.assertIn(process.pid, pids)
+            self.assertEqual(files, [registry_file])
+
+            guard.sweep_orphans(registry_dir=self.registry_dir)
+            self.assertIsNotNone(process.poll())
+            self.assertFalse(os.path.exists(registry_file))
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+    def test_daemon_is_registered(self):
+        daemon = create_fake_daemon()
+
+        daemon.start()
+        self.assertIn(daemon.process.pid, guard.shutdown_guard._processes)
+        self.assertEqual(os.environ[guard.ENV_MARKER], guard.shutdown_guard.marker)
+
+        pid = daemon.process.pid
+        daemon.stop()
+        self.assertNotIn(pid, guard.shutdown_guard._processes)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import time
+import socket
+from unittest import TestCase
+
+from noseapp_daemon import utils
+from noseapp_daemon import health
+from noseapp_daemon import runner
+
+from .daemon import create_fake_daemon
+
+
+class TestHistogram(TestCase):
+
+    def test_percentiles(self):
+        histogram = health.Histogram(buckets=(0.001, 0.01, 0.1, float('inf')))
+
+        self.assertIsNone(histogram.p50)
+
+        for _ in range(98):
+            histogram.record(0.0005)
+        histogram.record(0.05)
+        histogram.record(5)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.p50, 0.001)
+        self.assertEqual(histogram.p99, 0.1)
+        self.assertEqual(histogram.percentile(100), float('inf'))
+
+
+class TestHealthMonitor(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(16)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_tcp_probe(self):
+        probe = health.TCPProbe(self.server.getsockname()[1])
+        self.assertTrue(probe())
+
+    def test_unix_socket_probe(self):
+        path = utils.socket_path('probe')
+        probe = health.UnixSocketProbe(path)
+
+        self.assertRaises(socket.error, probe)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(1)
+        try:
+            self.assertTrue(probe())
+        finally:
+            server.close()
+            utils.remove_socket(path)
+
+    def test_monitor(self):
+        calls = []
+
+        class Plugin(runner.DaemonPlugin):
+
+            def threshold_crossed(self, daemon, probe, latency):
+                calls.append((daemon, probe, latency))
+
+        daemon = create_fake_daemon(plugin=Plugin())
+        monitor = health.HealthMonitor()
+
+        failed = health.CallableProbe(lambda: False)
+        monitor.add(daemon, health.TCPProbe(self.server.getsockname()[1]), interval=0.05)
+        monitor.add(daemon, failed, interval=0.05)
+
+        daemon.start()
+        try:
+            monitor.start()
+            time.sleep(0.2)
+            monitor.stop()
+        finally:
+            daemon.stop()
+
+        tcp_stats, failed_stats = monitor.stats(daemon.name)
+
+        self.assertGreater(tcp_stats['count'], 1)
+        self.assertEqual(tcp_stats['failures'], 0)
+        self.assertTrue(tcp_stats['healthy'])
+        self.assertIsNotNone(tcp_stats['p99'])
+
+        self.assertEqual(failed_stats['failures'], failed_stats['count'])
+        self.assertEqual(calls, [(daemon, failed, None)])
+
+    def test_remove(self):
+        daemon = create_fake_daemon()
+        monitor = health.HealthMonitor()
+
+        calls = []
+        probe = health.CallableProbe(lambda: calls.append(1) or True)
+        check = monitor.add(daemon, probe, interval=0.01)
+
+        daemon.start()
+        try:
+            monitor.start()
+            utils.wait_for(lambda: calls, timeout=2, interval=0.01)
+
+            self.assertEqual(monitor.remove(daemon.name), [check])
+            count = len(calls)
+            time.sleep(0.1)
+            monitor.stop()
+        finally:
+            daemon.stop()
+
+        # check which was running at remove can be finished
+        self.assertLessEqual(len(calls), count + 1)
+        self.assertEqual(monitor.checks(daemon.name), [])
+        self.assertEqual(monitor.stats(daemon.name), [])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import subprocess
+from unittest import TestCase
+
+
+# seconds, cold import of package without heavy dependencies is about 1 ms
+IMPORT_TIME_BUDGET = 0.05
+
+HEAVY_MODULES = ('psutil', 'noseapp', 'urllib2')
+
+ROOT_DIR = os.path.abspath(
+    os.path.join(
+        os.path.dirname(__file__),
+        '..',
+    ),
+)
+
+
+def run_python(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in (ROOT_DIR, env.get('PYTHONPATH')) if p
+    )
+    return subprocess.check_output([sys.executable, '-c', code], env=env).strip()
+
+
+class TestImports(TestCase):
+
+    def test_heavy_modules_are_not_imported(self):
+        code = (
+            'import sys\n'
+            'import noseapp_daemon\n'
+            'from noseapp_daemon import runner, management\n'
+            'print(",".join(m for m in {!r} if m in sys.modules))\n'
+        ).format(HEAVY_MODULES)
+
+        self.assertEqual(run_python(code), '')
+
+    def test_import_time_budget(self):
+        code = (
+            'import time\n'
+            'start = time.time()\n'
+            'import noseapp_daemon\n'
+            'print(time.time() - start)\n'
+        )
+        best = min(float(run_python(code)) for _ in range(3))
+
+        self.assertLess(best, IMPORT_TIME_BUDGET)
+
+    def test_lazy_exports(self):
+        code = (
+            'import noseapp_daemon\n'
+            'from noseapp_daemon import DaemonRunner, Options\n'
+            'print(DaemonRunner.__module__ + " " + noseapp_daemon.presets.__name__)\n'
+        )
+
+        self.assertEqual(run_python(code), 'noseapp_daemon.runner noseapp_daemon.presets')
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import SocketServer
+import BaseHTTPServer
+from unittest import TestCase
+
+from noseapp_daemon import load
+from noseapp_daemon import utils
+
+from .daemon import create_fake_daemon
+
+
+class EchoHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.wfile.write(line)
+
+
+class HTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status = 200 if self.path == '/' else 404
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadingUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class TestLoadHarness(TestCase):
+
+    def setUp(self):
+        self.daemon = create_fake_daemon('load')
+        self.daemon.start()
+        self.servers = []
+
+    def tearDown(self):
+        self.daemon.stop()
+
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def serve(self, handler):
+        server = ThreadingServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.servers.append(server)
+        return server.server_address[1]
+
+    def test_tcp_load(self):
+        port = self.serve(EchoHandler)
+        request = load.TCPRequest(port, b'ping\n', response_end=b'\n')
+
+        result = self.daemon.run_load(request, requests=200, concurrency=4, sample_interval=0.01)
+
+        self.assertEqual(result.requests, 200)
+        self.assertEqual(result.errors, 0)
+        self.assertGreater(result.throughput, 0)
+        self.assertIsNotNone(result.histogram.p99)
+        self.assertGreater(result.resources['rss_max'], 0)
+
+    def test_unix_load(self):
+        path = utils.socket_path('echo')
+        server = ThreadingUnixServer(path, EchoHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.servers.append(server)
+
+        request = load.UnixRequest(path, b'ping\n', response_end=b'\n')
+        result = self.daemon.run_load(request, requests=100, concurrency=2)
+
+        self.assertEqual(result.requests, 100)
+        self.assertEqual(result.errors, 0)
+
+    def test_http_load(self):
+        port = self.serve(HTTPHandler)
+
+        result = self.daemon.run_load(
+            load.HTTPRequest('http://127.0.0.1:{}/'.format(port)), requests=50, concurrency=2,
+        )
+        self.assertEqual(result.stats()['errors'], 0)
+
+        result = self.daemon.run_load(
+            load.HTTPRequest('http://127.0.0.1:{}/missing'.format(port)), requests=10, concurrency=2,
+        )
+        self.assertEqual(result.errors, 10)
+
+    def test_rate(self):
+        port = self.serve(EchoHandler)
+        request = load.TCPRequest(port, b'ping\n', response_end=b'\n')
+
+        start = time.time()
+        result = load.LoadHarness(self.daemon, request, concurrency=4, rate=200).run(duration=0.25)
+
+        self.assertGreaterEqual(time.time() - start, 0.25)
+        self.assertLessEqual(result.requests, 55)
+
+    def test_rate_latency_from_schedule(self):
+        class SlowRequest(object):
+
+            def connect(self):
+                return object()
+
+            def __call__(self, conn):
+                time.sleep(0.1)
+                return True
+
+        result = load.LoadHarness(self.daemon, SlowRequest(), concurrency=1, rate=100).run(requests=5)
+
+        # 5th request is scheduled at 0.04s but sent after 0.4s of earlier requests
+        self.assertGreaterEqual(result.histogram.p99, 0.4)
+
+    def test_connection_errors(self):
+        result = load.LoadHarness(
+            self.daemon, load.TCPRequest(1, b'ping\n'), concurrency=2,
+        ).run(requests=10)
+
+        self.assertEqual(result.errors, 10)
+        self.assertEqual(result.throughput, 0)
+
+    def test_connection_pool(self):
+        opened = []
+        pool = load.ConnectionPool(lambda: opened.append(object()) or opened[-1])
+
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(pool.size, 1)
+
+        pool.release(conn, broken=True)
+        self.assertEqual(pool.size, 0)
+        self.assertIsNot(pool.acquire(), conn)
+
+    def test_requires_limit(self):
+        harness = load.LoadHarness(self.daemon, load.TCPRequest(1, b''))
+        self.assertRaises(ValueError, harness.run)
@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import os
+import shutil
+import signal
+import tempfile
+import threading
 from unittest import TestCase
 from collections import OrderedDict
 
+from noseapp_daemon import utils
 from noseapp_daemon import runner
 from noseapp_daemon import management
+from noseapp_daemon.pool import DaemonPool
 
 from .daemon import TestService
 from .daemon import create_fake_daemon
@@ -103,3 +110,233 @@ class TestDaemonManagement(TestCase):
 
         self.assertIsInstance(m.daemons, OrderedDict)
         self.assertIn(daemon.name, m.daemons)
+
+    def test_parse_selector(self):
+        self.assertEqual(
+            management.parse_selector('role=web, uwsgi'),
+            frozenset(['role=web', 'uwsgi']),
+        )
+        self.assertEqual(
+            management.parse_selector({'shard': 'B'}),
+            frozenset(['shard=B']),
+        )
+
+    def test_select_daemons(self):
+        m = management.DaemonManagement()
+
+        m.add_daemon(create_fake_daemon('web1', tags=['uwsgi'], labels={'shard': 'A'}))
+        m.add_daemon(create_fake_daemon('web2', tags=['uwsgi'], labels={'shard': 'B'}))
+        m.add_daemon(create_fake_daemon('db', labels={'shard': 'B'}))
+
+        names = lambda daemons: [d.name for d in daemons]
+
+        self.assertEqual(names(m.select_daemons('uwsgi')), ['web1', 'web2'])
+        self.assertEqual(names(m.select_daemons('shard=B')), ['web2', 'db'])
+        self.assertEqual(names(m.select_daemons('uwsgi,shard=B')), ['web2'])
+        self.assertEqual(m.select_daemons('shard=C'), [])
+
+        m.add_daemon(create_fake_daemon('web2', labels={'shard': 'C'}))
+        self.assertEqual(names(m.select_daemons('uwsgi')), ['web1'])
+        self.assertEqual(names(m.select_daemons('shard=C')), ['web2'])
+
+    def test_select_services(self):
+        m = management.DaemonManagement()
+        m.add_service(TestService(labels={'role': 'web'}))
+
+        self.assertEqual(len(m.select_services('role=web')), 1)
+        self.assertEqual(m.select_services('role=db'), [])
+
+    def test_start_stop_by_selector(self):
+        m = management.DaemonManagement()
+
+        m.add_service(TestService(labels={'role': 'web'}))
+        m.add_daemon(create_fake_daemon('web', labels={'role': 'web'}))
+        m.add_daemon(create_fake_daemon('db', labels={'role': 'db'}))
+
+        service = m.service(TestService.name)
+
+        m.start(selector='role=web')
+        self.assertTrue(m.daemon('web').started)
+        self.assertTrue(service.daemon.started)
+        self.assertFalse(m.daemon('db').started)
+
+        m.stop(selector='role=web')
+        self.assertTrue(m.daemon('web').stopped)
+        self.assertTrue(service.daemon.stopped)
+
+    def test_add_probe(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('test'))
+
+        m.add_probe('test', lambda: True, interval=0.5)
+
+        self.assertEqual(len(m.health.checks('test')), 1)
+        self.assertEqual(m.health_stats('test')[0]['count'], 0)
+        self.assertRaises(management.DaemonNotFound, m.add_probe, 'unknown', lambda: True)
+
+        probe = lambda: True
+        m.add_probe('test', probe)
+        self.assertEqual([c.probe for c in m.remove_probe('test', probe)], [probe])
+        self.assertEqual(len(m.health.checks('test')), 1)
+
+        m.remove_daemon('test')
+        self.assertEqual(m.health.checks('test'), [])
+
+    def test_rolling_restart(self):
+        m = management.DaemonManagement()
+
+        for i in range(4):
+            m.add_daemon(create_fake_daemon('backend{}'.format(i), labels={'role': 'backend'}))
+        m.add_daemon(create_fake_daemon('db', labels={'role': 'db'}))
+
+        lock = threading.Lock()
+        drained = set()
+        max_drained = [0]
+
+        def drain(daemon):
+            with lock:
+                drained.add(daemon.name)
+                max_drained[0] = max(max_drained[0], len(drained))
+
+        def undrain(daemon):
+            self.assertTrue(daemon.started)
+            with lock:
+                drained.discard(daemon.name)
+
+        m.start_all()
+        try:
+            pids = dict((d.name, d.process.pid) for d in m.daemons.values())
+
+            m.rolling_restart('role=backend', batch_size=2, drain=drain, undrain=undrain)
+
+            self.assertEqual(max_drained[0], 2)
+            self.assertEqual(drained, set())
+
+            for daemon in m.daemons.values():
+                self.assertTrue(daemon.started)
+                if daemon.name == 'db':
+                    self.assertEqual(daemon.process.pid, pids['db'])
+                else:
+                    self.assertNotEqual(daemon.process.pid, pids[daemon.name])
+        finally:
+            m.stop_all()
+
+    def test_wait_ready(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('test'))
+
+        daemon = m.daemon('test')
+        probes = []
+        wait_ready = daemon.wait_ready
+
+        def counted_wait_ready(*args, **kwargs):
+            probes.append(threading.current_thread())
+            return wait_ready(*args, **kwargs)
+
+        m.start_all()
+        try:
+            self.assertFalse(m.is_ready('test'))
+
+            daemon_wait_ready = runner.DaemonRunner.wait_ready
+            runner.DaemonRunner.wait_ready = lambda d, *a, **kw: counted_wait_ready(*a, **kw)
+            try:
+                generations = utils.run_parallel(lambda _: m.wait_ready('test'), range(8))
+            finally:
+                runner.DaemonRunner.wait_ready = daemon_wait_ready
+
+            self.assertEqual(len(set(generations)), 1)
+            self.assertEqual(len(probes), 1)
+            self.assertTrue(m.is_ready('test'))
+
+            daemon.restart()
+            self.assertFalse(m.is_ready('test'))
+            self.assertGreater(m.wait_ready('test'), generations[0])
+        finally:
+            m.stop_all()
+
+        self.assertFalse(m.is_ready('test'))
+
+    def test_crash_resets_ready(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('test'))
+        daemon = m.daemon('test')
+
+        m.start_all()
+        try:
+            generation = m.wait_ready('test')
+            self.assertTrue(m.is_ready('test'))
+
+            os.kill(daemon.process.pid, signal.SIGKILL)
+            daemon.wait(timeout=5)
+            daemon.exit_future.wait_callbacks(timeout=5)
+
+            self.assertTrue(daemon.is_dead)
+            self.assertFalse(m.is_ready('test'))
+
+            # daemon is probed again
+            probes = []
+            daemon_wait_ready = runner.DaemonRunner.wait_ready
+            runner.DaemonRunner.wait_ready = lambda d, *a, **kw: probes.append(d)
+            try:
+                self.assertGreater(m.wait_ready('test'), generation)
+            finally:
+                runner.DaemonRunner.wait_ready = daemon_wait_ready
+
+            self.assertEqual(probes, [daemon])
+        finally:
+            m.stop_all()
+
+    def test_pool_start_error(self):
+        class FailedPlugin(runner.DaemonPlugin):
+
+            def before_start(self, daemon):
+                raise runner.DaemonError('start error')
+
+        def on_remove(daemon):
+            raise KeyError('remove error')
+
+        pool = DaemonPool(create_fake_daemon('failed', plugin=FailedPlugin()), on_remove=on_remove)
+
+        # start error is raised, not cleanup error
+        self.assertRaises(runner.DaemonError, pool.scale_to, 2)
+        self.assertEqual(pool.size, 0)
+
+    def test_pool(self):
+        m = management.DaemonManagement()
+        tmp = tempfile.mkdtemp()
+
+        template = create_fake_daemon('worker', stdout=os.path.join(tmp, 'worker.log'))
+        pool = m.add_pool(template, size=2, port_option='--port')
+
+        try:
+            self.assertIs(m.pool('worker'), pool)
+            self.assertEqual([d.name for d in pool], ['worker-1', 'worker-2'])
+            self.assertEqual(len(m.select_daemons('pool=worker')), 2)
+            self.assertTrue(all(d.started for d in pool))
+
+            ports = set(d.get_cmd_option('--port') for d in pool)
+            self.assertEqual(len(ports), 2)
+            self.assertEqual(pool.daemons[1].stdout, os.path.join(tmp, 'worker-2.log'))
+
+            pool.scale_to(4)
+            self.assertEqual(len(m.select_daemons('pool=worker')), 4)
+            self.assertTrue(all(d.started for d in pool))
+
+            for daemon in pool:
+                m.add_probe(daemon.name, lambda: True)
+
+            removed = pool.scale_to(1)
+            self.assertEqual([d.name for d in removed], ['worker-2', 'worker-3', 'worker-4'])
+            self.assertTrue(all(d.stopped for d in removed))
+            self.assertEqual(list(m.daemons), ['worker-1'])
+            self.assertEqual(m.health.checks('worker-2'), [])
+            self.assertEqual(len(m.health.checks('worker-1')), 1)
+            self.assertEqual(template.get_cmd_option('--port'), None)
+
+            uwsgi_like = m.add_pool(create_fake_daemon('uwsgi_like'), size=1, port_option='--socket', port_format=':{}')
+            self.assertTrue(uwsgi_like.daemons[0].get_cmd_option('--socket').startswith(':'))
+        finally:
+            m.stop_all()
+            shutil.rmtree(tmp)
+
+        self.assertRaises(management.PoolNotFound, m.pool, 'unknown')
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import shutil
+import tempfile
+from unittest import TestCase
+
+from noseapp_daemon import utils
+from noseapp_daemon import output
+from noseapp_daemon.runner import DaemonRunner
+
+
+# writes numbered lines to stdout and stderr and sleeps
+NOISY_SCRIPT = (
+    'i=0\n'
+    'while [ $i -lt 1000 ]; do echo "line $i"; echo "error $i" >&2; i=$((i+1)); done\n'
+    'echo done\n'
+    'exec sleep 60\n'
+)
+
+
+class TestOutputPolicies(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+        self.script = os.path.join(self.tmp, 'noisy.sh')
+        with open(self.script, 'w') as fp:
+            fp.write(NOISY_SCRIPT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_daemon(self, done, stdout=None, stderr=None):
+        """
+        :param done: function returns True when all output was written
+        """
+        daemon = DaemonRunner('noisy', cmd_prefix='sh', daemon_bin=self.script, stdout=stdout, stderr=stderr)
+        daemon.start()
+        try:
+            self.assertTrue(utils.wait_for(done, timeout=5))
+        finally:
+            daemon.stop()
+
+    def test_ring_buffer(self):
+        ring = output.RingBuffer(max_lines=10)
+        self.run_daemon(lambda: ring.lines()[-1:] == [b'done\n'], stdout=ring, stderr=output.DISCARD)
+
+        lines = ring.lines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[0], b'line 991\n')
+
+    def test_parallel_daemons(self):
+        rings = [output.RingBuffer(max_lines=10) for _ in range(8)]
+        daemons = [
+            DaemonRunner('noisy_{}'.format(i), cmd_prefix='sh', daemon_bin=self.script, stdout=ring, stderr=output.DISCARD)
+            for i, ring in enumerate(rings)
+        ]
+
+        utils.run_parallel(lambda d: d.start(), daemons)
+        try:
+            self.assertTrue(utils.wait_for(
+                lambda: all(r.lines()[-1:] == [b'done\n'] for r in rings), timeout=10,
+            ))
+
+            # pipes are not inherited by other daemons, end of output is seen at stop
+            for daemon, ring in zip(daemons, rings):
+                thread = ring._thread
+                daemon.stop()
+                self.assertFalse(thread.is_alive())
+        finally:
+            utils.run_parallel(lambda d: d.stop(), daemons)
+
+    def test_ring_buffer_max_bytes(self):
+        ring = output.RingBuffer(max_lines=1000, max_bytes=100)
+        ring.write_line(b'x' * 60)
+        ring.write_line(b'y' * 60)
+
+        self.assertEqual(ring.getvalue(), b'y' * 60)
+
+    def test_shared_stream(self):
+        ring = output.RingBuffer(max_lines=3000)
+        self.run_daemon(lambda: b'done\n' in ring.lines(), stdout=ring, stderr=ring)
+
+        lines = ring.lines()
+        self.assertIn(b'error 999\n', lines)
+        self.assertEqual(len([l for l in lines if l.startswith((b'line', b'error'))]), 2000)
+
+    def test_sampled(self):
+        ring = output.RingBuffer(max_lines=1000)
+        sampled = output.Sampled(ring, every=100)
+
+        for i in range(1000):
+            sampled.write_line(b'line %d\n' % i)
+
+        self.assertEqual(len(ring.lines()), 10)
+        self.assertEqual(ring.lines()[1], b'line 100\n')
+
+    def test_rotating_file(self):
+        path = os.path.join(self.tmp, 'noisy.log')
+        rotating = output.RotatingFile(path, max_bytes=1000, backups=2)
+
+        def done():
+            if not os.path.exists(path):
+                return False
+            with open(path) as fp:
+                return fp.read().endswith('done\n')
+
+        self.run_daemon(done, stdout=rotating, stderr=output.DISCARD)
+
+        self.assertLessEqual(os.path.getsize(path), 1000)
+        self.assertFalse(os.path.exists(path + '.3.gz'))
+
+        with gzip.open(path + '.1.gz') as fp:
+            self.assertTrue(fp.read().startswith('line '))
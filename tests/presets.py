@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import socket
+import hashlib
+import tempfile
+import threading
+import subprocess
+from unittest import TestCase
+
+from noseapp_daemon import utils
+from noseapp_daemon import health
+from noseapp_daemon import presets
+from noseapp_daemon.runner import DaemonError
+
+from .daemon import SELF_PATH
+from .daemon import PYTHON_BIN
+
+
+LS_BIN = utils.which('ls', default='/bin/ls')
+
+
+class FakeUnixServer(object):
+    """
+    Sends response to each connection and closes it
+    """
+
+    def __init__(self, path, response):
+        self.response = response
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(16)
+
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            conn.sendall(json.dumps(self.response).encode('utf-8'))
+            conn.close()
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+class TestPresetDaemon(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.environ.get('PATH')
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.tmp)
+
+    def make_bin(self, name):
+        bin_file = os.path.join(self.tmp, name)
+        with open(bin_file, 'w') as fp:
+            fp.write('#!/bin/sh\n')
+        os.chmod(bin_file, 0o755)
+        return bin_file
+
+    def test_lazy_bin_lookup(self):
+        class FakeDaemon(presets.PresetDaemon):
+            DEFAULT_NAME = 'fake'
+            BINARY_NAMES = ('fake-daemon-bin', 'fake-daemon')
+
+        self.assertIsNone(FakeDaemon.DAEMON_BIN)
+
+        bin_file = self.make_bin('fake-daemon')
+        self.assertIsNone(FakeDaemon.DAEMON_BIN)
+
+        os.environ['PATH'] = os.pathsep.join([self.path, self.tmp])
+        self.assertEqual(FakeDaemon.DAEMON_BIN, bin_file)
+        self.assertEqual(FakeDaemon().daemon_bin, bin_file)
+
+    def test_declarative_options(self):
+        os.environ['PATH'] = os.pathsep.join([self.path, self.tmp])
+        bin_file = self.make_bin('redis-server')
+
+        redis = presets.RedisDaemon()
+        self.assertEqual(redis.name, 'redis')
+        self.assertEqual(redis.port, 6379)
+        self.assertEqual(redis.get_cmd(), '{} --daemonize no'.format(bin_file))
+        self.assertFalse(redis.ready)
+
+        redis = presets.RedisDaemon('redis_1')
+        redis.add_cmd_option('--port', 6380)
+        self.assertEqual(redis.name, 'redis_1')
+        self.assertEqual(redis.port, 6380)
+
+    def test_unix_socket(self):
+        os.environ['PATH'] = os.pathsep.join([self.path, self.tmp])
+        self.make_bin('redis-server')
+        self.make_bin('memcached')
+
+        redis = presets.RedisDaemon(unix_socket=True)
+        self.assertTrue(redis.unix_socket.startswith(utils.socket_dir()))
+        self.assertEqual(redis.sockets, [redis.unix_socket])
+        self.assertEqual(redis.port, 0)
+        self.assertEqual(redis.get_cmd_option('--unixsocket'), redis.unix_socket)
+        self.assertIsInstance(redis.ready_probe(), health.UnixSocketProbe)
+
+        path = os.path.join(self.tmp, 'memcached.sock')
+        memcached = presets.MemcachedDaemon(unix_socket=path)
+        self.assertEqual(memcached.get_cmd_option('-s'), path)
+        self.assertEqual(memcached.ready_probe().path, path)
+
+        self.assertIsNone(presets.PostgresDaemon.SOCKET_OPTION)
+
+        class FakeDaemon(presets.PresetDaemon):
+            DEFAULT_NAME = 'fake'
+            DEFAULT_BIN = LS_BIN
+
+        self.assertRaises(DaemonError, FakeDaemon, unix_socket=True)
+
+    def test_remove_state(self):
+        for name in ('00001.snap', '00001.xlog', 'config.cfg'):
+            open(os.path.join(self.tmp, name), 'w').close()
+
+        presets.TarantoolDaemon.remove_snapshots(cwd=self.tmp)
+        self.assertEqual(os.listdir(self.tmp), ['config.cfg'])
+
+
+FAKE_NGINX = '''#!/bin/sh
+echo "$@" >> {calls}
+echo "$(pwd) $NGINX_TEST_VAR" > {calls}.env
+grep -q broken {config} && echo "config is broken" && exit 1
+exit 0
+'''
+
+STUB_STATUS = '''Active connections: 291
+server accepts handled requests
+ 16630948 16630948 31070465
+Reading: 6 Writing: 179 Waiting: 106
+'''
+
+
+class TestNGINXDaemon(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.calls = os.path.join(self.tmp, 'calls')
+        self.config = os.path.join(self.tmp, 'nginx.conf')
+        self.bin = os.path.join(self.tmp, 'nginx')
+
+        with open(self.bin, 'w') as fp:
+            fp.write(FAKE_NGINX.format(calls=self.calls, config=self.config))
+        os.chmod(self.bin, 0o755)
+
+        with open(self.config, 'w') as fp:
+            fp.write('events {}')
+
+        self.nginx = presets.NGINXDaemon(daemon_bin=self.bin)
+        self.nginx.add_cmd_option('-c', self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def count_calls(self):
+        with open(self.calls) as fp:
+            return len(fp.readlines())
+
+    def test_config_cache(self):
+        self.nginx.test_config()
+        self.nginx.test_config()
+        self.assertEqual(self.count_calls(), 1)
+
+        with open(self.config, 'a') as fp:
+            fp.write('broken')
+
+        self.assertRaises(DaemonError, self.nginx.test_config)
+        self.assertRaises(DaemonError, self.nginx.test_config)
+        self.assertEqual(self.count_calls(), 3)
+
+    def test_config_cache_with_include(self):
+        include = os.path.join(self.tmp, 'upstreams.conf')
+
+        with open(self.config, 'w') as fp:
+            fp.write('events {}\ninclude upstreams.conf;\n')
+        with open(include, 'w') as fp:
+            fp.write('upstream app { server 127.0.0.1:8000; }\n')
+
+        config_hash = self.nginx.config_hash()
+        self.nginx.test_config()
+
+        with open(include, 'a') as fp:
+            fp.write('# changed\n')
+
+        self.assertNotEqual(self.nginx.config_hash(), config_hash)
+        self.nginx.test_config()
+        self.assertEqual(self.count_calls(), 2)
+
+    def test_config_with_cwd_and_env(self):
+        nginx = presets.NGINXDaemon(daemon_bin=self.bin, cwd=self.tmp, env={'NGINX_TEST_VAR': 'test'})
+        nginx.add_cmd_option('-c', 'nginx.conf')
+        nginx.test_config()
+
+        with open(self.calls + '.env') as fp:
+            cwd, value = fp.read().split()
+
+        self.assertEqual(os.path.realpath(cwd), os.path.realpath(self.tmp))
+        self.assertEqual(value, 'test')
+        self.assertNotEqual(nginx.config_hash(), hashlib.sha1().hexdigest())
+
+    def test_start_with_broken_config(self):
+        with open(self.config, 'a') as fp:
+            fp.write('broken')
+
+        self.assertRaises(DaemonError, self.nginx.start)
+        self.assertFalse(self.nginx.started)
+        self.assertFalse(self.nginx.ready)
+
+    def test_listeners(self):
+        include = os.path.join(self.tmp, 'servers.conf')
+
+        with open(self.config, 'w') as fp:
+            fp.write('events {}\nhttp {\n  include servers.conf;\n  server { listen 127.0.0.1:8080; }\n}\n')
+        with open(include, 'w') as fp:
+            fp.write('server {\n  listen [::]:8443 ssl;\n  # listen 9000;\n  listen unix:/tmp/nginx.sock;\n}\n')
+            fp.write('server { listen localhost; }\n')
+
+        self.assertEqual(self.nginx.listeners(), set([8080, 8443, 80, '/tmp/nginx.sock']))
+
+        nginx = presets.NGINXDaemon(daemon_bin=self.bin, listen=[8080])
+        self.assertEqual(nginx.listeners(), set([8080]))
+
+    def test_ready_by_listeners(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+
+        path = os.path.join(self.tmp, 'bound.sock')
+        unix_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix_server.bind(path)
+
+        # test process is master with worker
+        worker = subprocess.Popen(['sleep', '10'])
+        with open(os.path.join(self.tmp, 'nginx.pid'), 'w') as fp:
+            fp.write(str(os.getpid()))
+
+        try:
+            ready = lambda listen: presets.NGINXDaemon(
+                daemon_bin=self.bin, pid_file=os.path.join(self.tmp, 'nginx.pid'), listen=listen,
+            ).ready
+
+            self.assertTrue(ready([port]))
+            self.assertTrue(ready([port, path]))
+            self.assertFalse(ready([port, os.path.join(self.tmp, 'other.sock')]))
+            self.assertFalse(ready([utils.RandomizePort.get()]))
+        finally:
+            worker.kill()
+            worker.wait()
+            server.close()
+            unix_server.close()
+
+    def test_parse_stub_status(self):
+        self.assertEqual(
+            presets.parse_stub_status(STUB_STATUS),
+            {
+                'active': 291,
+                'accepts': 16630948,
+                'handled': 16630948,
+                'requests': 31070465,
+                'reading': 6,
+                'writing': 179,
+                'waiting': 106,
+            },
+        )
+        self.assertRaises(ValueError, presets.parse_stub_status, '')
+
+
+class FakeTarantoolAdmin(object):
+    """
+    Replies to each line like tarantool admin console
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+
+            fp = conn.makefile('rb')
+            for line in fp:
+                self.lines.append(line.strip())
+                if 'fail' in line:
+                    conn.sendall('---\nerror: failed\n...\n')
+                else:
+                    conn.sendall('---\n...\n')
+            fp.close()
+            conn.close()
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+class TestTarantoolDaemon(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.server = FakeTarantoolAdmin()
+        self.fixtures = os.path.join(self.tmp, 'fixtures.lua')
+
+        with open(self.fixtures, 'w') as fp:
+            fp.write('-- fixtures\n')
+            for i in range(1000):
+                fp.write("box.insert(0, {}, 'value')\n".format(i))
+
+        self.tnt = presets.TarantoolDaemon(
+            daemon_bin=LS_BIN,
+            admin_port=self.server.port,
+            pid_file=os.path.join(self.tmp, 'tnt.pid'),
+        )
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.tmp)
+
+    def test_lua_literal(self):
+        self.assertEqual(
+            presets.lua_literal([1, 2.5, 'it\'s', None, True, {'a': 1}]),
+            "{1, 2.5, 'it\\'s', nil, true, {['a'] = 1}}",
+        )
+
+    def test_ready(self):
+        self.assertFalse(self.tnt.ready)
+
+        with open(self.tnt.pid_file.path, 'w') as fp:
+            fp.write('1')
+        self.assertTrue(self.tnt.ready)
+
+        self.tnt.admin_port = utils.RandomizePort.get()
+        self.assertFalse(self.tnt.ready)
+
+    def test_load_fixtures(self):
+        rows, rate = self.tnt.load_fixtures(self.fixtures)
+
+        self.assertEqual(rows, 1000)
+        self.assertGreater(rate, 0)
+        self.assertEqual(self.server.lines[0], "lua box.insert(0, 0, 'value')")
+        self.assertEqual(len(self.server.lines), 1000)
+
+    def test_start_with_fixtures(self):
+        tnt = presets.TarantoolDaemon(
+            cmd_prefix=PYTHON_BIN,
+            daemon_bin=SELF_PATH,
+            admin_port=self.server.port,
+            fixtures=self.fixtures,
+        )
+
+        tnt.start()
+        try:
+            self.assertEqual(len(self.server.lines), 1000)
+        finally:
+            tnt.stop()
+
+    def test_load_fixtures_error(self):
+        with open(self.fixtures, 'a') as fp:
+            fp.write('fail()\n')
+
+        self.assertRaises(presets.DaemonError, self.tnt.load_fixtures, self.fixtures)
+
+
+class TestUWSGIDaemon(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stats = {
+            'workers': [
+                {'id': 1, 'pid': 101, 'requests': 10, 'rss': 1024, 'status': 'idle', 'accepting': 1},
+                {'id': 2, 'pid': 102, 'requests': 5, 'rss': 1024, 'status': 'busy', 'accepting': 1},
+                {'id': 3, 'pid': 0, 'requests': 0, 'rss': 0, 'status': 'cheap', 'accepting': 0},
+            ],
+        }
+        self.pid_file = os.path.join(self.tmp, 'uwsgi.pid')
+        self.uwsgi = presets.UWSGIDaemon(
+            daemon_bin=LS_BIN,
+            pid_file=self.pid_file,
+            stats_socket=os.path.join(self.tmp, 'stats.sock'),
+            master_fifo=os.path.join(self.tmp, 'fifo'),
+        )
+        self.server = FakeUnixServer(self.uwsgi.stats_socket, self.stats)
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.tmp)
+
+    def test_cmd(self):
+        self.assertEqual(self.uwsgi.name, 'uwsgi')
+        self.assertEqual(self.uwsgi.get_cmd_option('--stats'), self.uwsgi.stats_socket)
+        self.assertEqual(self.uwsgi.get_cmd_option('--master-fifo'), self.uwsgi.master_fifo)
+
+    def test_clone(self):
+        copy = self.uwsgi.clone('uwsgi-1')
+
+        self.assertNotEqual(copy.master_fifo, self.uwsgi.master_fifo)
+        self.assertNotEqual(copy.stats_socket, self.uwsgi.stats_socket)
+        self.assertEqual(copy.get_cmd_option('--master-fifo'), copy.master_fifo)
+
+    def test_fifo_is_removed(self):
+        os.mkfifo(self.uwsgi.master_fifo)
+
+        self.uwsgi.stop()
+        self.assertFalse(os.path.exists(self.uwsgi.master_fifo))
+
+    def test_workers(self):
+        workers = self.uwsgi.workers()
+
+        self.assertEqual(len(workers), 3)
+        self.assertEqual([w['id'] for w in self.uwsgi.busy_workers()], [2])
+        self.assertEqual(self.uwsgi.worker_pids(), frozenset([101, 102]))
+
+    def test_wait_reloaded(self):
+        pids = self.uwsgi.worker_pids()
+        self.assertRaises(DaemonError, self.uwsgi.wait_reloaded, pids, timeout=0.1)
+
+        self.stats['workers'][0]['pid'] = 201
+        self.stats['workers'][1]['pid'] = 202
+        self.uwsgi.wait_reloaded(pids, timeout=0.1)
+
+    def test_ready(self):
+        self.assertFalse(self.uwsgi.ready)
+
+        with open(self.pid_file, 'w') as fp:
+            fp.write('1')
+        self.assertTrue(self.uwsgi.ready)
+
+        self.stats['workers'][0]['accepting'] = 0
+        self.assertFalse(self.uwsgi.ready)
+
+    def test_wait_idle(self):
+        self.assertRaises(DaemonError, self.uwsgi.wait_idle, timeout=0.1)
+
+        self.stats['workers'][1]['status'] = 'idle'
+        self.uwsgi.wait_idle(timeout=0.1)
+
+    def test_master_fifo(self):
+        self.assertRaises(DaemonError, self.uwsgi.add_workers)
+
+        os.mkfifo(self.uwsgi.master_fifo)
+        fd = os.open(self.uwsgi.master_fifo, os.O_RDONLY | os.O_NONBLOCK)
+
+        try:
+            self.uwsgi.scale_workers(4)
+            self.uwsgi.scale_workers(1)
+            self.uwsgi.reload()
+            self.assertEqual(os.read(fd, 1024), b'++-r')
+        finally:
+            os.close(fd)
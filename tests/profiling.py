@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+
+from noseapp_daemon import utils
+from noseapp_daemon import artifacts
+from noseapp_daemon import profiling
+from noseapp_daemon import management
+
+from .scope import FakeApp
+from .scope import FakeSuite
+from .daemon import create_fake_daemon
+
+
+# wrapper writes artifact and replaces itself by daemon
+WRAPPER = 'sh -c \'echo wrapped > {dir}/wrapper.txt; exec "$@"\' sh'
+
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.environ[artifacts.ENV_ARTIFACTS_DIR] = self.tmp
+
+    def tearDown(self):
+        del os.environ[artifacts.ENV_ARTIFACTS_DIR]
+        shutil.rmtree(self.tmp)
+
+    def test_test_scope(self):
+        with artifacts.test_scope('tests.TestCase.test'):
+            path = artifacts.make_dir('daemon', 'profile')
+
+        self.assertEqual(artifacts.get_test_id(), artifacts.DEFAULT_TEST_ID)
+        self.assertEqual(os.path.dirname(path), os.path.join(self.tmp, 'tests.TestCase.test'))
+        self.assertNotEqual(artifacts.make_dir('daemon', 'profile'), artifacts.make_dir('daemon', 'profile'))
+
+    def test_install(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon(profiler=profiling.SamplingProfiler()))
+
+        suite = FakeSuite(require=[])
+        m.install(FakeApp([suite]))
+
+        for callback in suite.pre_run:
+            callback(self)
+        self.assertEqual(artifacts.get_test_id(), self.id())
+
+        for callback in suite.post_run:
+            callback(self)
+        self.assertEqual(artifacts.get_test_id(), artifacts.DEFAULT_TEST_ID)
+
+    def test_command_profiler(self):
+        daemon = create_fake_daemon(profiler=profiling.CommandProfiler(WRAPPER))
+
+        daemon.start()
+        artifact_dir = daemon.artifact_dir
+        self.assertTrue(
+            utils.wait_for(lambda: os.path.exists(os.path.join(artifact_dir, 'wrapper.txt')), timeout=2),
+        )
+
+        daemon.stop()
+        self.assertTrue(daemon.stopped)
+        self.assertEqual(os.listdir(artifact_dir), ['wrapper.txt'])
+
+    def test_sampling_profiler(self):
+        daemon = create_fake_daemon(profiler=profiling.SamplingProfiler(interval=0.01, max_samples=5))
+
+        with artifacts.test_scope('test_sampling'):
+            daemon.start()
+            time.sleep(0.1)
+            daemon.stop()
+
+        with open(os.path.join(daemon.artifact_dir, 'samples.csv')) as fp:
+            lines = fp.read().splitlines()
+
+        self.assertIn('test_sampling', daemon.artifact_dir)
+        self.assertEqual(lines[0], 'timestamp,cpu_percent,rss,threads')
+        self.assertEqual(len(lines), 6)
+
+    def test_max_size(self):
+        daemon = create_fake_daemon(profiler=profiling.SamplingProfiler(interval=0.01, max_size=10))
+
+        daemon.start()
+        daemon.stop()
+
+        self.assertEqual(os.listdir(daemon.artifact_dir), [])
+
+    def test_samples_are_truncated(self):
+        daemon = create_fake_daemon(profiler=profiling.SamplingProfiler(interval=0.01, max_size=100))
+
+        daemon.start()
+        time.sleep(0.1)
+        daemon.stop()
+
+        path = os.path.join(daemon.artifact_dir, 'samples.csv')
+        self.assertLessEqual(os.path.getsize(path), 100)
+
+        with open(path) as fp:
+            self.assertGreater(len(fp.read().splitlines()), 1)
+
+    def test_command_prefixes(self):
+        self.assertEqual(
+            profiling.PerfProfiler(frequency=49, max_size=None).command_prefix('/tmp/p'),
+            'perf record -F 49 -g -o /tmp/p/perf.data --',
+        )
+        self.assertIn('--max-size=1K', profiling.PerfProfiler(max_size=1024).command_prefix('/tmp/p'))
+        self.assertIn('-o /tmp/p/profile.json', profiling.PySpyProfiler().command_prefix('/tmp/p'))
+        self.assertIn('--max-snapshots=10', profiling.MassifProfiler(max_snapshots=10).command_prefix('/tmp/p'))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import StringIO
+from unittest import TestCase
+
+from noseapp_daemon import guard
+from noseapp_daemon import utils
+from noseapp_daemon import runner
+from noseapp_daemon import recorder
+from noseapp_daemon import management
+
+from .daemon import create_fake_daemon
+
+
+class TestStartRecorder(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'starts.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_record_starts(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('test'))
+
+        starts = m.record_starts(self.path)
+        starts.watch('test', log_pattern='never')
+
+        daemon = m.daemon('test')
+
+        for _ in range(2):
+            daemon.start()
+            daemon.wait_ready()
+            daemon.stop()
+
+        records = list(recorder.read_records(self.path))
+
+        self.assertEqual(len(records), 2)
+
+        record = records[0]
+        self.assertEqual(record['daemon'], 'test')
+        self.assertEqual(record['cmd'], daemon.get_cmd())
+        self.assertEqual(record['env'], recorder.env_digest())
+
+        # marker of other run does not change digest
+        env = dict(os.environ, PWD='/other')
+        env[guard.ENV_MARKER] = '1-0'
+        self.assertEqual(recorder.env_digest(env), record['env'])
+        self.assertNotEqual(recorder.env_digest(dict(env, LANG='C.other')), record['env'])
+        self.assertIsNone(record['exit_code'])
+        self.assertNotIn('log_line', record)
+        self.assertLessEqual(record['launched'], record['ready'])
+        self.assertLessEqual(record['ready'], record['stopped'])
+        self.assertGreater(record['resources']['rss'], 0)
+
+    def test_unfinished_starts(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('alive'))
+        m.add_daemon(runner.DaemonRunner('crash', cmd_prefix='sh -c', daemon_bin=utils.which('false')))
+
+        starts = m.record_starts(self.path)
+
+        crashed = m.daemon('crash')
+        crashed.start()
+        crashed.wait(timeout=5)
+        crashed.exit_future.wait_callbacks(timeout=5)
+
+        # crash is written without stop
+        records = list(recorder.read_records(self.path))
+        self.assertEqual([(r['daemon'], r['exit_code']) for r in records], [('crash', 1)])
+        self.assertIn('crashed', records[0])
+
+        alive = m.daemon('alive')
+        alive.start()
+        try:
+            alive.wait_ready()
+            starts.flush()
+        finally:
+            alive.stop()
+            crashed.stop()
+
+        records = list(recorder.read_records(self.path))
+        self.assertEqual([r['daemon'] for r in records], ['crash', 'alive'])
+        self.assertTrue(records[1]['interrupted'])
+        self.assertIn('ready', records[1])
+
+    def test_incomplete_line(self):
+        with open(self.path, 'w') as fp:
+            fp.write('{"daemon":"a","ready":1.0}\n{"daemon":"b","re')
+
+        self.assertEqual([r['daemon'] for r in recorder.read_records(self.path)], ['a'])
+
+    def test_summarize_and_outliers(self):
+        records = [{'daemon': 'a', 'ready': 0.1 + i * 0.001, 'timestamp': i} for i in range(100)]
+        records.append({'daemon': 'a', 'ready': 5.0, 'timestamp': 100})
+        records.append({'daemon': 'b', 'ready': 1.0, 'timestamp': 0})
+
+        summary = recorder.summarize(records)
+        self.assertEqual(summary['a']['count'], 101)
+        self.assertEqual(summary['a']['max'], 5.0)
+        self.assertEqual(summary['b']['p50'], 1.0)
+
+        found = recorder.outliers(records)
+        self.assertEqual([r['ready'] for r in found], [5.0])
+
+    def test_query_tool(self):
+        recorder.StartRecorder(self.path).write({'daemon': 'a', 'ready': 0.5, 'timestamp': 0})
+
+        out = StringIO.StringIO()
+        stdout, recorder.sys.stdout = recorder.sys.stdout, out
+        try:
+            recorder.main([self.path])
+        finally:
+            recorder.sys.stdout = stdout
+
+        self.assertIn('0.500', out.getvalue())
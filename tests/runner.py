@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import os
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import subprocess
 from unittest import TestCase
 
+from noseapp_daemon import guard
 from noseapp_daemon import utils
+from noseapp_daemon import reaper
 from noseapp_daemon import runner
 
 from .daemon import create_fake_daemon
@@ -139,3 +149,216 @@ class TestDaemonRunner(TestCase):
             options=dict(),
         )
         self.assertIsInstance(daemon.options, dict)
+
+    def test_stop_process_group(self):
+        daemon = create_fake_daemon()
+
+        daemon.start()
+        process = daemon.process
+        daemon.stop()
+
+        self.assertFalse(process.is_running())
+        self.assertFalse(utils.process_group_exists(process.pid))
+
+    def test_wait_ready(self):
+        daemon = create_fake_daemon()
+
+        self.assertRaises(runner.DaemonError, daemon.wait_ready, timeout=0.1)
+
+        daemon.start()
+        try:
+            daemon.wait_ready(timeout=0.1)
+            self.assertTrue(daemon.ready)
+        finally:
+            daemon.stop()
+
+    def test_cmd_args_replace_option(self):
+        cmd_args = runner.CmdArgs()
+        cmd_args.add_option('--port', 1)
+        cmd_args.add_option('--debug')
+        cmd_args.add_option('--port', 2)
+
+        self.assertEqual(cmd_args.to_string(), '--port=2 --debug')
+
+    def test_compact_state(self):
+        daemon = create_fake_daemon()
+        other = create_fake_daemon()
+
+        self.assertFalse(hasattr(daemon, '__dict__'))
+        self.assertFalse(hasattr(daemon.cmd_args, '__dict__'))
+        self.assertFalse(hasattr(daemon.pid_file, '__dict__'))
+        self.assertIs(daemon.plugin, other.plugin)
+
+    def test_spawn_launcher(self):
+        daemon = create_fake_daemon(launcher=runner.LAUNCHER_SPAWN)
+
+        daemon.start()
+        try:
+            self.assertTrue(daemon.started)
+            self.assertFalse(daemon.is_dead)
+            self.assertEqual(daemon.process.cmdline(), daemon.get_cmd().split())
+            self.assertEqual(os.getpgid(daemon.process.pid), daemon.process.pid)
+        finally:
+            daemon.stop()
+
+        self.assertTrue(daemon.stopped)
+
+    def test_spawn_options(self):
+        tmp = tempfile.mkdtemp()
+        output = os.path.join(tmp, 'output')
+
+        try:
+            with open(output, 'w') as fp:
+                process = utils.spawn(
+                    ['sh', '-c', 'echo $SPAWN_TEST; echo err >&2'],
+                    stdout=fp,
+                    stderr=subprocess.STDOUT,
+                    preexec_fn=lambda: os.environ.update(SPAWN_TEST='out'),
+                )
+                process.wait()
+
+            with open(output) as fp:
+                self.assertEqual(fp.read(), 'out\nerr\n')
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_unknown_launcher(self):
+        daemon = create_fake_daemon(launcher='unknown')
+        self.assertRaises(runner.DaemonError, daemon.start)
+
+    def test_cwd_and_env(self):
+        cwd = os.getcwd()
+        daemon = create_fake_daemon(
+            temp_workdir=True,
+            env={'DAEMON_TEST_VAR': 1, 'HOME': None},
+        )
+
+        daemon.start()
+        try:
+            workdir = daemon.workdir
+            self.assertTrue(os.path.isdir(workdir))
+            self.assertIn(workdir, runner.TEMP_WORKDIRS)
+            self.assertEqual(daemon.working_dir, workdir)
+            self.assertEqual(os.path.realpath(daemon.process.cwd()), os.path.realpath(workdir))
+
+            environ = guard.read_environ(daemon.process.pid)
+            self.assertEqual(environ['DAEMON_TEST_VAR'], '1')
+            self.assertNotIn('HOME', environ)
+
+            # data of daemon is kept by restart
+            daemon.restart()
+            self.assertEqual(daemon.workdir, workdir)
+        finally:
+            daemon.stop()
+
+        self.assertTrue(os.path.isdir(workdir))
+
+        daemon.cleanup()
+        self.assertFalse(os.path.exists(workdir))
+        self.assertNotIn(workdir, runner.TEMP_WORKDIRS)
+        self.assertIsNone(daemon.workdir)
+        self.assertEqual(os.getcwd(), cwd)
+
+    def test_wait_not_started(self):
+        self.assertRaises(runner.DaemonError, create_fake_daemon().wait)
+
+    def test_wait_exit_code(self):
+        tmp = tempfile.mkdtemp()
+        script = os.path.join(tmp, 'one_shot.sh')
+        with open(script, 'w') as fp:
+            fp.write('exit 3\n')
+
+        daemon = runner.DaemonRunner('one_shot', cmd_prefix='sh', daemon_bin=script)
+        try:
+            daemon.start()
+            called = []
+            daemon.exit_future.add_done_callback(called.append)
+
+            status = daemon.wait(timeout=5)
+            self.assertEqual(status.exit_code, 3)
+            self.assertIsNone(status.signal)
+            self.assertGreater(status.rusage.ru_maxrss, 0)
+            self.assertEqual(called, [daemon.exit_future])
+            self.assertTrue(daemon.is_dead)
+            self.assertEqual(daemon.exit_code(), 3)
+        finally:
+            daemon.stop()
+            shutil.rmtree(tmp)
+
+    def test_stop_is_reaped(self):
+        daemon = create_fake_daemon()
+        daemon.start()
+        future = daemon.exit_future
+        daemon.stop()
+
+        # exit status is not taken by other waiter
+        status = future.result(timeout=0)
+        self.assertIsNotNone(status)
+        self.assertIsNotNone(status.returncode)
+        self.assertIsNotNone(status.rusage)
+
+    def test_wait_callbacks(self):
+        future = reaper.ExitFuture(1)
+        called = []
+
+        def callback(f):
+            time.sleep(0.1)
+            called.append(f.wait_callbacks(timeout=0))
+
+        future.add_done_callback(callback)
+        self.assertFalse(future.wait_callbacks(timeout=0))
+
+        thread = threading.Thread(target=future.set_result, args=(reaper.ExitStatus(1),))
+        thread.start()
+
+        self.assertTrue(future.wait_callbacks(timeout=5))
+        # callback does not wait for itself
+        self.assertEqual(called, [False])
+        thread.join()
+
+    def test_wait_signal(self):
+        daemon = create_fake_daemon()
+        daemon.start()
+        try:
+            self.assertRaises(runner.DaemonError, daemon.wait, timeout=0.1)
+
+            os.kill(daemon.process.pid, signal.SIGKILL)
+            status = daemon.wait(timeout=5)
+
+            self.assertIsNone(status.exit_code)
+            self.assertEqual(status.signal, signal.SIGKILL)
+            self.assertEqual(status.signal_name, 'SIGKILL')
+            self.assertEqual(daemon.exit_code(), -signal.SIGKILL)
+        finally:
+            daemon.stop()
+
+    def test_unix_sockets(self):
+        daemon = create_fake_daemon('sockets')
+        path = daemon.allocate_socket('--socket')
+
+        self.assertEqual(daemon.get_cmd_option('--socket'), path)
+        self.assertTrue(path.startswith(utils.socket_dir()))
+        self.assertTrue(utils.unix_socket_is_free(path))
+
+        copy = daemon.clone('sockets_copy')
+        self.assertNotEqual(copy.sockets, daemon.sockets)
+        self.assertEqual(copy.get_cmd_option('--socket'), copy.sockets[0])
+
+        # stale socket of crashed run
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+
+        daemon.start()
+        try:
+            self.assertFalse(os.path.exists(path))
+
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(1)
+            self.assertFalse(utils.unix_socket_is_free(path))
+            server.close()
+        finally:
+            daemon.stop()
+
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import signal
+import tempfile
+import threading
+from unittest import TestCase
+
+from noseapp_daemon import scope
+from noseapp_daemon import runner
+from noseapp_daemon import presets
+from noseapp_daemon import management
+
+from .daemon import SELF_PATH
+from .daemon import PYTHON_BIN
+from .daemon import create_fake_daemon
+
+
+class StateDaemon(presets.PresetDaemon):
+
+    DEFAULT_NAME = 'state'
+    DAEMON_BIN = SELF_PATH
+    CMD_PREFIX = PYTHON_BIN
+    STATE_PATHS = ('*.state',)
+
+
+class FakePostgresDaemon(presets.PostgresDaemon):
+
+    DAEMON_BIN = SELF_PATH
+    CMD_PREFIX = PYTHON_BIN
+    # stop signal is received by daemon instead of shell
+    LAUNCHER = runner.LAUNCHER_SPAWN
+
+    def ready_probe(self):
+        return None
+
+
+class ReloadDaemon(presets.PresetDaemon):
+    """
+    Workers are replaced after reload asynchronously
+    """
+
+    DEFAULT_NAME = 'reload'
+    DAEMON_BIN = SELF_PATH
+    CMD_PREFIX = PYTHON_BIN
+    RESET_STRATEGY = scope.RESET_RELOAD
+
+    generation = 1
+
+    def worker_pids(self):
+        return frozenset([self.generation])
+
+    def reload(self):
+        timer = threading.Timer(0.2, setattr, args=(self, 'generation', self.generation + 1))
+        timer.start()
+
+
+class FakeSuite(object):
+
+    def __init__(self, require):
+        self.require = require
+        self.pre_run = []
+        self.post_run = []
+        self.teardown = []
+
+    def add_pre_run(self, func):
+        self.pre_run.append(func)
+
+    def add_post_run(self, func):
+        self.post_run.append(func)
+
+    def add_teardown(self, func):
+        self.teardown.append(func)
+
+    def run_test(self):
+        for callback in self.post_run:
+            callback(None)
+
+    def finish(self):
+        for callback in self.teardown:
+            callback()
+
+
+class FakeApp(object):
+
+    def __init__(self, suites):
+        self.suites = suites
+        self.setup = []
+        self.teardown = []
+        self.extensions = []
+
+    def add_setup(self, func):
+        self.setup.append(func)
+
+    def add_teardown(self, func):
+        self.teardown.append(func)
+
+    def shared_extension(self, **kwargs):
+        self.extensions.append(kwargs['name'])
+
+
+def read(path):
+    with open(path) as fp:
+        return fp.read()
+
+
+def write(path, data):
+    with open(path, 'w') as fp:
+        fp.write(data)
+
+
+class TestScopes(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_reset_strategy(self):
+        self.assertEqual(scope.reset_strategy(presets.RedisDaemon), scope.RESET_RESTORE)
+        self.assertEqual(scope.reset_strategy(presets.TarantoolDaemon), scope.RESET_RESTORE)
+        self.assertEqual(scope.reset_strategy(presets.NGINXDaemon), scope.RESET_RELOAD)
+        self.assertEqual(scope.reset_strategy(presets.UWSGIDaemon), scope.RESET_RELOAD)
+        self.assertEqual(scope.reset_strategy(presets.MemcachedDaemon), scope.RESET_RESTART)
+        self.assertEqual(scope.reset_strategy(presets.PostgresDaemon), scope.RESET_RESTORE)
+        self.assertEqual(scope.reset_strategy(create_fake_daemon()), scope.RESET_RESTART)
+
+        self.assertRaises(ValueError, scope.ScopedDaemon, create_fake_daemon(), 'module')
+        self.assertRaises(
+            ValueError, scope.ScopedDaemon, create_fake_daemon(), scope.TEST, scope.RESET_RESTORE,
+        )
+
+    def test_restore(self):
+        daemon = StateDaemon(cwd=self.tmp)
+        scoped = scope.ScopedDaemon(daemon, scope.TEST)
+        self.assertEqual(scoped.strategy, scope.RESET_RESTORE)
+
+        # fixtures
+        write(os.path.join(self.tmp, 'a.state'), 'fixtures')
+
+        scoped.setup()
+        try:
+            pid = daemon.process.pid
+
+            write(os.path.join(self.tmp, 'a.state'), 'changed')
+            write(os.path.join(self.tmp, 'b.state'), 'new')
+
+            scoped.reset()
+
+            self.assertNotEqual(daemon.process.pid, pid)
+            self.assertEqual(read(os.path.join(self.tmp, 'a.state')), 'fixtures')
+            self.assertFalse(os.path.exists(os.path.join(self.tmp, 'b.state')))
+            self.assertEqual(scoped.resets, 1)
+        finally:
+            scoped.teardown()
+
+        self.assertTrue(daemon.stopped)
+        self.assertIsNone(scoped.snapshot_dir)
+
+    def test_restore_data_dir(self):
+        data_dir = os.path.join(self.tmp, 'data')
+        os.mkdir(data_dir, 0o700)
+        write(os.path.join(data_dir, 'a'), 'fixtures')
+
+        daemon = FakePostgresDaemon()
+        daemon.add_cmd_option('-D', data_dir)
+        scoped = scope.ScopedDaemon(daemon, scope.TEST)
+
+        scoped.setup()
+        try:
+            pid = daemon.process.pid
+
+            write(os.path.join(data_dir, 'a'), 'changed')
+            write(os.path.join(data_dir, 'b'), 'new')
+
+            scoped.reset()
+
+            self.assertNotEqual(daemon.process.pid, pid)
+            self.assertEqual(read(os.path.join(data_dir, 'a')), 'fixtures')
+            self.assertFalse(os.path.exists(os.path.join(data_dir, 'b')))
+            self.assertEqual(os.stat(data_dir).st_mode & 0o777, 0o700)
+        finally:
+            scoped.teardown()
+
+        self.assertRaises(presets.DaemonError, FakePostgresDaemon().save_state, self.tmp)
+
+    def test_reload(self):
+        daemon = ReloadDaemon()
+        scoped = scope.ScopedDaemon(daemon, scope.TEST)
+
+        scoped.setup()
+        try:
+            pid = daemon.process.pid
+            scoped.reset()
+
+            # reset is returned after workers are replaced
+            self.assertEqual(daemon.generation, 2)
+            self.assertEqual(daemon.process.pid, pid)
+
+            self.assertRaises(presets.DaemonError, daemon.wait_reloaded, daemon.worker_pids(), timeout=0.1)
+        finally:
+            scoped.teardown()
+
+    def test_reset_none(self):
+        daemon = create_fake_daemon('stateless')
+        scoped = scope.ScopedDaemon(daemon, scope.TEST, strategy=scope.RESET_NONE)
+
+        scoped.setup()
+        try:
+            pid = daemon.process.pid
+            scoped.reset()
+            self.assertEqual(daemon.process.pid, pid)
+
+            # crashed daemon is started again
+            os.kill(pid, signal.SIGKILL)
+            daemon.wait(timeout=5)
+
+            scoped.reset()
+            self.assertNotEqual(daemon.process.pid, pid)
+            self.assertFalse(daemon.is_dead)
+        finally:
+            scoped.teardown()
+
+    def test_install(self):
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('session'), scope=scope.SESSION)
+        m.add_daemon(create_fake_daemon('per_suite'), scope=scope.SUITE)
+        m.add_daemon(create_fake_daemon('per_test'), scope=scope.TEST)
+        m.add_daemon(create_fake_daemon('other'), scope=scope.TEST)
+        m.add_daemon(create_fake_daemon('unscoped'))
+
+        self.assertEqual(
+            [d.name for d in m.select_daemons('scope=test')], ['per_test', 'other'],
+        )
+
+        suite = FakeSuite(require=['session', 'per_suite', 'per_test'])
+        app = FakeApp([suite])
+        m.install(app)
+
+        self.assertEqual(len(app.extensions), 5)
+
+        for callback in app.setup:
+            callback()
+
+        try:
+            self.assertTrue(all(s.daemon.started for s in m.scopes.daemons))
+            self.assertTrue(m.daemon('unscoped').stopped)
+
+            pids = dict((s.name, s.daemon.process.pid) for s in m.scopes.daemons)
+            changed = lambda: set(
+                s.name for s in m.scopes.daemons if s.daemon.process.pid != pids[s.name]
+            )
+
+            suite.run_test()
+            self.assertEqual(changed(), set(['per_test']))
+
+            suite.finish()
+            self.assertEqual(changed(), set(['per_test', 'per_suite']))
+            self.assertEqual(m.scopes.get('per_test').resets, 1)
+        finally:
+            for callback in app.teardown:
+                callback()
+
+        self.assertTrue(all(s.daemon.stopped for s in m.scopes.daemons))
+
+        m.remove_daemon('other')
+        self.assertIsNone(m.scopes.get('other'))
+        self.assertRaises(management.DaemonNotFound, m.checkpoint, 'unscoped')
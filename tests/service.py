@@ -3,8 +3,33 @@
 from unittest import TestCase
 
 from noseapp_daemon import runner
+from noseapp_daemon import service
 
 from .daemon import TestService
+from .daemon import create_fake_daemon
+
+
+class FailedPlugin(runner.DaemonPlugin):
+
+    def before_start(self, daemon):
+        raise runner.DaemonError('start error')
+
+
+class FailedStopPlugin(runner.DaemonPlugin):
+
+    def before_stop(self, daemon):
+        raise KeyError('stop error')
+
+
+class CompositeTestService(service.CompositeService):
+
+    name = 'composite'
+
+    def setup(self):
+        self.add_member(create_fake_daemon('storage'))
+        self.add_member(create_fake_daemon('app_1'), requires=['storage'])
+        self.add_member(create_fake_daemon('app_2'), requires=['storage'])
+        self.add_member(create_fake_daemon('proxy'), requires=['app_1', 'app_2'])
 
 
 class TestDaemonService(TestCase):
@@ -29,3 +54,66 @@ class TestDaemonService(TestCase):
     def test_init_options(self):
         service = TestService(options=dict())
         self.assertIsInstance(service.options, dict)
+
+
+class TestCompositeService(TestCase):
+
+    def test_dependency_levels(self):
+        levels = service.dependency_levels([
+            ('proxy', ('app',)),
+            ('app', ('storage',)),
+            ('storage', ()),
+            ('cache', ()),
+        ])
+        self.assertEqual(levels, [['storage', 'cache'], ['app'], ['proxy']])
+
+        self.assertRaises(ValueError, service.dependency_levels, [('a', ('b',)), ('b', ('a',))])
+        self.assertRaises(ValueError, service.dependency_levels, [('a', ('b',))])
+
+    def test_start_stop(self):
+        composite = CompositeTestService()
+        self.assertEqual(
+            [[d.name for d in level] for level in composite.levels],
+            [['storage'], ['app_1', 'app_2'], ['proxy']],
+        )
+
+        composite.start()
+        try:
+            self.assertTrue(all(d.started for d in composite.members))
+        finally:
+            composite.stop()
+
+        self.assertTrue(all(d.stopped for d in composite.members))
+
+    def test_rollback(self):
+        composite = CompositeTestService()
+        composite.member('app_2').plugin = FailedPlugin()
+
+        self.assertRaises(runner.DaemonError, composite.start)
+        self.assertTrue(all(d.stopped for d in composite.members))
+
+    def test_rollback_error(self):
+        composite = CompositeTestService()
+        composite.member('app_2').plugin = FailedPlugin()
+        composite.member('storage').plugin = FailedStopPlugin()
+
+        try:
+            # start error is raised, not rollback error
+            self.assertRaises(runner.DaemonError, composite.start)
+        finally:
+            composite.member('storage').plugin = runner.DaemonPlugin()
+            composite.stop()
+
+    def test_rolling_restart(self):
+        composite = CompositeTestService()
+        composite.start()
+        try:
+            pids = [d.process.pid for d in composite.members]
+            composite.rolling_restart()
+
+            self.assertTrue(all(d.started for d in composite.members))
+            self.assertTrue(all(
+                d.process.pid != pid for d, pid in zip(composite.members, pids)
+            ))
+        finally:
+            composite.stop()
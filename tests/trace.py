@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import signal
+import tempfile
+from unittest import TestCase
+
+from noseapp_daemon import trace
+from noseapp_daemon import management
+
+from .daemon import TestService
+from .daemon import create_fake_daemon
+
+
+class TestTracer(TestCase):
+
+    def tearDown(self):
+        trace.disable()
+
+    def test_null_span(self):
+        self.assertIsNone(trace.active_tracer)
+        self.assertIs(trace.span('start', 'test'), trace.NULL_SPAN)
+
+        with trace.span('start', 'test'):
+            pass
+
+    def test_chrome_trace(self):
+        tracer = trace.enable()
+
+        m = management.DaemonManagement()
+        m.add_daemon(create_fake_daemon('daemon_1'))
+        m.add_daemon(create_fake_daemon('daemon_2'))
+        m.add_service(TestService())
+
+        m.start_all()
+        m.stop_all()
+
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'trace.json')
+            tracer.dump(path)
+
+            with open(path) as fp:
+                data = json.load(fp)
+        finally:
+            shutil.rmtree(tmp)
+
+        tracks = dict(
+            (e['args']['name'], e['tid']) for e in data['traceEvents'] if e['ph'] == 'M'
+        )
+        self.assertEqual(
+            set(tracks),
+            set([management.MANAGEMENT_TRACK, 'daemon_1', 'daemon_2', TestService.name, 'test']),
+        )
+
+        spans = [(e['tid'], e['name']) for e in data['traceEvents'] if e['ph'] == 'X']
+        self.assertIn((tracks['daemon_1'], 'start'), spans)
+        self.assertIn((tracks['daemon_1'], 'launch'), spans)
+        self.assertIn((tracks['daemon_2'], 'terminate'), spans)
+        self.assertIn((tracks[management.MANAGEMENT_TRACK], 'start_daemons'), spans)
+        self.assertIn((tracks[TestService.name], 'start'), spans)
+
+    def test_crash_instant(self):
+        tracer = trace.enable()
+
+        daemon = create_fake_daemon('test')
+        daemon.start()
+        try:
+            os.kill(daemon.process.pid, signal.SIGKILL)
+            daemon.wait(timeout=5)
+            daemon.exit_future.wait_callbacks(timeout=5)
+        finally:
+            daemon.stop()
+
+        instants = [e for e in tracer.to_chrome()['traceEvents'] if e['ph'] == 'i']
+        self.assertEqual([e['name'] for e in instants], ['crashed'])
+        self.assertEqual(instants[0]['args'], {'exit_code': -signal.SIGKILL})
+
+    def test_span_error(self):
+        tracer = trace.Tracer()
+
+        try:
+            with tracer.span('start', 'test'):
+                raise ValueError('error')
+        except ValueError:
+            pass
+
+        event = tracer.to_chrome()['traceEvents'][-1]
+        self.assertEqual(event['args'], {'error': "ValueError('error',)"})